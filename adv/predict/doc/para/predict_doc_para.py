@@ -19,6 +19,7 @@ from parallel.parallelMT import DataParallelMT
 from utils.base import *
 from utils.fmt.base import ldvocab, reverse_dict, eos_id
 from utils.fmt.base4torch import parse_cuda_decode
+from utils.fmt.doc.para.single import get_batch_keys
 
 def load_fixing(module):
 
@@ -27,7 +28,7 @@ def load_fixing(module):
 
 td = h5py.File(cnfg.test_data, "r")
 
-tl = [(str(nsent), str(_curd),) for nsent, ndata in zip(td["nsent"][:].tolist(), td["ndata"][:].tolist()) for _curd in range(ndata)]
+tl = get_batch_keys(td)
 nwordi = td["nword"][:].tolist()[0]
 vcbt, nwordt = ldvocab(sys.argv[2])
 vcbt = reverse_dict(vcbt)
@@ -72,6 +73,8 @@ ens = "\n".encode("utf-8")
 ens_skip = "\n".encode("utf-8")#.join(["\n" for i in range(num_prev_sent)])
 
 src_grp = td["src"]
+# documents padded with placeholder sentences (utils/fmt/doc/para/single.py), translations of placeholders are dropped
+nsents_grp = td["nsents"] if "nsents" in td else None
 with open(sys.argv[1], "wb") as f:
 	with torch.no_grad():
 		for nsent, i_d in tqdm(tl):
@@ -89,9 +92,9 @@ with open(sys.argv[1], "wb") as f:
 				output = tmp
 			else:
 				output = output.tolist()
-			for doc in output:
+			for doc, _ns in zip(output, [_nsent for i in range(bsize)] if nsents_grp is None else nsents_grp[nsent][i_d][:].tolist()):
 				f.write(ens_skip)
-				for tran in doc:
+				for tran in doc[:_ns - 1]:
 					tmp = []
 					for tmpu in tran:
 						if tmpu == eos_id:
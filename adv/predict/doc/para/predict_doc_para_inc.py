@@ -0,0 +1,71 @@
+#encoding: utf-8
+
+# usage: python predict_doc_para_inc.py $rsf $src.bpe $src.vcb $tgt.vcb $model
+# streaming document translation (transformer/Doc/Para/Base/Incremental.py): sentences of $src.bpe (one sentence per line, documents separated by empty lines, "-" to read from stdin) are translated one after another as they arrive, with context encodings of previous sentences cached, translations are written and flushed in the same layout.
+
+import sys
+
+import torch
+from torch.cuda.amp import autocast
+
+import cnfg.docpara as cnfg
+from cnfg.ihyp import *
+
+from transformer.Doc.Para.Base.NMT import NMT
+from transformer.Doc.Para.Base.Incremental import IncrementalDecoder
+
+from utils.base import *
+from utils.fmt.base import ldvocab, reverse_dict, eos_id, clean_list, map_batch
+from utils.fmt.base4torch import parse_cuda_decode
+
+def load_fixing(module):
+
+	if "fix_load" in dir(module):
+		module.fix_load()
+
+vcbi, nwordi = ldvocab(sys.argv[3])
+vcbt, nwordt = ldvocab(sys.argv[4])
+vcbt = reverse_dict(vcbt)
+
+mymodel = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes, cnfg.num_prev_sent, cnfg.num_layer_context)
+
+mymodel = load_model_cpu(sys.argv[5], mymodel)
+mymodel.apply(load_fixing)
+
+mymodel.eval()
+
+# incremental decoding translates one sentence of a document at a time on one device
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, False)
+use_amp = cnfg.use_amp and use_cuda
+
+set_random_seed(cnfg.seed, use_cuda)
+
+if use_cuda:
+	mymodel.to(cuda_device)
+
+decoder = IncrementalDecoder(mymodel, cnfg.beam_size, None, cnfg.length_penalty)
+
+ens = "\n".encode("utf-8")
+
+with (sys.stdin.buffer if sys.argv[2] == "-" else open(sys.argv[2], "rb")) as frd, open(sys.argv[1], "wb") as f:
+	with torch.no_grad():
+		for line in frd:
+			tmp = line.strip()
+			if tmp:
+				seq_batch = torch.as_tensor([map_batch(clean_list(tmp.decode("utf-8").split()), vcbi)[0]], dtype=torch.long)
+				if use_cuda:
+					seq_batch = seq_batch.to(cuda_device)
+				with autocast(enabled=use_amp):
+					output = decoder(seq_batch)
+				tmp = []
+				for tmpu in output[0].tolist():
+					if tmpu == eos_id:
+						break
+					else:
+						tmp.append(vcbt[tmpu])
+				f.write(" ".join(tmp).encode("utf-8"))
+			# an empty line ends the document
+			elif decoder.pos > 0:
+				decoder.reset()
+			f.write(ens)
+			f.flush()
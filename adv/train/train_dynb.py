@@ -9,6 +9,8 @@ from torch import optim
 
 from parallel.base import DataParallelCriterion
 from parallel.parallelMT import DataParallelMT
+from parallel.dist import DistributedModel, init_dist, close_dist, is_dist, is_master, get_local_rank, shard_data, all_reduce_values, broadcast_values
+from optm.zero import ShardedOptimizer, h5save_optm, h5load_optm
 
 from utils.base import *
 from utils.init import init_model_params
@@ -67,6 +69,9 @@ def train(td, tl, ed, nd, optm, lrsch, model, lossf, mv_device, logger, done_tok
 
 		oi = seq_o.narrow(1, 0, lo)
 		ot = seq_o.narrow(1, 1, lo).contiguous()
+		wd_add = ot.ne(pad_id).int().sum().item()
+		if is_dist():
+			wd_add = int(all_reduce_values(wd_add, device=mv_device)[0])
 		with autocast(enabled=_use_amp):
 			output = model(seq_batch, oi)
 			loss = lossf(output, ot)
@@ -79,7 +84,8 @@ def train(td, tl, ed, nd, optm, lrsch, model, lossf, mv_device, logger, done_tok
 		else:
 			scaler.scale(loss).backward()
 
-		wd_add = ot.ne(pad_id).int().sum().item()
+		if is_dist():
+			loss_add = all_reduce_values(loss_add, device=mv_device)[0]
 		loss = output = oi = ot = seq_batch = seq_o = None
 		sum_loss += loss_add
 		if save_loss:
@@ -87,14 +93,18 @@ def train(td, tl, ed, nd, optm, lrsch, model, lossf, mv_device, logger, done_tok
 		sum_wd += wd_add
 		_done_tokens += wd_add
 
-		_perform_dyn_optm_step, _cos_sim = grad_mon.update(model.module if multi_gpu else model)
+		_perform_dyn_optm_step, _cos_sim = grad_mon.update(model.module if multi_gpu or is_dist() else model)
+		if is_dist():
+			# the gradient monitor only sees local gradients, all processes follow the decision of the first one
+			_perform_dyn_optm_step, _cos_sim = broadcast_values(_perform_dyn_optm_step, float("nan") if _cos_sim is None else _cos_sim, device=mv_device)
+			_perform_dyn_optm_step, _cos_sim = _perform_dyn_optm_step > 0.0, (None if _cos_sim != _cos_sim else _cos_sim)
 
 		if _perform_dyn_optm_step or (_done_tokens >= tokens_optm):
 			if not _perform_dyn_optm_step:
 				grad_mon.reset()
 			_do_optm_step = True if _cos_sim is None else (_cos_sim <= update_angle)
 			if _do_optm_step:
-				if multi_gpu:
+				if multi_gpu or is_dist():
 					model.collect_gradients()
 				optm_step(optm, scaler)
 				optm.zero_grad()
@@ -118,9 +128,10 @@ def train(td, tl, ed, nd, optm, lrsch, model, lossf, mv_device, logger, done_tok
 					else:
 						_chkpf = chkpf
 						_chkpof = chkpof
-					save_model(model, _chkpf, multi_gpu, logger)
+					if is_master():
+						save_model(model, _chkpf, multi_gpu, logger)
 					if chkpof is not None:
-						h5save(optm.state_dict(), _chkpof)
+						h5save_optm(optm, _chkpof)
 					if statesf is not None:
 						save_states(statesf, tl[cur_b - 1:])
 				if _do_optm_step:
@@ -152,9 +163,10 @@ def train(td, tl, ed, nd, optm, lrsch, model, lossf, mv_device, logger, done_tok
 			else:
 				_chkpf = chkpf
 				_chkpof = chkpof
-			save_model(model, _chkpf, multi_gpu, logger)
+			if is_master():
+				save_model(model, _chkpf, multi_gpu, logger)
 			if chkpof is not None:
-				h5save(optm.state_dict(), _chkpof)
+				h5save_optm(optm, _chkpof)
 			if statesf is not None:
 				save_states(statesf, tl[cur_b - 1:])
 		cur_b += 1
@@ -169,7 +181,7 @@ def eva(ed, nd, model, lossf, mv_device, multi_gpu, use_amp=False):
 	model.eval()
 	src_grp, tgt_grp = ed["src"], ed["tgt"]
 	with torch.no_grad():
-		for i in tqdm(range(nd)):
+		for i in tqdm(shard_data(range(nd), False)):
 			bid = str(i)
 			seq_batch = torch.from_numpy(src_grp[bid][:]).long()
 			seq_o = torch.from_numpy(tgt_grp[bid][:]).long()
@@ -192,6 +204,8 @@ def eva(ed, nd, model, lossf, mv_device, multi_gpu, use_amp=False):
 			w += data_mask.int().sum().item()
 			r += correct.sum().item()
 			correct = data_mask = trans = loss = output = ot = seq_batch = seq_o = None
+	if is_dist():
+		sum_loss, w, r = all_reduce_values(sum_loss, w, r, device=mv_device)
 	w = float(w)
 	return sum_loss / w, (w - r) / w * 100.0
 
@@ -227,8 +241,11 @@ epoch_save = cnfg.epoch_save
 remain_steps = cnfg.training_steps
 
 wkdir = "".join(("expm/", cnfg.data_id, "/", cnfg.group_id, "/", rid, "/"))
+dist_rank, dist_world_size = init_dist(cnfg.dist_backend)
+dist_training = cnfg.dist_backend is not None
+
 if not p_check(wkdir):
-	makedirs(wkdir)
+	makedirs(wkdir, exist_ok=True)
 
 chkpf = None
 chkpof = None
@@ -240,9 +257,18 @@ if save_every is not None:
 	if cnfg.save_train_state:
 		statesf = wkdir + "checkpoint.states"
 
-logger = get_logger(wkdir + "train.log")
+# training states are not saved in distributed training as each process only holds its own shard of the remaining batches
+if dist_training:
+	statesf = None
+
+logger = get_logger(wkdir + ("train.log" if is_master() else ("train.%d.log" % dist_rank)))
 
 use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda(cnfg.use_cuda, cnfg.gpuid)
+if dist_training:
+	multi_gpu = False
+	if use_cuda:
+		cuda_device = torch.device("cuda", get_local_rank())
+		torch.cuda.set_device(cuda_device)
 
 set_random_seed(cnfg.seed, use_cuda)
 
@@ -280,20 +306,30 @@ if use_cuda:
 	mymodel.to(cuda_device)
 	lossf.to(cuda_device)
 
-optimizer = optim.Adam(mymodel.parameters(), lr=init_lr, betas=adam_betas_default, eps=ieps_adam_default, weight_decay=cnfg.weight_decay, amsgrad=use_ams)
+if dist_training and cnfg.zero_optimizer:
+	optimizer = ShardedOptimizer(mymodel.parameters(), optim.Adam, gather_state=cnfg.zero_gather_state, lr=init_lr, betas=adam_betas_default, eps=ieps_adam_default, weight_decay=cnfg.weight_decay, amsgrad=use_ams)
+else:
+	optimizer = optim.Adam(mymodel.parameters(), lr=init_lr, betas=adam_betas_default, eps=ieps_adam_default, weight_decay=cnfg.weight_decay, amsgrad=use_ams)
 optimizer.zero_grad()
 
 use_amp = cnfg.use_amp and use_cuda
 scaler = GradScaler() if use_amp else None
 
 if multi_gpu:
-	mymodel = DataParallelMT(mymodel, device_ids=cuda_devices, output_device=cuda_device.index, host_replicate=True, gather_output=False)
+	mymodel = DataParallelMT(mymodel, device_ids=cuda_devices, output_device=cuda_device.index, host_replicate=True, gather_output=False, flat_params=cnfg.flat_params)
 	lossf = DataParallelCriterion(lossf, device_ids=cuda_devices, output_device=cuda_device.index, replicate_once=True)
 
+if dist_training:
+	mymodel = DistributedModel(mymodel, bucket_size=cnfg.dist_bucket_size)
+	# whether to perform an optimization step is only known after the backward pass, gradients are reduced by collect_gradients()
+	mymodel.require_sync = False
+	# different dropout masks across processes, while the python random state for shuffling stays the same
+	torch.manual_seed(torch.initial_seed() + dist_rank)
+
 fine_tune_state = cnfg.fine_tune_state
 if fine_tune_state is not None:
 	logger.info("Load optimizer state from: " + fine_tune_state)
-	optimizer.load_state_dict(h5load(fine_tune_state))
+	h5load_optm(optimizer, fine_tune_state)
 
 lrsch = GoogleLR(optimizer, cnfg.isize, cnfg.warm_step, scale=cnfg.lr_scale)
 
@@ -306,21 +342,23 @@ minloss, minerr = eva(vd, nvalid, mymodel, lossf, cuda_device, multi_gpu, use_am
 logger.info("".join(("Init lr: ", ",".join(tostr(getlr(optimizer))), ", Dev Loss/Error: %.3f %.2f" % (minloss, minerr))))
 
 if fine_tune_m is None:
-	save_model(mymodel, wkdir + "init.h5", multi_gpu, logger)
+	if is_master():
+		save_model(mymodel, wkdir + "init.h5", multi_gpu, logger)
 	logger.info("Initial model saved")
 else:
 	cnt_states = cnfg.train_statesf
 	if (cnt_states is not None) and p_check(cnt_states):
 		logger.info("Continue last epoch")
-		tminerr, done_tokens, cur_checkid, remain_steps, _ = train(td, load_states(cnt_states), vd, nvalid, optimizer, lrsch, mymodel, lossf, cuda_device, logger, done_tokens, multi_gpu, tokens_optm, batch_report, save_every, chkpf, chkpof, statesf, num_checkpoint, cur_checkid, report_eva, remain_steps, False, False, scaler)
+		tminerr, done_tokens, cur_checkid, remain_steps, _ = train(td, shard_data(load_states(cnt_states)), vd, nvalid, optimizer, lrsch, mymodel, lossf, cuda_device, logger, done_tokens, multi_gpu, tokens_optm, batch_report, save_every, chkpf, chkpof, statesf, num_checkpoint, cur_checkid, report_eva, remain_steps, False, False, scaler)
 		vloss, vprec = eva(vd, nvalid, mymodel, lossf, cuda_device, multi_gpu, use_amp)
 		logger.info("Epoch: 0, train loss: %.3f, valid loss/error: %.3f %.2f" % (tminerr, vloss, vprec))
-		save_model(mymodel, wkdir + "train_0_%.3f_%.3f_%.2f.h5" % (tminerr, vloss, vprec), multi_gpu, logger)
+		if is_master():
+			save_model(mymodel, wkdir + "train_0_%.3f_%.3f_%.2f.h5" % (tminerr, vloss, vprec), multi_gpu, logger)
 		if save_optm_state:
-			h5save(optimizer.state_dict(), wkdir + "train_0_%.3f_%.3f_%.2f.optm.h5" % (tminerr, vloss, vprec))
+			h5save_optm(optimizer, wkdir + "train_0_%.3f_%.3f_%.2f.optm.h5" % (tminerr, vloss, vprec))
 		logger.info("New best model saved")
 
-if cnfg.dss_ws is not None and cnfg.dss_ws > 0.0 and cnfg.dss_ws < 1.0:
+if (not dist_training) and cnfg.dss_ws is not None and cnfg.dss_ws > 0.0 and cnfg.dss_ws < 1.0:
 	dss_ws = int(cnfg.dss_ws * ntrain)
 	_Dws = {}
 	_prev_Dws = {}
@@ -339,14 +377,15 @@ namin = 0
 for i in range(1, maxrun + 1):
 	shuffle(tl)
 	free_cache(use_cuda)
-	terr, done_tokens, cur_checkid, remain_steps, _Dws = train(td, tl, vd, nvalid, optimizer, lrsch, mymodel, lossf, cuda_device, logger, done_tokens, multi_gpu, tokens_optm, batch_report, save_every, chkpf, chkpof, statesf, num_checkpoint, cur_checkid, report_eva, remain_steps, dss_ws > 0, i >= start_chkp_save, scaler)
+	terr, done_tokens, cur_checkid, remain_steps, _Dws = train(td, shard_data(tl), vd, nvalid, optimizer, lrsch, mymodel, lossf, cuda_device, logger, done_tokens, multi_gpu, tokens_optm, batch_report, save_every, chkpf, chkpof, statesf, num_checkpoint, cur_checkid, report_eva, remain_steps, dss_ws > 0, i >= start_chkp_save, scaler)
 	vloss, vprec = eva(vd, nvalid, mymodel, lossf, cuda_device, multi_gpu, use_amp)
 	logger.info("Epoch: %d, train loss: %.3f, valid loss/error: %.3f %.2f" % (i, terr, vloss, vprec))
 
 	if (vprec <= minerr) or (vloss <= minloss):
-		save_model(mymodel, wkdir + "eva_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
+		if is_master():
+			save_model(mymodel, wkdir + "eva_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
 		if save_optm_state:
-			h5save(optimizer.state_dict(), wkdir + "eva_%d_%.3f_%.3f_%.2f.optm.h5" % (i, terr, vloss, vprec))
+			h5save_optm(optimizer, wkdir + "eva_%d_%.3f_%.3f_%.2f.optm.h5" % (i, terr, vloss, vprec))
 		logger.info("New best model saved")
 
 		namin = 0
@@ -359,16 +398,18 @@ for i in range(1, maxrun + 1):
 	else:
 		if terr < tminerr:
 			tminerr = terr
-			save_model(mymodel, wkdir + "train_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
+			if is_master():
+				save_model(mymodel, wkdir + "train_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
 			if save_optm_state:
-				h5save(optimizer.state_dict(), wkdir + "train_%d_%.3f_%.3f_%.2f.optm.h5" % (i, terr, vloss, vprec))
+				h5save_optm(optimizer, wkdir + "train_%d_%.3f_%.3f_%.2f.optm.h5" % (i, terr, vloss, vprec))
 		elif epoch_save:
-			save_model(mymodel, wkdir + "epoch_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
+			if is_master():
+				save_model(mymodel, wkdir + "epoch_%d_%.3f_%.3f_%.2f.h5" % (i, terr, vloss, vprec), multi_gpu, logger)
 
 		namin += 1
 		if namin >= earlystop:
 			if done_tokens > 0:
-				if multi_gpu:
+				if multi_gpu or dist_training:
 					mymodel.collect_gradients()
 				optm_step(optimizer, scaler)
 				done_tokens = 0
@@ -389,14 +430,17 @@ for i in range(1, maxrun + 1):
 		_prev_Dws = _Dws
 
 if done_tokens > 0:
-	if multi_gpu:
+	if multi_gpu or dist_training:
 		mymodel.collect_gradients()
 	optm_step(optimizer, scaler)
 
-save_model(mymodel, wkdir + "last.h5", multi_gpu, logger)
+if is_master():
+	save_model(mymodel, wkdir + "last.h5", multi_gpu, logger)
 if save_optm_state:
-	h5save(optimizer.state_dict(), wkdir + "last.optm.h5")
+	h5save_optm(optimizer, wkdir + "last.optm.h5")
 logger.info("model saved")
 
 td.close()
 vd.close()
+
+close_dist()
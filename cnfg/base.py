@@ -34,6 +34,17 @@ use_cuda = True
 # enable Data Parallel multi-gpu support with values like: 'cuda:0, 1, 3'.
 gpuid = 'cuda:0, 1'
 use_amp = False
+# mixed precision with bfloat16 autocast for training and decoding on CPU (pytorch >= 1.10), parameters, gradients and the loss are kept in float32 and gradients are not scaled.
+cpu_amp = False
+# back trainable parameters and gradients of the model and its replicas on each GPU with one flat buffer per dtype in multi-gpu training, gradients are then reduced, cleared and parameters broadcast with one operation per buffer.
+flat_params = False
+# distributed data-parallel training with one process per worker launched by torchrun, "gloo" for CPU (multi-node) clusters or "nccl" for GPUs, None to disable.
+dist_backend = None
+# size (MB) of gradient buckets all-reduced during the backward pass.
+dist_bucket_size = 25
+# partition optimizer states across processes in distributed training (ZeRO stage 1), optimizer states are saved into one file by the first process with zero_gather_state, or into one file per process otherwise.
+zero_optimizer = False
+zero_gather_state = True
 
 bindDecoderEmb = True
 share_emb = False
@@ -56,12 +67,28 @@ lr_scale = 1.0
 
 label_smoothing = 0.1
 
+# word-level knowledge distillation: teacher token distributions of train_data built by tools/kd/topk.py, the student is trained with (1 - kd_weight) * label smoothing loss + kd_weight * cross entropy against teacher distributions. None to disable.
+kd_data = None
+kd_weight = 0.5
+
 weight_decay = 0
 
 beam_size = 4
 length_penalty = 0.0
 # use multi-gpu for translating or not. `predict.py` will take the last gpu rather than the first in case multi_gpu_decoding is set to False to avoid potential break due to out of memory, since the first gpu is the main device by default which takes more jobs.
 multi_gpu_decoding = False
+# vocabulary shortlist built by tools/shortlist.py for decoding (predict.py and translator.py on a single device), decoders only score candidate targets of source tokens in each batch and the shortlist_topk most frequent target words. None to score the whole vocabulary.
+shortlist = None
+shortlist_topk = 1024
+
+# CPU threads of decoding processes (predict.py, translator.py and server.py workers): intra-op threads of each process, None to divide CPU cores available to the job among its processes.
+cpu_num_threads = None
+# inter-op threads of each process, None to keep the default of pytorch.
+cpu_interop_threads = None
+# pin each process to its own cores (Linux only), processes take consecutive groups of cpu_num_threads cores by their index.
+cpu_affinity = False
+# number of processes decoding on CPU with predict.py, 1 for one process with many threads, more for several processes with fewer threads each (utils/decode.py), whose results are kept per batch in $output.parts until merged, so that an interrupted run resumes from finished batches. tools/check/perf/threads.py benchmarks the splits of a machine.
+decode_num_processes = 1
 
 seed = 666666
 
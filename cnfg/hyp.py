@@ -17,11 +17,28 @@ cache_len_default = 256
 use_k_relative_position = 0
 disable_std_pemb = False
 
+# recompute activations of encoder/decoder layers during the backward pass (gradient checkpointing) to trade computation for memory. Number of consecutive layers checkpointed as one segment, 0 to disable, 1 for every layer. Set the encoder side and the decoder side separately with a tuple like (1, 2,).
+activation_recompute = 0
+
+# compute attention over chunks of queries and keys with an online softmax, so that the full attention score matrix is never built, which bounds the memory cost for long inputs (e.g. concatenated document contexts). Chunk size, 0 to disable.
+attention_chunk_size = 0
+
+# attention backend, choices: "std", "sdpa" (the fused torch.nn.functional.scaled_dot_product_attention of pytorch >= 2.0, only used when neither relative positions nor SparseNormer is enabled, falls back to "std" otherwise).
+attention_backend = "std"
+
+# run the embedding, layer normalization, feed-forward and attention projections of the encoder only on non-pad tokens (packed into a (ntokens, isize) tensor), attention is still computed on the padded layout. Saves computation for heavily padded batches.
+packed_encoder = False
+
+# use fused kernels in encoder/decoder layers for training: dropout + residual connection + LayerNorm in one autograd function and bias + ReLU + dropout of the feed-forward network computed in-place, which saves memory and elementwise passes. Results match the standard layers with the same random seed on CPU. Only effective with the ReLU activation (advance_activation_function = None).
+fused_layer = False
+
 # configure maximum batch size w.r.t GPU memory
 max_sentences_gpu = 768
 max_tokens_gpu = 4608
 max_pad_tokens_sentence = 16
 normal_tokens_vs_pad_tokens = 4
+# documents (of context-aware models) with different numbers of sentences share a batch if their numbers of sentences fall into the same bucket, shorter documents are padded with placeholder sentences. Buckets are exact up to 1 / ratio sentences and then grow geometrically, so that placeholder sentences take less than this ratio of a batch. 0 to batch only documents with the same number of sentences.
+doc_pad_sent_ratio = 0.125
 
 # trade CPU for IO and disk space, see [h5py](http://docs.h5py.org/en/stable/high/dataset.html) for details.
 # choices: None, "gzip", "lzf"
@@ -31,5 +48,22 @@ hdf5_data_compression_level = 9
 hdf5_model_compression = None
 hdf5_model_compression_level = 0
 
+# number of processes used by data processing tools (e.g., tools/vocab.py), None for the number of CPU cores, 1 to process data in the main process.
+data_num_processes = None
+
+# bits of hashes (64 or 128) used to identify sentences in deduplication (utils/fmt/dedup.py, e.g., tools/clean/maxkeeper.py).
+dedup_hash_bits = 64
+# the memory budget of deduplication in number of distinct sentence pairs counted in memory (by hashes, and by full strings of pairs of duplicated sources in the verification pass of the exact mode), counts are spilled to disk when it is exceeded. None to keep all counts in memory.
+dedup_max_keys = 16777216
+
+# teacher token distributions stored for knowledge distillation (utils/kd.py, tools/kd/topk.py): the most probable teacher tokens of each target token are kept until their probabilities sum to kd_mass, at most kd_topk of them, and kd_topk is reduced further to fit the size of stored files into kd_budget bytes (None for no limit).
+kd_topk = 8
+kd_mass = 0.95
+kd_budget = None
+
+# structured pruning (utils/prune.py, tools/prune.py): the ratio of the least important attention heads (prune_head_ratio) and hidden units of feed-forward networks (prune_ffn_ratio) removed from each module, at least one head/unit of each module is kept.
+prune_head_ratio = 0.25
+prune_ffn_ratio = 0.25
+
 # For BPE (using full vocabulary), the special <unk> token will never appear and thus can be removed from the vocabulary. Otherwise, it should be set to True.
 use_unk = True
@@ -46,6 +46,10 @@ use_k_relative_position_encoder, use_k_relative_position_decoder = parse_double_
 rel_pos_enabled = (max(use_k_relative_position_encoder, use_k_relative_position_decoder) > 0)
 disable_std_pemb_encoder, disable_std_pemb_decoder = parse_double_value_tuple(disable_std_pemb)
 
+activation_recompute_encoder, activation_recompute_decoder = parse_double_value_tuple(activation_recompute)
+
+use_sdpa_default = (attention_backend.lower() == "sdpa")
+
 h5datawargs = {} if hdf5_data_compression is None else {"compression": hdf5_data_compression, "compression_opts": hdf5_data_compression_level, "shuffle":True}
 h5modelwargs = {} if hdf5_model_compression is None else {"compression": hdf5_model_compression, "compression_opts": hdf5_model_compression_level, "shuffle":True}
 h5zipargs = {"compression": "gzip", "compression_opts": 9, "shuffle":True}
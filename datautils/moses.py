@@ -3,6 +3,7 @@
 import os
 from os.path import sep
 from subprocess import PIPE, Popen
+from threading import Thread
 
 perl_exec = "perl"
 moses_scripts = os.environ.get('moses_scripts')
@@ -37,17 +38,23 @@ class LineProcessor(ProcessWrapper):
 
 		return self.process.stdout.readline().strip().decode("utf-8", "ignore")
 
+# lines of a batch are written by a thread while outputs are read, so that the batch is pipelined through the process instead of one round trip per line, and neither pipe fills up and blocks the other side. Scripts wrapped by BatchProcessor output exactly one line for each input line.
+
+def write_lines(fwrt, lines):
+
+	for line in lines:
+		fwrt.write(line.encode("utf-8", "ignore"))
+	fwrt.flush()
+
 class BatchProcessor(ProcessWrapper):
 
 	def __call__(self, input):
 
 		if isinstance(input, (list, tuple)):
-			rs = []
-
-			for inputu in input:
-				self.process.stdin.write(("%s\n" % inputu.strip()).encode("utf-8", "ignore"))
-				self.process.stdin.flush()
-				rs.append(self.process.stdout.readline().strip().decode("utf-8", "ignore"))
+			_writer = Thread(target=write_lines, args=(self.process.stdin, ["%s\n" % inputu.strip() for inputu in input],))
+			_writer.start()
+			rs = [self.process.stdout.readline().strip().decode("utf-8", "ignore") for _ in range(len(input))]
+			_writer.join()
 		else:
 			self.process.stdin.write(("%s\n" % input.strip()).encode("utf-8", "ignore"))
 			self.process.stdin.flush()
@@ -58,6 +65,8 @@ class BatchProcessor(ProcessWrapper):
 class SentenceSplitter(ProcessWrapper):
 	"""Wrapper for standard Moses sentence splitter."""
 
+	batch_input = True
+
 	def __init__(self, lang):
 
 		ssplit_cmd = moses_scripts + sep.join(("ems", "support", "split-sentences.perl"))
@@ -65,10 +74,8 @@ class SentenceSplitter(ProcessWrapper):
 		self.process = None
 		self.start()
 
-	def __call__(self, input):
+	def read_para(self):
 
-		self.process.stdin.write((input.strip() + "\n<P>\n").encode("utf-8", "ignore"))
-		self.process.stdin.flush()
 		x = self.process.stdout.readline().strip().decode("utf-8", "ignore")
 		ret = []
 		while x != '<P>' and x != '':
@@ -77,6 +84,22 @@ class SentenceSplitter(ProcessWrapper):
 
 		return ret
 
+	# input: a paragraph, or a list of paragraphs (returns a list of sentence lists), paragraphs of a batch are pipelined and framed by the <P> sentinel which the splitter outputs for each of them
+
+	def __call__(self, input):
+
+		if isinstance(input, (list, tuple)):
+			_writer = Thread(target=write_lines, args=(self.process.stdin, [inputu.strip() + "\n<P>\n" for inputu in input],))
+			_writer.start()
+			rs = [self.read_para() for _ in range(len(input))]
+			_writer.join()
+		else:
+			self.process.stdin.write((input.strip() + "\n<P>\n").encode("utf-8", "ignore"))
+			self.process.stdin.flush()
+			rs = self.read_para()
+
+		return rs
+
 class Pretokenizer(BatchProcessor):
 	"""Pretokenizer wrapper.
 	The pretokenizer fixes known issues with the input.
@@ -0,0 +1,139 @@
+#encoding: utf-8
+
+# persistent pools of pre-/post-processing workers (e.g., tokenizers and truecasers of datautils.moses/datautils.pymoses, BPE of datautils.bpe): a batch of sentences is split into contiguous chunks processed by nworker persistent processors in parallel, and outputs of sentences processed recently are memorised in an LRU cache, so that repeated sentences (e.g., of a web service) are not processed again. Processors are built lazily in the process which uses them, so that forked processes (e.g., uWSGI workers forked from the master which loads the application) never share pipes of subprocesses or worker pools.
+
+from os import getpid
+from threading import Lock
+from collections import OrderedDict
+from queue import Queue
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+def split_chunks(lin, nchunk):
+
+	_l = len(lin)
+	_csize, _rem = divmod(_l, nchunk)
+	rs = []
+	lind = 0
+	for i in range(nchunk):
+		ind = lind + _csize + (1 if i < _rem else 0)
+		if ind > lind:
+			rs.append(lin[lind:ind])
+		lind = ind
+
+	return rs
+
+# the processor of each worker process of process pools
+
+processor = None
+
+def init_process(cls, args, kwargs):
+
+	global processor
+	processor = cls(*args, **kwargs)
+
+def process_chunk(lin):
+
+	return processor(lin)
+
+class ProcessorPool:
+
+	batch_input = True
+
+	# cls, *args, **kwargs: the processor class and its arguments, processors take a list of strings and return the list of their outputs (or take and return a string)
+	# nworker: number of persistent processors
+	# use_process: run processors in worker processes (for pure python processors, e.g., datautils.pymoses and datautils.bpe, which hold the GIL), otherwise processors are driven by threads of the process (for processors wrapping subprocesses, e.g., datautils.moses)
+	# cache_size: number of sentences memorised, 0 to disable the cache
+	# min_chunk: minimum number of sentences of a chunk, small batches are not split over all processors
+
+	def __init__(self, cls, *args, nworker=4, use_process=False, cache_size=65536, min_chunk=8, **kwargs):
+
+		self.cls, self.args, self.kwargs = cls, args, kwargs
+		self.nworker, self.use_process, self.cache_size, self.min_chunk = nworker, use_process, cache_size, min_chunk
+		self.cache = OrderedDict() if cache_size > 0 else None
+		self.lock = Lock()
+		self.pid = self.pool = self.processors = None
+
+	def start(self):
+
+		with self.lock:
+			if self.pid != getpid():
+				if self.use_process:
+					self.pool = Pool(self.nworker, initializer=init_process, initargs=(self.cls, self.args, self.kwargs,))
+				else:
+					# each processor is used by one thread at a time, concurrent calls (e.g., threads of a uWSGI worker) share the processors
+					self.processors = Queue()
+					for _ in range(self.nworker):
+						self.processors.put(self.cls(*self.args, **self.kwargs))
+					self.pool = ThreadPool(self.nworker)
+				if self.cache is not None:
+					self.cache.clear()
+				self.pid = getpid()
+
+	def process_chunk(self, lin):
+
+		_processor = self.processors.get()
+		try:
+			rs = _processor(lin)
+		finally:
+			self.processors.put(_processor)
+
+		return rs
+
+	def process(self, lin):
+
+		if self.pid != getpid():
+			self.start()
+		_nchunk = max(1, min(self.nworker, len(lin) // self.min_chunk))
+		if _nchunk > 1:
+			rs = []
+			for _rs in self.pool.map(process_chunk if self.use_process else self.process_chunk, split_chunks(lin, _nchunk)):
+				rs.extend(_rs)
+		elif self.use_process:
+			rs = self.pool.apply(process_chunk, (lin,))
+		else:
+			rs = self.process_chunk(lin)
+
+		return rs
+
+	def __call__(self, input):
+
+		if not isinstance(input, (list, tuple)):
+			return self([input])[0]
+		if self.cache is None:
+			return self.process(input)
+
+		rs = [None for _ in range(len(input))]
+		_todo = {}
+		with self.lock:
+			for i, inputu in enumerate(input):
+				if inputu in self.cache:
+					self.cache.move_to_end(inputu)
+					rs[i] = self.cache[inputu]
+				elif inputu in _todo:
+					_todo[inputu].append(i)
+				else:
+					_todo[inputu] = [i]
+		if _todo:
+			_lin = list(_todo.keys())
+			_rs = self.process(_lin)
+			with self.lock:
+				for inputu, rsu in zip(_lin, _rs):
+					for i in _todo[inputu]:
+						rs[i] = rsu
+					self.cache[inputu] = rsu
+				while len(self.cache) > self.cache_size:
+					self.cache.popitem(last=False)
+
+		return rs
+
+	def close(self):
+
+		if self.pool is not None:
+			if self.pid == getpid():
+				self.pool.terminate()
+			self.pool = self.processors = self.pid = None
+
+	def __del__(self):
+
+		self.close()
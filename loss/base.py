@@ -196,3 +196,33 @@ class ReducedLabelSmoothingLoss(LabelSmoothingLoss):
 		rs = kl_div(_input, model_prob, reduction=self.reduction)
 
 		return rs.view(target.size()) if self.reduction == 'none' and target.dim() > 1 else rs
+
+# word-level knowledge distillation (Sequence-Level Knowledge Distillation, https://aclanthology.org/D16-1139/): cross entropy between sparse teacher distributions over their top-k tokens (utils/kd.py) and the model.
+
+class TopKDistillLoss(_Loss):
+
+	def __init__(self, ignore_index=-1, reduction='mean'):
+
+		super(TopKDistillLoss, self).__init__()
+
+		self.ignore_index, self.reduction = ignore_index, reduction
+
+	# input: log-probabilities (batch size, seql, num_classes)
+	# target: (batch size, seql), teacher distributions are given for positions which are not ignore_index, in order
+	# ids: teacher token ids (ntok, topk)
+	# probs: probabilities of teacher tokens (ntok, topk), 0 for unused entries
+
+	def forward(self, input, target, ids, probs):
+
+		_input = input.view(-1, input.size(-1))
+		if self.ignore_index >= 0:
+			_input = _input[target.view(-1).ne(self.ignore_index)]
+
+		rs = -(_input.gather(1, ids) * probs.to(_input.dtype)).sum(-1)
+
+		if self.reduction == 'sum':
+			rs = rs.sum()
+		elif self.reduction == 'mean':
+			rs = rs.mean()
+
+		return rs
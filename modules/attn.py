@@ -0,0 +1,109 @@
+#encoding: utf-8
+
+import torch
+from torch import nn
+from math import sqrt
+
+from utils.checkpoint import checkpoint, checkpoint_kwargs
+
+from cnfg.ihyp import *
+
+# the fused scaled_dot_product_attention is available since pytorch 2.0
+try:
+	from torch.nn.functional import scaled_dot_product_attention
+except Exception as e:
+	scaled_dot_product_attention = None
+
+# compute attention for a chunk of queries over key chunks of size chunk_size, the softmax is computed online (Self-attention Does Not Need O(n^2) Memory, https://arxiv.org/abs/2112.05682) so that the full (nquery, seql) score matrix is never built. Normers other than softmax (e.g. SparseNormer) are applied on full rows of scores.
+# q: (bsize, nheads, nquery, adim)
+# k: (bsize, nheads, adim, seql)
+# v: (bsize, nheads, seql, adim)
+# mask: (bsize, 1 or nquery, seql)
+# rel_pos: relative position indexes for rel_pemb (nquery, seql)
+
+def attn_qchunk(q, k, v, mask, rel_pos, chunk_size, normer, drop, rel_pemb):
+
+	bsize, nheads, nquery, adim = q.size()
+	seql = k.size(-1)
+	scale = sqrt(adim)
+
+	if rel_pemb is not None:
+		_rel_q = q.permute(2, 0, 1, 3).contiguous().view(nquery, bsize * nheads, adim)
+
+	if not isinstance(normer, nn.Softmax):
+
+		scores = q.matmul(k)
+		if rel_pemb is not None:
+			scores = scores + _rel_q.bmm(rel_pemb(rel_pos).transpose(1, 2)).view(nquery, bsize, nheads, seql).permute(1, 2, 0, 3)
+		scores = scores / scale
+		if mask is not None:
+			scores.masked_fill_(mask.unsqueeze(1), -inf_default)
+		scores = normer(scores)
+		if drop is not None:
+			scores = drop(scores)
+
+		return scores.matmul(v)
+
+	m = l = rs = None
+	for ks in range(0, seql, chunk_size):
+		kc = min(chunk_size, seql - ks)
+		scores = q.matmul(k.narrow(-1, ks, kc))
+		if rel_pemb is not None:
+			scores = scores + _rel_q.bmm(rel_pemb(rel_pos.narrow(1, ks, kc)).transpose(1, 2)).view(nquery, bsize, nheads, kc).permute(1, 2, 0, 3)
+		scores = scores / scale
+		if mask is not None:
+			scores = scores.masked_fill(mask.narrow(-1, ks, kc).unsqueeze(1), -inf_default)
+
+		_m = scores.max(-1, keepdim=True)[0]
+		if m is not None:
+			_m = torch.max(m, _m)
+		# rows with all keys masked so far, avoid nan from (-inf) - (-inf)
+		_m_safe = _m.masked_fill(_m.eq(-inf_default), 0.0)
+		scores = (scores - _m_safe).exp()
+		_l = scores.sum(-1, keepdim=True)
+		if drop is not None:
+			scores = drop(scores)
+		_o = scores.matmul(v.narrow(2, ks, kc))
+		if m is None:
+			l, rs = _l, _o
+		else:
+			_c = (m - _m_safe).exp()
+			l = l * _c + _l
+			rs = rs * _c + _o
+		m = _m
+
+	return rs / l
+
+# memory efficient drop-in replacement of the attention computation in MultiHeadAttn/SelfAttn/CrossAttn, queries are processed in chunks of size chunk_size, and each chunk is recomputed in the backward pass when gradients are required, so that only O(chunk_size * seql) memory is needed for both training and decoding.
+# real_iQ: (bsize, nheads, nquery, adim)
+# real_iK: (bsize, nheads, adim, seql)
+# real_iV: (bsize, nheads, seql, adim)
+# mask: (bsize, 1 or nquery, seql)
+# rel_pos: relative position indexes (nquery, seql) for rel_pemb
+# returns: (bsize, nheads, nquery, adim)
+
+def chunked_attn(real_iQ, real_iK, real_iV, mask=None, chunk_size=256, normer=None, drop=None, rel_pemb=None, rel_pos=None):
+
+	nquery = real_iQ.size(2)
+	_mask_q = (mask is not None) and (mask.size(1) > 1)
+	_ckp = torch.is_grad_enabled() and (real_iQ.requires_grad or real_iK.requires_grad or real_iV.requires_grad)
+
+	rs = []
+	for qs in range(0, nquery, chunk_size):
+		qc = min(chunk_size, nquery - qs)
+		_args = (real_iQ.narrow(2, qs, qc), real_iK, real_iV, mask.narrow(1, qs, qc) if _mask_q else mask, None if rel_pos is None else rel_pos.narrow(0, qs, qc), chunk_size, normer, drop, rel_pemb,)
+		rs.append(checkpoint(attn_qchunk, *_args, **checkpoint_kwargs) if _ckp else attn_qchunk(*_args))
+
+	return torch.cat(rs, 2) if len(rs) > 1 else rs[0]
+
+# route to the fused torch.nn.functional.scaled_dot_product_attention, which requires the standard softmax normer and no relative positions.
+# real_iQ: (bsize, nheads, nquery, adim)
+# real_iK: (bsize, nheads, adim, seql)
+# real_iV: (bsize, nheads, seql, adim)
+# mask: (bsize, 1 or nquery, seql), True for positions to be masked
+# dropout: dropout probability applied to attention weights, pass 0.0 for evaluation
+# returns: (bsize, nheads, nquery, adim)
+
+def sdpa_attn(real_iQ, real_iK, real_iV, mask=None, dropout=0.0):
+
+	return scaled_dot_product_attention(real_iQ, real_iK.transpose(-1, -2), real_iV, attn_mask=None if mask is None else ~mask.unsqueeze(1), dropout_p=dropout)
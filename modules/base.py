@@ -6,16 +6,45 @@ from torch import nn
 from torch.nn import functional as nnFunc
 from torch.autograd import Function
 
-from utils.base import reduce_model_list
+from utils.base import reduce_model_list, pack_seq, unpack_seq
 from modules.act import Custom_Act
 from modules.act import reduce_model as reduce_model_act
 from modules.dropout import Dropout, TokenDropout, InfDropout
 from modules.dropout import reduce_model as reduce_model_drop
+from modules.attn import chunked_attn, sdpa_attn, scaled_dot_product_attention
 
 from cnfg.ihyp import *
 
 Linear = nn.Linear
 
+# keep output (dim = 0) or input (dim = 1) features of a Linear module in place, used to prune heads and hidden units
+# index: kept features (LongTensor)
+
+def select_linear(lin, index, dim=0):
+
+	_w = lin.weight
+	_index = index.to(_w.device)
+	lin.weight = nn.Parameter(_w.data.index_select(dim, _index), requires_grad=_w.requires_grad)
+	if dim == 0:
+		if lin.bias is not None:
+			lin.bias = nn.Parameter(lin.bias.data.index_select(0, _index), requires_grad=lin.bias.requires_grad)
+		lin.out_features = _index.numel()
+	else:
+		lin.in_features = _index.numel()
+
+# heads: kept heads (list of indexes)
+# nproj: number of projections (query, key, value) of num_head heads packed in the same Linear module
+# returns: indexes of features of kept heads
+
+def get_head_index(heads, num_head, attn_dim, nproj=1):
+
+	rs = (torch.as_tensor(heads, dtype=torch.long).unsqueeze(-1) * attn_dim + torch.arange(attn_dim, dtype=torch.long)).view(-1)
+	if nproj > 1:
+		_hsize = num_head * attn_dim
+		rs = torch.cat([rs + i * _hsize for i in range(nproj)], 0)
+
+	return rs
+
 class PositionwiseFF(nn.Module):
 
 	# isize: input dimension
@@ -43,6 +72,14 @@ class PositionwiseFF(nn.Module):
 
 		return out
 
+	# units: kept hidden units (list of indexes)
+
+	def prune(self, units):
+
+		_index = torch.as_tensor(units, dtype=torch.long)
+		select_linear(self.net[0], _index)
+		select_linear(self.net[-2 if len(self.net) > 3 else -1], _index, 1)
+
 class PositionalEmb(nn.Module):
 
 	# num_dim: dimension of embedding
@@ -116,8 +153,10 @@ class MultiHeadAttn(nn.Module):
 	# dropout: dropout probability
 	# sparsenorm: using sparse normer or standard softmax
 	# bind_qk: query and key can share a same linear transformation for the Reformer: The Efficient Transformer(https://arxiv.org/abs/2001.04451) paper.
+	# chunk_size: compute attention over chunks of queries and keys of this size to save memory for long sequences, 0 to disable
+	# use_sdpa: use the fused scaled_dot_product_attention of pytorch, only effective without sparsenorm and relative positions
 
-	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, k_isize=None, v_isize=None, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, k_rel_pos=0, sparsenorm=False, bind_qk=False, xseql=cache_len_default):
+	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, k_isize=None, v_isize=None, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, k_rel_pos=0, sparsenorm=False, bind_qk=False, xseql=cache_len_default, chunk_size=attention_chunk_size, use_sdpa=use_sdpa_default):
 
 		super(MultiHeadAttn, self).__init__()
 
@@ -137,6 +176,9 @@ class MultiHeadAttn(nn.Module):
 
 		self.drop = Dropout(dropout, inplace=sparsenorm) if dropout > 0.0 else None
 
+		self.chunk_size = chunk_size
+		self.use_sdpa = use_sdpa and (scaled_dot_product_attention is not None) and (not sparsenorm) and (k_rel_pos <= 0)
+
 		if k_rel_pos > 0:
 			self.k_rel_pos = k_rel_pos
 			self.rel_pemb = nn.Embedding(k_rel_pos * 2 + 1, self.attn_dim)
@@ -166,6 +208,18 @@ class MultiHeadAttn(nn.Module):
 
 		real_iQ, real_iK, real_iV = self.query_adaptor(iQ).view(bsize, nquery, nheads, adim).transpose(1, 2), self.key_adaptor(iK).view(bsize, seql, nheads, adim).permute(0, 2, 3, 1), self.value_adaptor(iV).view(bsize, seql, nheads, adim).transpose(1, 2)
 
+		if self.chunk_size > 0:
+			if self.rel_pemb is not None:
+				self.rel_pos_cache = self.get_rel_pos(seql).narrow(0, seql - nquery, nquery).contiguous() if self.ref_rel_posm is None else self.ref_rel_posm.rel_pos_cache
+			oMA = chunked_attn(real_iQ, real_iK, real_iV, mask, self.chunk_size, self.normer, self.drop, self.rel_pemb, None if self.rel_pemb is None else self.rel_pos_cache).transpose(1, 2).contiguous()
+
+			return self.outer(oMA.view(bsize, nquery, self.hsize))
+
+		if self.use_sdpa:
+			oMA = sdpa_attn(real_iQ, real_iK, real_iV, mask, self.drop.p if self.training and (self.drop is not None) else 0.0).transpose(1, 2).contiguous()
+
+			return self.outer(oMA.view(bsize, nquery, self.hsize))
+
 		# scores (bsize, nheads, nquery, adim) * (bsize, nheads, adim, seql) => (bsize, nheads, nquery, seql)
 
 		scores = real_iQ.matmul(real_iK)
@@ -200,6 +254,19 @@ class MultiHeadAttn(nn.Module):
 			_rpm = torch.arange(-length + 1, 1, dtype=self.rel_pos.dtype, device=self.rel_pos.device).unsqueeze(0)
 			return ((_rpm - _rpm.t()).clamp(min=-self.k_rel_pos, max=self.k_rel_pos) + self.k_rel_pos)
 
+	# heads: kept heads (list of indexes)
+
+	def prune(self, heads):
+
+		_index = get_head_index(heads, self.num_head, self.attn_dim)
+		if self.key_adaptor is not self.query_adaptor:
+			select_linear(self.key_adaptor, _index)
+		select_linear(self.query_adaptor, _index)
+		select_linear(self.value_adaptor, _index)
+		select_linear(self.outer, _index, 1)
+		self.num_head = len(heads)
+		self.hsize = self.attn_dim * self.num_head
+
 # Average Attention is proposed in Accelerating Neural Transformer via an Average Attention Network(https://arxiv.org/abs/1805.00631)
 class AverageAttn(nn.Module):
 
@@ -254,7 +321,7 @@ class AverageAttn(nn.Module):
 # Accelerated MultiHeadAttn for self attention, use when Q == K == V
 class SelfAttn(nn.Module):
 
-	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, k_rel_pos=use_k_relative_position, sparsenorm=False, xseql=cache_len_default):
+	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, k_rel_pos=use_k_relative_position, sparsenorm=False, xseql=cache_len_default, chunk_size=attention_chunk_size, use_sdpa=use_sdpa_default):
 
 		super(SelfAttn, self).__init__()
 
@@ -271,6 +338,9 @@ class SelfAttn(nn.Module):
 
 		self.drop = Dropout(dropout, inplace=sparsenorm) if dropout > 0.0 else None
 
+		self.chunk_size = chunk_size
+		self.use_sdpa = use_sdpa and (scaled_dot_product_attention is not None) and (not sparsenorm) and (k_rel_pos <= 0)
+
 		if k_rel_pos > 0:
 			self.k_rel_pos = k_rel_pos
 			self.rel_pemb = nn.Embedding(k_rel_pos * 2 + 1, self.attn_dim)
@@ -304,29 +374,57 @@ class SelfAttn(nn.Module):
 
 			real_iQ, real_iK, real_iV = real_iQ.transpose(1, 2), real_iK.permute(0, 2, 3, 1), real_iV.transpose(1, 2)
 
-		scores = real_iQ.matmul(real_iK)
+		return self.outer(self.attn_core(real_iQ, real_iK, real_iV, mask).view(bsize, nquery, self.hsize))
+
+	# iQ: packed non-pad tokens (ntokens, isize)
+	# pind: indexes of non-pad tokens in the flattened sequence (bsize * seql), see utils.base.get_pack_indexes
+	# mask: (bsize, 1, seql)
+	# only the attention is computed on the padded (bsize, seql) layout, projections are performed on non-pad tokens.
+
+	def packed_forward(self, iQ, pind, bsize, seql, mask=None):
+
+		real_iQ, real_iK, real_iV = unpack_seq(self.adaptor(iQ), pind, bsize * seql).view(bsize, seql, 3, self.num_head, self.attn_dim).unbind(2)
+
+		real_iQ, real_iK, real_iV = real_iQ.transpose(1, 2), real_iK.permute(0, 2, 3, 1), real_iV.transpose(1, 2)
+
+		return self.outer(pack_seq(self.attn_core(real_iQ, real_iK, real_iV, mask).view(bsize * seql, self.hsize), pind))
+
+	# real_iQ: (bsize, nheads, nquery, adim)
+	# real_iK: (bsize, nheads, adim, seql)
+	# real_iV: (bsize, nheads, seql, adim)
+	# returns: (bsize, nquery, nheads, adim)
+
+	def attn_core(self, real_iQ, real_iK, real_iV, mask=None):
+
+		bsize, nheads, nquery, adim = real_iQ.size()
+		seql = real_iK.size(-1)
 
 		if self.rel_pemb is not None:
-			if iK is None:
-				self.rel_pos_cache = self.get_rel_pos(nquery).contiguous() if self.ref_rel_posm is None else self.ref_rel_posm.rel_pos_cache
-				scores += real_iQ.permute(2, 0, 1, 3).contiguous().view(nquery, bsize * nheads, adim).bmm(self.rel_pemb(self.rel_pos_cache).transpose(1, 2)).view(nquery, bsize, nheads, nquery).permute(1, 2, 0, 3)
-			else:
-				self.rel_pos_cache = self.get_rel_pos(seql).narrow(0, seql - nquery, nquery).contiguous() if self.ref_rel_posm is None else self.ref_rel_posm.rel_pos_cache
+			self.rel_pos_cache = self.get_rel_pos(seql).narrow(0, seql - nquery, nquery).contiguous() if self.ref_rel_posm is None else self.ref_rel_posm.rel_pos_cache
+
+		if self.chunk_size > 0:
+			oMA = chunked_attn(real_iQ, real_iK, real_iV, mask, self.chunk_size, self.normer, self.drop, self.rel_pemb, None if self.rel_pemb is None else self.rel_pos_cache)
+		elif self.use_sdpa:
+			oMA = sdpa_attn(real_iQ, real_iK, real_iV, mask, self.drop.p if self.training and (self.drop is not None) else 0.0)
+		else:
+			scores = real_iQ.matmul(real_iK)
+
+			if self.rel_pemb is not None:
 				scores += real_iQ.permute(2, 0, 1, 3).contiguous().view(nquery, bsize * nheads, adim).bmm(self.rel_pemb(self.rel_pos_cache).transpose(1, 2)).view(nquery, bsize, nheads, seql).permute(1, 2, 0, 3)
 
-		scores = scores / sqrt(adim)
+			scores = scores / sqrt(adim)
 
-		if mask is not None:
-			scores.masked_fill_(mask.unsqueeze(1), -inf_default)
+			if mask is not None:
+				scores.masked_fill_(mask.unsqueeze(1), -inf_default)
 
-		scores = self.normer(scores)
+			scores = self.normer(scores)
 
-		if self.drop is not None:
-			scores = self.drop(scores)
+			if self.drop is not None:
+				scores = self.drop(scores)
 
-		oMA = scores.matmul(real_iV).transpose(1, 2).contiguous()
+			oMA = scores.matmul(real_iV)
 
-		return self.outer(oMA.view(bsize, nquery, self.hsize))
+		return oMA.transpose(1, 2).contiguous()
 
 	def get_rel_pos(self, length):
 
@@ -336,10 +434,19 @@ class SelfAttn(nn.Module):
 			_rpm = torch.arange(-length + 1, 1, dtype=self.rel_pos.dtype, device=self.rel_pos.device).unsqueeze(0)
 			return ((_rpm - _rpm.t()).clamp(min=-self.k_rel_pos, max=self.k_rel_pos) + self.k_rel_pos)
 
+	# heads: kept heads (list of indexes)
+
+	def prune(self, heads):
+
+		select_linear(self.adaptor, get_head_index(heads, self.num_head, self.attn_dim, 3))
+		select_linear(self.outer, get_head_index(heads, self.num_head, self.attn_dim), 1)
+		self.num_head = len(heads)
+		self.hsize = self.attn_dim * self.num_head
+
 # Accelerated MultiHeadAttn for cross attention, use when K == V
 class CrossAttn(nn.Module):
 
-	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, k_isize=None, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, sparsenorm=False):
+	def __init__(self, isize, hsize, osize, num_head=8, dropout=0.0, k_isize=None, enable_bias=enable_prev_ln_bias_default, enable_proj_bias=enable_proj_bias_default, sparsenorm=False, chunk_size=attention_chunk_size, use_sdpa=use_sdpa_default):
 
 		super(CrossAttn, self).__init__()
 
@@ -358,6 +465,9 @@ class CrossAttn(nn.Module):
 
 		self.drop = Dropout(dropout, inplace=sparsenorm) if dropout > 0.0 else None
 
+		self.chunk_size = chunk_size
+		self.use_sdpa = use_sdpa and (scaled_dot_product_attention is not None) and (not sparsenorm)
+
 	def forward(self, iQ, iK, mask=None):
 
 		bsize, nquery = iQ.size()[:2]
@@ -370,6 +480,16 @@ class CrossAttn(nn.Module):
 
 		real_iQ, real_iK, real_iV = real_iQ.transpose(1, 2), real_iK.permute(0, 2, 3, 1), real_iV.transpose(1, 2)
 
+		if self.chunk_size > 0:
+			oMA = chunked_attn(real_iQ, real_iK, real_iV, mask, self.chunk_size, self.normer, self.drop).transpose(1, 2).contiguous()
+
+			return self.outer(oMA.view(bsize, nquery, self.hsize))
+
+		if self.use_sdpa:
+			oMA = sdpa_attn(real_iQ, real_iK, real_iV, mask, self.drop.p if self.training and (self.drop is not None) else 0.0).transpose(1, 2).contiguous()
+
+			return self.outer(oMA.view(bsize, nquery, self.hsize))
+
 		scores = real_iQ.matmul(real_iK) / sqrt(adim)
 
 		if mask is not None:
@@ -384,6 +504,17 @@ class CrossAttn(nn.Module):
 
 		return self.outer(oMA.view(bsize, nquery, self.hsize))
 
+	# heads: kept heads (list of indexes)
+
+	def prune(self, heads):
+
+		_index = get_head_index(heads, self.num_head, self.attn_dim)
+		select_linear(self.query_adaptor, _index)
+		select_linear(self.kv_adaptor, get_head_index(heads, self.num_head, self.attn_dim, 2))
+		select_linear(self.outer, _index, 1)
+		self.num_head = len(heads)
+		self.hsize = self.attn_dim * self.num_head
+
 # Aggregation from: Exploiting Deep Representations for Neural Machine Translation
 class ResidueCombiner(nn.Module):
 
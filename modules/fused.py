@@ -0,0 +1,118 @@
+#encoding: utf-8
+
+import torch
+from torch import nn
+from torch.nn import functional as nnFunc
+from torch.autograd import Function
+
+# generate the scaled dropout noise in the same way as the (non-fused) dropout of pytorch on CPU, so that the random state is consumed identically and results of fused layers match those of the standard modules with the same seed.
+
+def dropout_noise(x, p):
+
+	return torch.empty_like(x).bernoulli_(1.0 - p).div_(1.0 - p)
+
+# out = dropout(x) + res, normed = LayerNorm(out), only out and the dropout mask are saved for the backward pass, statistics of the layer normalization are recomputed.
+
+class DropResidualNormFunction(Function):
+
+	@staticmethod
+	def forward(ctx, x, res, weight, bias, p, eps):
+
+		if p > 0.0:
+			noise = dropout_noise(x, p)
+			out = x * noise + res
+			mask = noise.gt(0.0)
+		else:
+			out = x + res
+			mask = None
+		normed = nnFunc.layer_norm(out, out.size()[-1:], weight, bias, eps)
+
+		ctx.p, ctx.eps, ctx.has_bias = p, eps, bias is not None
+		ctx.save_for_backward(out, weight, mask)
+
+		return out, normed
+
+	@staticmethod
+	def backward(ctx, grad_out, grad_normed):
+
+		out, weight, mask = ctx.saved_tensors
+		isize = out.size(-1)
+
+		xmu = out - out.mean(-1, keepdim=True)
+		rstd = (xmu.pow(2).mean(-1, keepdim=True) + ctx.eps).rsqrt()
+		xhat = xmu * rstd
+
+		_g = grad_normed if weight is None else grad_normed * weight
+		grad_in = rstd * (_g - _g.mean(-1, keepdim=True) - xhat * (_g * xhat).mean(-1, keepdim=True))
+		if grad_out is not None:
+			grad_in = grad_in + grad_out
+
+		grad_weight = (grad_normed * xhat).view(-1, isize).sum(0) if (weight is not None) and ctx.needs_input_grad[2] else None
+		grad_bias = grad_normed.reshape(-1, isize).sum(0) if ctx.has_bias and ctx.needs_input_grad[3] else None
+		grad_x = grad_in if mask is None else grad_in.masked_fill(~mask, 0.0).div_(1.0 - ctx.p)
+
+		return grad_x, grad_in, grad_weight, grad_bias, None, None
+
+# out = dropout(relu(x + bias)) computed in-place on x (the output of a linear transformation without bias), only a bool mask is saved for the backward pass.
+
+class BiasReLUDropoutFunction(Function):
+
+	@staticmethod
+	def forward(ctx, x, bias, p):
+
+		ctx.mark_dirty(x)
+		out = x.add_(bias).relu_()
+		if p > 0.0:
+			out.mul_(dropout_noise(out, p))
+		mask = out.gt(0.0)
+
+		ctx.p = p
+		ctx.save_for_backward(mask)
+
+		return out
+
+	@staticmethod
+	def backward(ctx, grad_out):
+
+		mask = ctx.saved_tensors[0]
+		grad_x = grad_out.masked_fill(~mask, 0.0)
+		if ctx.p > 0.0:
+			grad_x.div_(1.0 - ctx.p)
+		grad_bias = grad_x.view(-1, grad_x.size(-1)).sum(0) if ctx.needs_input_grad[1] else None
+
+		return grad_x, grad_bias, None
+
+# x: output of the attention
+# res: residual
+# normer: nn.LayerNorm applied on the sum
+# returns: (dropout(x) + res, normer(dropout(x) + res))
+
+def drop_residual_norm(x, res, normer, p=0.0):
+
+	return DropResidualNormFunction.apply(x, res, normer.weight, normer.bias, p, normer.eps)
+
+def get_ff_drop(ff):
+
+	return ff.net[2].p if len(ff.net) > 3 else 0.0
+
+# only PositionwiseFF with ReLU activation can be fused
+
+def can_fuse_ff(ff):
+
+	return isinstance(ff.net[1], nn.ReLU)
+
+# the fused equivalent of PositionwiseFF.forward with the layer normalization already computed together with the residual connection of the attention.
+# x: input of ff
+# _x: ff.normer(x)
+
+def fused_ff(ff, x, _x):
+
+	lin1, lin2 = ff.net[0], ff.net[-2 if len(ff.net) > 3 else -1]
+	p = get_ff_drop(ff) if ff.training else 0.0
+
+	out = BiasReLUDropoutFunction.apply(nnFunc.linear(_x, lin1.weight), lin1.bias, p)
+	out = lin2(out)
+	if p > 0.0:
+		out = nnFunc.dropout(out, p=p, training=True, inplace=True)
+
+	return out + (_x if ff.norm_residual else x)
@@ -1,10 +1,27 @@
 #encoding: utf-8
 
+import torch
 from torch.optim.optimizer import Optimizer
 
+from optm.multi_tensor import has_foreach, foreach_copy_
+
+# params = alpha * params + (1 - alpha) * cached_params, cached_params = params
+
+def lookahead_update(params, cached_params, alpha):
+
+	if has_foreach:
+		torch._foreach_mul_(params, alpha)
+		torch._foreach_add_(params, cached_params, alpha=1.0 - alpha)
+	else:
+		for p, cp in zip(params, cached_params):
+			p.mul_(alpha).add_(cp, alpha=1.0 - alpha)
+	foreach_copy_(cached_params, params)
+
 class Lookahead(Optimizer):
 
-	def __init__(self, params, optimizer, steps=5, alpha=0.8, pullback_momentum=None):
+	# multi_tensor: interpolate and cache all parameters with torch._foreach_* functions, only used without pullback_momentum.
+
+	def __init__(self, params, optimizer, steps=5, alpha=0.8, pullback_momentum=None, multi_tensor=False):
 
 		super(Lookahead, self).__init__(params, {})
 
@@ -12,7 +29,8 @@ class Lookahead(Optimizer):
 		self.cur_step = 0
 		self.alpha = alpha
 		self.steps = steps
-		self.pullback_momentum = pullback_momentum.lower()
+		self.pullback_momentum = None if pullback_momentum is None else pullback_momentum.lower()
+		self.multi_tensor = multi_tensor and (self.pullback_momentum is None)
 
 	def step(self, closure=None):
 
@@ -22,27 +40,50 @@ class Lookahead(Optimizer):
 		if self.cur_step >= self.steps:
 			self.cur_step = 0
 			# Lookahead and cache the current optimizer parameters
-			for group in self.optimizer.param_groups:
+			if self.multi_tensor:
+				self.step_multi_tensor()
+			else:
+				for group in self.optimizer.param_groups:
 
-				for p in group['params']:
+					for p in group['params']:
 
-					if p.grad is not None:
+						if p.grad is not None:
 
-						state = self.state[p]
+							state = self.state[p]
 
-						if len(state) == 0:
-							state['cached_params'] = p.data.clone()
-							if self.pullback_momentum == "pullback":
-								state['cached_mom'] = p.data.new_zeros(p.data.size())
-						else:
-							p.data.mul_(self.alpha).add_(1.0 - self.alpha, state['cached_params'])
-							state['cached_params'].copy_(p.data)
-							if self.pullback_momentum == "pullback":
-								internal_momentum = self.optimizer.state[p]["momentum_buffer"]
-								self.optimizer.state[p]["momentum_buffer"] = internal_momentum.mul_(self.alpha).add_(
-									1.0 - self.alpha, state["cached_mom"])
-								state["cached_mom"] = self.optimizer.state[p]["momentum_buffer"]
-							elif self.pullback_momentum == "reset":
-								self.optimizer.state[p]["momentum_buffer"] = torch.zeros_like(p.data)
+							if len(state) == 0:
+								state['cached_params'] = p.data.clone()
+								if self.pullback_momentum == "pullback":
+									state['cached_mom'] = p.data.new_zeros(p.data.size())
+							else:
+								p.data.mul_(self.alpha).add_(1.0 - self.alpha, state['cached_params'])
+								state['cached_params'].copy_(p.data)
+								if self.pullback_momentum == "pullback":
+									internal_momentum = self.optimizer.state[p]["momentum_buffer"]
+									self.optimizer.state[p]["momentum_buffer"] = internal_momentum.mul_(self.alpha).add_(
+										1.0 - self.alpha, state["cached_mom"])
+									state["cached_mom"] = self.optimizer.state[p]["momentum_buffer"]
+								elif self.pullback_momentum == "reset":
+									self.optimizer.state[p]["momentum_buffer"] = torch.zeros_like(p.data)
 
 		return loss
+
+	def step_multi_tensor(self):
+
+		_params, _cached_params = [], []
+		for group in self.optimizer.param_groups:
+
+			for p in group['params']:
+
+				if p.grad is not None:
+
+					state = self.state[p]
+
+					if len(state) == 0:
+						state['cached_params'] = p.data.clone()
+					else:
+						_params.append(p.data)
+						_cached_params.append(state['cached_params'])
+
+		if _params:
+			lookahead_update(_params, _cached_params, self.alpha)
@@ -0,0 +1,114 @@
+#encoding: utf-8
+
+# helpers for multi-tensor optimizer steps: element-wise updates of a list of tensors are performed with torch._foreach_* functions (pytorch >= 1.7) in a few kernel launches instead of several launches per parameter, and parameters/gradients/optimizer states can be bound to views of flat contiguous buffers, so that each update is a single element-wise operation on the whole buffer.
+
+import torch
+
+has_foreach = hasattr(torch, "_foreach_add_")
+
+def flat_views(flat, plist):
+
+	rs, _off = [], 0
+	for para in plist:
+		_n = para.numel()
+		rs.append(flat.narrow(0, _off, _n).view_as(para))
+		_off += _n
+
+	return rs
+
+# bind parameters and gradients of plist to views of flat buffers, one pair of buffers for each (dtype, device). Parameters must not be replaced afterwards, and gradients replaced by other tensors (instead of being accumulated in-place) are copied back into the flat buffer by check_flat_grads.
+# returns: a list of dicts with plist, params (flat parameters), grads (flat gradients), gviews (views of grads for each parameter)
+
+def flatten_params(plist):
+
+	_groups = {}
+	for para in plist:
+		_key = (para.dtype, para.device,)
+		if _key in _groups:
+			_groups[_key].append(para)
+		else:
+			_groups[_key] = [para]
+
+	rs = []
+	for _pl in _groups.values():
+		_flat_p = torch.cat([para.data.view(-1) for para in _pl], 0)
+		_flat_g = _flat_p.new_zeros(_flat_p.size())
+		_gviews = flat_views(_flat_g, _pl)
+		for para, _vp, _vg in zip(_pl, flat_views(_flat_p, _pl), _gviews):
+			para.data = _vp
+			if para.grad is not None:
+				_vg.copy_(para.grad)
+			para.grad = _vg
+		rs.append({"plist": _pl, "params": _flat_p, "grads": _flat_g, "gviews": _gviews})
+
+	return rs
+
+def check_flat_grads(fgroup):
+
+	for para, _vg in zip(fgroup["plist"], fgroup["gviews"]):
+		if para.grad is not _vg:
+			if para.grad is None:
+				_vg.zero_()
+			else:
+				_vg.copy_(para.grad)
+			para.grad = _vg
+
+def zero_flat_grads(fgroup):
+
+	check_flat_grads(fgroup)
+	fgroup["grads"].zero_()
+
+# build a flat state buffer (zeros, or a copy of parameters with clone_params) and bind per-parameter states to its views, so that state_dict() works as for per-parameter states.
+
+def init_flat_state(state, fgroup, key, clone_params=False):
+
+	_buf = fgroup["params"].clone() if clone_params else fgroup["params"].new_zeros(fgroup["params"].size())
+	for para, _v in zip(fgroup["plist"], flat_views(_buf, fgroup["plist"])):
+		state[para][key] = _v
+	fgroup[key] = _buf
+
+	return _buf
+
+# copy per-parameter states (e.g. loaded by load_state_dict) into flat buffers and bind them again
+
+def rebind_flat_state(state, fgroup, keys):
+
+	for key in keys:
+		if key in fgroup:
+			_buf = fgroup[key]
+			for para, _v in zip(fgroup["plist"], flat_views(_buf, fgroup["plist"])):
+				_s = state[para]
+				if key in _s:
+					if _s[key] is not _v:
+						_v.copy_(_s[key])
+				_s[key] = _v
+
+# the step of flat buffers is written to per-parameter states only when states are saved
+
+def sync_flat_step(state, flat_groups):
+
+	for fgroups in flat_groups:
+		for fgroup in fgroups:
+			if "step" in fgroup:
+				for para in fgroup["plist"]:
+					state[para]["step"] = fgroup["step"]
+
+def load_flat_state(state, flat_groups, keys):
+
+	for fgroups in flat_groups:
+		for fgroup in fgroups:
+			_steps = [state[para]["step"] for para in fgroup["plist"] if "step" in state[para]]
+			if _steps:
+				for key in keys:
+					if key not in fgroup:
+						fgroup[key] = fgroup["params"].new_zeros(fgroup["params"].size())
+				rebind_flat_state(state, fgroup, keys)
+				fgroup["step"] = max(_steps)
+
+def foreach_copy_(tgt, src):
+
+	if hasattr(torch, "_foreach_copy_"):
+		torch._foreach_copy_(tgt, src)
+	else:
+		for _t, _s in zip(tgt, src):
+			_t.copy_(_s)
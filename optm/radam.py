@@ -2,12 +2,74 @@
 
 # Portal from: https://github.com/LiyuanLucasLiu/RAdam/blob/master/radam.py
 
+import torch
 from math import sqrt
 from torch.optim.optimizer import Optimizer
 
+from optm.multi_tensor import has_foreach, flatten_params, check_flat_grads, zero_flat_grads, init_flat_state, sync_flat_step, load_flat_state
+
+# returns: (N_sma, step_size) of step _cur_step, cached in group['buffer']
+
+def get_step_size(group, _cur_step, N_sma_threshhold, degenerated_to_sgd):
+
+	beta1, beta2 = group['betas']
+	buffered = group['buffer'][int(_cur_step % 10)]
+	if _cur_step == buffered[0]:
+		N_sma, step_size = buffered[1], buffered[2]
+	else:
+		buffered[0] = _cur_step
+		beta2_t = beta2 ** _cur_step
+		N_sma_max = 2 / (1 - beta2) - 1
+		N_sma = N_sma_max - 2 * _cur_step * beta2_t / (1 - beta2_t)
+		buffered[1] = N_sma
+
+		# more conservative since it's an approximated value
+		if N_sma >= N_sma_threshhold:
+			step_size = sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** _cur_step)
+		elif degenerated_to_sgd:
+			step_size = 1.0 / (1 - beta1 ** _cur_step)
+		else:
+			step_size = -1
+		buffered[2] = step_size
+
+	return N_sma, step_size
+
+# the multi-tensor equivalent of the per-parameter update in RAdam.step, params, grads, exp_avgs and exp_avg_sqs are lists of tensors (or lists of flat buffers) sharing the same step.
+
+def radam_update(params, grads, exp_avgs, exp_avg_sqs, group, N_sma, step_size, N_sma_threshhold):
+
+	beta1, beta2 = group['betas']
+	_wd_lr = group['weight_decay'] * group['lr']
+	if has_foreach:
+		torch._foreach_mul_(exp_avg_sqs, beta2)
+		torch._foreach_addcmul_(exp_avg_sqs, grads, grads, value=1 - beta2)
+		torch._foreach_mul_(exp_avgs, beta1)
+		torch._foreach_add_(exp_avgs, grads, alpha=1 - beta1)
+		if group['weight_decay'] > 0.0:
+			torch._foreach_add_(params, params, alpha=-_wd_lr)
+		if N_sma >= N_sma_threshhold:
+			denom = torch._foreach_sqrt(exp_avg_sqs)
+			torch._foreach_add_(denom, group['eps'])
+			torch._foreach_addcdiv_(params, exp_avgs, denom, value=-step_size * group['lr'])
+		elif step_size > 0:
+			torch._foreach_add_(params, exp_avgs, alpha=-step_size * group['lr'])
+	else:
+		for p, g, exp_avg, exp_avg_sq in zip(params, grads, exp_avgs, exp_avg_sqs):
+			exp_avg_sq.mul_(beta2).addcmul_(g, g, value=1 - beta2)
+			exp_avg.mul_(beta1).add_(g, alpha=1 - beta1)
+			if group['weight_decay'] > 0.0:
+				p.add_(p, alpha=-_wd_lr)
+			if N_sma >= N_sma_threshhold:
+				p.addcdiv_(exp_avg, exp_avg_sq.sqrt().add_(group['eps']), value=-step_size * group['lr'])
+			elif step_size > 0:
+				p.add_(exp_avg, alpha=-step_size * group['lr'])
+
 class RAdam(Optimizer):
 
-	def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0, N_sma_threshhold=5, degenerated_to_sgd=True):
+	# multi_tensor: update all parameters of a group sharing the same step with torch._foreach_* functions, which launches a few kernels per group rather than several kernels per parameter, the update is the same as the per-parameter implementation.
+	# flat_buffer: bind parameters, gradients and optimizer states to views of flat contiguous buffers (implies multi_tensor), so that each update is one element-wise operation on the whole buffer. All parameters are updated at every step in this case (missing gradients are treated as zeros), and parameters must not be replaced after the optimizer is built.
+
+	def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0, N_sma_threshhold=5, degenerated_to_sgd=True, multi_tensor=False, flat_buffer=False):
 
 		defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, buffer=[[None, None, None] for _ in range(10)])
 		super(RAdam, self).__init__(params, defaults)
@@ -15,8 +77,16 @@ class RAdam(Optimizer):
 		self.N_sma_threshhold = N_sma_threshhold
 		self.degenerated_to_sgd = degenerated_to_sgd
 
+		self.multi_tensor = multi_tensor or flat_buffer
+		self.flat_groups = [flatten_params(group['params']) for group in self.param_groups] if flat_buffer else None
+
 	def step(self, closure=None):
 
+		if self.flat_groups is not None:
+			return self.step_flat(closure)
+		if self.multi_tensor:
+			return self.step_multi_tensor(closure)
+
 		loss = None if closure is None else closure()
 
 		for group in self.param_groups:
@@ -39,24 +109,7 @@ class RAdam(Optimizer):
 					exp_avg.mul_(beta1).add_(1 - beta1, p.grad)
 
 					_cur_step = state['step'] = state['step'] + 1
-					buffered = group['buffer'][int(_cur_step % 10)]
-					if _cur_step == buffered[0]:
-						N_sma, step_size = buffered[1], buffered[2]
-					else:
-						buffered[0] = _cur_step
-						beta2_t = beta2 ** _cur_step
-						N_sma_max = 2 / (1 - beta2) - 1
-						N_sma = N_sma_max - 2 * _cur_step * beta2_t / (1 - beta2_t)
-						buffered[1] = N_sma
-
-						# more conservative since it's an approximated value
-						if N_sma >= self.N_sma_threshhold:
-							step_size = sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** _cur_step)
-						elif self.degenerated_to_sgd:
-							step_size = 1.0 / (1 - beta1 ** _cur_step)
-						else:
-							step_size = -1
-						buffered[2] = step_size
+					N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
 
 					if group['weight_decay'] > 0.0:
 						p.data.add_(-group['weight_decay'] * group['lr'], p.data)
@@ -69,3 +122,75 @@ class RAdam(Optimizer):
 						p.data.add_(-step_size * group['lr'], exp_avg)
 
 		return loss
+
+	def step_multi_tensor(self, closure=None):
+
+		loss = None if closure is None else closure()
+
+		for group in self.param_groups:
+
+			# parameters are grouped by their step, which only differs if some of them did not receive gradients in previous steps
+			_tensors = {}
+			for p in group['params']:
+
+				if p.grad is not None:
+
+					state = self.state[p]
+
+					if len(state) == 0:
+						state['step'] = 0
+						state['exp_avg'] = p.data.new_zeros(p.data.size())
+						state['exp_avg_sq'] = p.data.new_zeros(p.data.size())
+
+					_cur_step = state['step'] = state['step'] + 1
+					if _cur_step not in _tensors:
+						_tensors[_cur_step] = ([], [], [], [],)
+					for _l, _t in zip(_tensors[_cur_step], (p.data, p.grad, state['exp_avg'], state['exp_avg_sq'],)):
+						_l.append(_t)
+
+			for _cur_step, (_params, _grads, _exp_avgs, _exp_avg_sqs,) in _tensors.items():
+				N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
+				radam_update(_params, _grads, _exp_avgs, _exp_avg_sqs, group, N_sma, step_size, self.N_sma_threshhold)
+
+		return loss
+
+	def step_flat(self, closure=None):
+
+		loss = None if closure is None else closure()
+
+		for group, fgroups in zip(self.param_groups, self.flat_groups):
+			for fgroup in fgroups:
+				check_flat_grads(fgroup)
+				if "exp_avg" not in fgroup:
+					init_flat_state(self.state, fgroup, 'exp_avg')
+					init_flat_state(self.state, fgroup, 'exp_avg_sq')
+					fgroup['step'] = 0
+				_cur_step = fgroup['step'] = fgroup['step'] + 1
+				N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
+				radam_update([fgroup['params']], [fgroup['grads']], [fgroup['exp_avg']], [fgroup['exp_avg_sq']], group, N_sma, step_size, self.N_sma_threshhold)
+
+		return loss
+
+	# gradients stay views of the flat buffer with flat_buffer, they are zeroed rather than set to None
+
+	def zero_grad(self, *args, **kwargs):
+
+		if self.flat_groups is None:
+			super(RAdam, self).zero_grad(*args, **kwargs)
+		else:
+			for fgroups in self.flat_groups:
+				for fgroup in fgroups:
+					zero_flat_grads(fgroup)
+
+	def state_dict(self):
+
+		if self.flat_groups is not None:
+			sync_flat_step(self.state, self.flat_groups)
+
+		return super(RAdam, self).state_dict()
+
+	def load_state_dict(self, state_dict):
+
+		super(RAdam, self).load_state_dict(state_dict)
+		if self.flat_groups is not None:
+			load_flat_state(self.state, self.flat_groups, ('exp_avg', 'exp_avg_sq',))
@@ -1,11 +1,16 @@
 # Efficient combination of RAdam and Lookahead.
 
-from math import sqrt
 from torch.optim.optimizer import Optimizer
 
+from optm.radam import get_step_size, radam_update
+from optm.lookahead import lookahead_update
+from optm.multi_tensor import flatten_params, check_flat_grads, zero_flat_grads, init_flat_state, sync_flat_step, load_flat_state
+
 class Ranger(Optimizer):
 
-	def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0, N_sma_threshhold=5, steps=5, alpha=0.8, degenerated_to_sgd=True):
+	# multi_tensor and flat_buffer: see optm.radam.RAdam
+
+	def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8, weight_decay=0.0, N_sma_threshhold=5, steps=5, alpha=0.8, degenerated_to_sgd=True, multi_tensor=False, flat_buffer=False):
 
 		defaults = dict(lr=lr, betas=betas, eps=eps, weight_decay=weight_decay, buffer=[[None, None, None] for _ in range(10)])
 		super(Ranger, self).__init__(params, defaults)
@@ -17,6 +22,9 @@ class Ranger(Optimizer):
 		self.alpha = alpha
 		self.steps = steps
 
+		self.multi_tensor = multi_tensor or flat_buffer
+		self.flat_groups = [flatten_params(group['params']) for group in self.param_groups] if flat_buffer else None
+
 	def step(self, closure=None):
 
 		loss = None if closure is None else closure()
@@ -28,6 +36,17 @@ class Ranger(Optimizer):
 		else:
 			look_ahead_step = False
 
+		if self.flat_groups is not None:
+			self.step_flat(look_ahead_step)
+		elif self.multi_tensor:
+			self.step_multi_tensor(look_ahead_step)
+		else:
+			self.step_per_param(look_ahead_step)
+
+		return loss
+
+	def step_per_param(self, look_ahead_step):
+
 		for group in self.param_groups:
 
 			for p in group['params']:
@@ -49,24 +68,7 @@ class Ranger(Optimizer):
 					exp_avg.mul_(beta1).add_(1 - beta1, p.grad)
 
 					_cur_step = state['step'] = state['step'] + 1
-					buffered = group['buffer'][int(_cur_step % 10)]
-					if _cur_step == buffered[0]:
-						N_sma, step_size = buffered[1], buffered[2]
-					else:
-						buffered[0] = _cur_step
-						beta2_t = beta2 ** _cur_step
-						N_sma_max = 2 / (1 - beta2) - 1
-						N_sma = N_sma_max - 2 * _cur_step * beta2_t / (1 - beta2_t)
-						buffered[1] = N_sma
-
-						# more conservative since it's an approximated value
-						if N_sma >= self.N_sma_threshhold:
-							step_size = sqrt((1 - beta2_t) * (N_sma - 4) / (N_sma_max - 4) * (N_sma - 2) / N_sma * N_sma_max / (N_sma_max - 2)) / (1 - beta1 ** _cur_step)
-						elif self.degenerated_to_sgd:
-							step_size = 1.0 / (1 - beta1 ** _cur_step)
-						else:
-							step_size = -1
-						buffered[2] = step_size
+					N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
 
 					if group['weight_decay'] > 0.0:
 						p.data.add_(-group['weight_decay'] * group['lr'], p.data)
@@ -82,4 +84,69 @@ class Ranger(Optimizer):
 						p.data.mul_(self.alpha).add_(1.0 - self.alpha, state['cached_params'])
 						state['cached_params'].copy_(p.data)
 
-		return loss
+	def step_multi_tensor(self, look_ahead_step):
+
+		for group in self.param_groups:
+
+			_tensors = {}
+			for p in group['params']:
+
+				if p.grad is not None:
+
+					state = self.state[p]
+
+					if len(state) == 0:
+						state['step'] = 0
+						state['exp_avg'] = p.data.new_zeros(p.data.size())
+						state['exp_avg_sq'] = p.data.new_zeros(p.data.size())
+						state['cached_params'] = p.data.clone()
+
+					_cur_step = state['step'] = state['step'] + 1
+					if _cur_step not in _tensors:
+						_tensors[_cur_step] = ([], [], [], [], [],)
+					for _l, _t in zip(_tensors[_cur_step], (p.data, p.grad, state['exp_avg'], state['exp_avg_sq'], state['cached_params'],)):
+						_l.append(_t)
+
+			for _cur_step, (_params, _grads, _exp_avgs, _exp_avg_sqs, _cached_params,) in _tensors.items():
+				N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
+				radam_update(_params, _grads, _exp_avgs, _exp_avg_sqs, group, N_sma, step_size, self.N_sma_threshhold)
+				if look_ahead_step:
+					lookahead_update(_params, _cached_params, self.alpha)
+
+	def step_flat(self, look_ahead_step):
+
+		for group, fgroups in zip(self.param_groups, self.flat_groups):
+			for fgroup in fgroups:
+				check_flat_grads(fgroup)
+				if "exp_avg" not in fgroup:
+					init_flat_state(self.state, fgroup, 'exp_avg')
+					init_flat_state(self.state, fgroup, 'exp_avg_sq')
+					init_flat_state(self.state, fgroup, 'cached_params', clone_params=True)
+					fgroup['step'] = 0
+				_cur_step = fgroup['step'] = fgroup['step'] + 1
+				N_sma, step_size = get_step_size(group, _cur_step, self.N_sma_threshhold, self.degenerated_to_sgd)
+				radam_update([fgroup['params']], [fgroup['grads']], [fgroup['exp_avg']], [fgroup['exp_avg_sq']], group, N_sma, step_size, self.N_sma_threshhold)
+				if look_ahead_step:
+					lookahead_update([fgroup['params']], [fgroup['cached_params']], self.alpha)
+
+	def zero_grad(self, *args, **kwargs):
+
+		if self.flat_groups is None:
+			super(Ranger, self).zero_grad(*args, **kwargs)
+		else:
+			for fgroups in self.flat_groups:
+				for fgroup in fgroups:
+					zero_flat_grads(fgroup)
+
+	def state_dict(self):
+
+		if self.flat_groups is not None:
+			sync_flat_step(self.state, self.flat_groups)
+
+		return super(Ranger, self).state_dict()
+
+	def load_state_dict(self, state_dict):
+
+		super(Ranger, self).load_state_dict(state_dict)
+		if self.flat_groups is not None:
+			load_flat_state(self.state, self.flat_groups, ('exp_avg', 'exp_avg_sq', 'cached_params',))
@@ -0,0 +1,205 @@
+#encoding: utf-8
+
+# ZeRO stage 1 (ZeRO: Memory Optimizations Toward Training Trillion Parameter Models, https://arxiv.org/abs/1910.02054): optimizer states are partitioned across data-parallel processes, each process updates its own shard of parameters with full (all-reduced) gradients, and updated parameters are then broadcast from their owners.
+
+import torch
+import torch.distributed as dist
+from torch.optim.optimizer import Optimizer
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+
+from os.path import exists as p_check
+
+from parallel.dist import get_rank, get_world_size, is_master
+from utils.h5serial import h5save, h5load
+
+from cnfg.ihyp import *
+
+# assign the largest remaining parameter to the process with the fewest elements so far, to balance optimizer states across processes.
+# returns: the owner rank of each parameter
+
+def partition_params(plist, nrank):
+
+	_sizes = [0 for _ in range(nrank)]
+	rs = [0 for _ in plist]
+	for _ind in sorted(range(len(plist)), key=lambda _i: -plist[_i].numel()):
+		_rank = min(range(nrank), key=lambda _i: _sizes[_i])
+		rs[_ind] = _rank
+		_sizes[_rank] += plist[_ind].numel()
+
+	return rs
+
+def cpu_state(state):
+
+	return {k: (v.cpu() if isinstance(v, torch.Tensor) else v) for k, v in state.items()}
+
+class ShardedOptimizer(Optimizer):
+
+	# params: parameters (or parameter groups) of the whole model, learning rate schedulers (e.g. GoogleLR) work on param_groups of this wrapper
+	# optm_func: the optimizer class (e.g. optim.Adam, optm.radam.RAdam, optm.ranger.Ranger) or a function building the optimizer with (params, **kwargs)
+	# gather_state: state_dict() gathers the states of all processes to the first process, which is the state dict of the non-sharded optimizer on the whole model. Otherwise state_dict() only returns the local shard, which should be saved by each process separately.
+	# kwargs: arguments of optm_func
+
+	def __init__(self, params, optm_func, gather_state=True, **kwargs):
+
+		super(ShardedOptimizer, self).__init__(params, kwargs)
+
+		self.rank, self.world_size = get_rank(), get_world_size()
+		self.gather_state = gather_state
+
+		_plist = [para for group in self.param_groups for para in group["params"]]
+		self.owner = partition_params(_plist, self.world_size)
+		self.local_ind = [_ind for _ind, _rank in enumerate(self.owner) if _rank == self.rank]
+		self.local_pos = {_ind: _pos for _pos, _ind in enumerate(self.local_ind)}
+
+		_owner = dict(zip([id(para) for para in _plist], self.owner))
+		_groups = []
+		for group in self.param_groups:
+			_group = {k: v for k, v in group.items() if k != "params"}
+			_group["params"] = [para for para in group["params"] if _owner[id(para)] == self.rank]
+			_groups.append(_group)
+		self.optimizer = optm_func(_groups, **kwargs) if self.local_ind else None
+
+		# parameters broadcast together share the owner, the dtype and the device
+		self.bcast_groups = []
+		for _rank in range(self.world_size):
+			_bg = {}
+			for para, _prank in zip(_plist, self.owner):
+				if _prank == _rank:
+					_key = (para.dtype, para.device,)
+					if _key in _bg:
+						_bg[_key].append(para)
+					else:
+						_bg[_key] = [para]
+			self.bcast_groups.extend([(_rank, _pl,) for _pl in _bg.values()])
+
+	# hyper parameters (e.g. lr set by the scheduler) of the wrapper are copied to the local optimizer before each step
+
+	def step(self, closure=None):
+
+		if self.optimizer is None:
+			loss = None if closure is None else closure()
+		else:
+			for group, _group in zip(self.param_groups, self.optimizer.param_groups):
+				for k, v in group.items():
+					if k != "params":
+						_group[k] = v
+			loss = self.optimizer.step(closure)
+
+		self.sync_params()
+
+		return loss
+
+	def sync_params(self):
+
+		_works = []
+		for _src, _pl in self.bcast_groups:
+			_flat = _flatten_dense_tensors([para.data for para in _pl])
+			_works.append((dist.broadcast(_flat, _src, async_op=True), _flat, _src, _pl,))
+		for _work, _flat, _src, _pl in _works:
+			_work.wait()
+			if _src != self.rank:
+				for para, _t in zip(_pl, _unflatten_dense_tensors(_flat, _pl)):
+					para.data.copy_(_t)
+
+	# states are indexed by the parameter index in the whole model, as in the state dict of the non-sharded optimizer.
+
+	def local_state_dict(self):
+
+		_state, _hyper_groups = {}, self.param_groups
+		if self.optimizer is not None:
+			_sd = self.optimizer.state_dict()
+			_state = {self.local_ind[k]: cpu_state(v) for k, v in _sd["state"].items()}
+			_hyper_groups = _sd["param_groups"]
+		_param_groups, _ind = [], 0
+		for group, _hgroup in zip(self.param_groups, _hyper_groups):
+			_group = {k: v for k, v in _hgroup.items() if k != "params"}
+			_group.update({k: v for k, v in group.items() if k != "params"})
+			_nind = _ind + len(group["params"])
+			_group["params"] = list(range(_ind, _nind))
+			_ind = _nind
+			_param_groups.append(_group)
+
+		return {"state": _state, "param_groups": _param_groups}
+
+	# with gather_state, all processes must call this function, and only the result of the first process is complete.
+
+	def state_dict(self):
+
+		rs = self.local_state_dict()
+		if self.gather_state and (self.world_size > 1):
+			_state = {}
+			for _src in range(self.world_size):
+				_obj = [rs["state"] if _src == self.rank else None]
+				dist.broadcast_object_list(_obj, src=_src)
+				if is_master():
+					_state.update(_obj[0])
+			rs["state"] = {k: _state[k] for k in sorted(_state.keys())}
+
+		return rs
+
+	# both the gathered and the sharded state dict (saved with the same number of processes) are supported, each process only loads states of its own parameters. Only hyper parameters given to the wrapper (self.defaults) are restored for parameter groups, other entries (e.g. the step buffer of RAdam) are kept.
+
+	def load_state_dict(self, state_dict):
+
+		_state = state_dict["state"]
+		_state = dict(enumerate(_state)) if isinstance(_state, (list, tuple,)) else {int(k): v for k, v in _state.items()}
+		_groups = state_dict["param_groups"]
+		for group, _group in zip(self.param_groups, _groups):
+			for k in self.defaults.keys():
+				if k in _group:
+					group[k] = _group[k]
+		if self.optimizer is not None:
+			_param_groups = []
+			for group, _group in zip(self.optimizer.param_groups, _groups):
+				_lgroup = {k: v for k, v in group.items() if k != "params"}
+				_lgroup.update({k: _group[k] for k in self.defaults.keys() if k in _group})
+				_lgroup["params"] = [self.local_pos[_ind] for _ind in _group["params"] if _ind in self.local_pos]
+				_param_groups.append(_lgroup)
+			self.optimizer.load_state_dict({"state": {self.local_pos[k]: v for k, v in _state.items() if k in self.local_pos}, "param_groups": _param_groups})
+
+def get_shard_fname(fname, rank):
+
+	return fname[:-3] + (".%d.h5" % rank)
+
+# h5 files only keep tensors: python numbers are saved as tensors and None values are dropped.
+
+def state2h5(obj):
+
+	if isinstance(obj, dict):
+		return {str(k): state2h5(v) for k, v in obj.items() if v is not None}
+	elif isinstance(obj, (list, tuple,)):
+		if obj and all(isinstance(_u, (int, float, bool,)) for _u in obj):
+			return torch.as_tensor(obj)
+		return [state2h5(_u) for _u in obj if _u is not None]
+	elif isinstance(obj, (int, float, bool,)):
+		return torch.as_tensor(obj)
+
+	return obj
+
+def h52state(state_dict):
+
+	_groups = [{k: (v.tolist() if isinstance(v, torch.Tensor) else v) for k, v in _group.items()} for _group in state_dict["param_groups"]]
+	_state = state_dict["state"]
+	_state = dict(enumerate(_state)) if isinstance(_state, (list, tuple,)) else {int(k): v for k, v in _state.items()}
+	_state = {k: {sk: (sv.item() if isinstance(sv, torch.Tensor) and (sv.dim() == 0) else sv) for sk, sv in v.items()} for k, v in _state.items()}
+
+	return {"state": _state, "param_groups": _groups}
+
+# all processes should call h5save_optm/h5load_optm, states of non-sharded optimizers are saved by the first process only, sharded states are saved by each process into fname with its rank inserted before ".h5".
+
+def h5save_optm(optm, fname, h5args=h5modelwargs):
+
+	if isinstance(optm, ShardedOptimizer) and (not optm.gather_state):
+		h5save(state2h5(optm.state_dict()), get_shard_fname(fname, optm.rank), h5args=h5args)
+	else:
+		_state = optm.state_dict()
+		if is_master():
+			h5save(state2h5(_state), fname, h5args=h5args)
+
+def h5load_optm(optm, fname):
+
+	if isinstance(optm, ShardedOptimizer):
+		_fname = get_shard_fname(fname, optm.rank)
+		if p_check(_fname):
+			fname = _fname
+	optm.load_state_dict(h52state(h5load(fname)))
@@ -11,10 +11,14 @@ from torch._C import ScriptMethod
 from torch.nn import DataParallel
 
 from threading import Lock, Thread
+from inspect import signature
 
+from optm.multi_tensor import flatten_params, check_flat_grads, zero_flat_grads
 from utils.base import filter_para_grad
 from utils.fmt.base import clean_list
 
+broadcast_out = "out" in signature(comm.broadcast).parameters
+
 """	Example::
 
 		>>> net = DataParallelModel(model, device_ids=[0, 1, 2])
@@ -26,10 +30,12 @@ from utils.fmt.base import clean_list
 class DataParallelModel(DataParallel):
 
 	# host replicates should improve a little bit performance if there are additional calls to update_replicas and collect_gradients in the training scripts.
-	def __init__(self, module, device_ids=None, output_device=None, dim=0, host_replicate=False, gather_output=True):
+	# flat_params: bind trainable parameters and gradients of the module (and of host replicates) to views of one flat buffer per dtype (cnfg/base.py:flat_params), so that zero_grad, reset_grad, collect_gradients and update_replicas perform one operation per buffer. Tied parameters are only counted once. Gradients are zeroed rather than set to None, and parameters must not be replaced afterwards.
+	def __init__(self, module, device_ids=None, output_device=None, dim=0, host_replicate=False, gather_output=True, flat_params=False):
 
 		super(DataParallelModel, self).__init__(module, device_ids, output_device, dim)
 
+		self.flat_groups = flatten_params(filter_para_grad(self.module.parameters())) if flat_params else None
 		if host_replicate and self.device_ids and (len(self.device_ids) > 1):
 			self.make_replicas()
 		else:
@@ -71,11 +77,44 @@ class DataParallelModel(DataParallel):
 	def make_replicas(self):
 
 		self.nets = replicate(self.module, self.device_ids, True)
+		# replicates on other devices get their own flat buffers, in the same order as those of the module, while parameters of the first replicate are those of the module
+		if self.flat_groups is None:
+			self.rep_flat_groups = None
+		else:
+			for fgroup in self.flat_groups:
+				zero_flat_grads(fgroup)
+			self.rep_flat_groups = [flatten_params(filter_para_grad(net.parameters())) for net in self.nets[1:]]
 		self.ngradev = 0
 
+	def zero_flat_grads(self, nrep=None):
+
+		for fgroup in self.flat_groups:
+			zero_flat_grads(fgroup)
+		if self.nets is not None:
+			for fgroups in self.rep_flat_groups[:nrep]:
+				for fgroup in fgroups:
+					fgroup["grads"].zero_()
+
+	def broadcast_flat_params(self):
+
+		if self.nets is None:
+			return
+		for _ind, fgroup in enumerate(self.flat_groups):
+			_out = [fgroups[_ind]["params"] for fgroups in self.rep_flat_groups]
+			if broadcast_out:
+				comm.broadcast(fgroup["params"], out=_out)
+			else:
+				for _t in _out:
+					_t.copy_(fgroup["params"])
+
 	def collect_gradients(self):
 
 		if self.ngradev > 1:
+			if self.flat_groups is not None:
+				for _ind, fgroup in enumerate(self.flat_groups):
+					check_flat_grads(fgroup)
+					fgroup["grads"].copy_(comm.reduce_add([fgroup["grads"]] + [fgroups[_ind]["grads"] for fgroups in self.rep_flat_groups[:self.ngradev - 1]], self.output_device))
+				return
 			# in case some parameters might not be used during the forward propagation on some GPUs: p.data.new_zeros(p.data.size()) if p.grad is None else p.grad instead of p.grad, but in most cases, this can warn you in case you miss the use of some parameters in the forward computation.
 			grads = comm.reduce_add_coalesced([[p.grad for p in filter_para_grad(net.parameters())] for net in self.nets[:self.ngradev]], self.output_device)# if self.ngradev > 1 else [p.grad for p in filter_para_grad(self.nets[0].parameters())]
 			for mp, grad in zip(filter_para_grad(self.module.parameters()), grads):
@@ -85,6 +124,12 @@ class DataParallelModel(DataParallel):
 # Note that gradients will be cleared every time this function was called
 	def update_replicas(self, parallel=False):
 
+		if self.flat_groups is not None:
+			self.broadcast_flat_params()
+			self.zero_flat_grads()
+			self.ngradev = 0
+			return
+
 		params = [para.data for para in filter_para_grad(self.module.parameters())]
 
 		if len(params) > 0:
@@ -100,6 +145,11 @@ class DataParallelModel(DataParallel):
 
 	def update_replicas_para(self, parallel=False):
 
+		if self.flat_groups is not None:
+			self.broadcast_flat_params()
+			self.ngradev = 0
+			return
+
 		params = [para.data for para in filter_para_grad(self.module.parameters())]
 
 		if len(params) > 0:
@@ -113,6 +163,11 @@ class DataParallelModel(DataParallel):
 
 	def zero_grad(self):
 
+		if self.flat_groups is not None:
+			self.zero_flat_grads(None if self.ngradev > 1 else 0)
+			self.ngradev = 0
+			return
+
 		self.module.zero_grad()
 		if self.nets is not None and self.ngradev > 1:
 			# currently, pytorch broadcast binds parameters between self.nets[0] and self.module, so the following line ensures correctness but less efficient
@@ -131,10 +186,19 @@ class DataParallelModel(DataParallel):
 	def zero_replicas_grad(self, func=None):
 
 		if self.nets is not None and self.ngradev > 1:
-			if func is None:
+			if (func is None) and (self.flat_groups is not None):
+				for fgroups in self.rep_flat_groups[:self.ngradev - 1]:
+					for fgroup in fgroups:
+						fgroup["grads"].zero_()
+			elif func is None:
 				for net in self.nets[1:self.ngradev]:
 					for para in filter_para_grad(net.parameters()):
 						para.grad = None
+			elif self.flat_groups is not None:
+				# gradients of replicates stay views of their flat buffers
+				for net in self.nets[1:self.ngradev]:
+					for para in filter_para_grad(func(net).parameters()):
+						para.grad.zero_()
 			else:
 				for net in self.nets[1:self.ngradev]:
 					for para in filter_para_grad(func(net).parameters()):
@@ -142,6 +206,11 @@ class DataParallelModel(DataParallel):
 
 	def reset_grad(self):
 
+		if self.flat_groups is not None:
+			self.zero_flat_grads(self.ngradev - 1 if self.ngradev > 1 else 0)
+			self.ngradev = 0
+			return
+
 		for para in filter_para_grad(self.module.parameters()):
 			para.grad = None
 		if self.nets is not None and self.ngradev > 1:
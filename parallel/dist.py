@@ -0,0 +1,218 @@
+#encoding: utf-8
+
+import torch
+from torch import nn
+import torch.distributed as dist
+from torch.autograd import Variable
+from torch._utils import _flatten_dense_tensors, _unflatten_dense_tensors
+
+from os import environ
+from contextlib import contextmanager
+
+# processes are expected to be launched by torchrun (or torch.distributed.launch with --use_env), which sets RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR and MASTER_PORT.
+# returns: (rank, world_size), (0, 1) if backend is None
+
+def init_dist(backend=None, init_method="env://"):
+
+	if backend is None:
+		return 0, 1
+
+	if not dist.is_initialized():
+		dist.init_process_group(backend, init_method=init_method)
+
+	return dist.get_rank(), dist.get_world_size()
+
+def close_dist():
+
+	if is_dist():
+		dist.destroy_process_group()
+
+def is_dist():
+
+	return dist.is_available() and dist.is_initialized()
+
+def get_rank():
+
+	return dist.get_rank() if is_dist() else 0
+
+def get_world_size():
+
+	return dist.get_world_size() if is_dist() else 1
+
+def get_local_rank():
+
+	return int(environ.get("LOCAL_RANK", 0))
+
+# only the first process saves checkpoints and models
+
+def is_master():
+
+	return get_rank() == 0
+
+# shard a list (or range) of batch ids across processes, all processes get the same number of batches with equal_size so that their gradient reductions stay aligned, the last (len(lin) % world_size) batches are dropped in that case (they change with the shuffling of every epoch).
+
+def shard_data(lin, equal_size=True):
+
+	_nrank = get_world_size()
+	if _nrank == 1:
+		return lin
+	_rank = get_rank()
+
+	return lin[_rank:(len(lin) // _nrank * _nrank):_nrank] if equal_size else lin[_rank::_nrank]
+
+# sum python numbers over all processes
+# device: the device of tensors used for communication, should be the GPU with the nccl backend
+
+def all_reduce_values(*values, device=None):
+
+	_t = torch.as_tensor(values, dtype=torch.double, device=device)
+	dist.all_reduce(_t)
+
+	return _t.tolist()
+
+# broadcast python numbers from the src process
+
+def broadcast_values(*values, src=0, device=None):
+
+	_t = torch.as_tensor(values, dtype=torch.double, device=device)
+	dist.broadcast(_t, src)
+
+	return _t.tolist()
+
+def get_grad_acc(para):
+
+	return para.expand_as(para).grad_fn.next_functions[0][0]
+
+class DistributedModel(nn.Module):
+
+	# module: the model, parameters (and buffers) are broadcast from the first process
+	# bucket_size: size of gradient buckets in MB, gradients of a bucket are all-reduced asynchronously as soon as all of them have been accumulated in the backward pass, overlapping communication with the computation of the remaining gradients.
+	# gradients are summed (rather than averaged) over processes, so that they equal the gradients of the sum of losses over the global batch whatever the number of tokens seen by each process, and normalizing them with the global number of tokens is exact.
+	# set self.require_sync to False (or use no_sync()) for intermediate micro-batches of gradient accumulation, gradients are then accumulated locally and reduced by the backward pass of the last micro-batch (with self.require_sync = True), or by collect_gradients().
+
+	def __init__(self, module, bucket_size=25):
+
+		super(DistributedModel, self).__init__()
+
+		self.module = module
+		self.require_sync = True
+		self.grads_synced = False
+
+		self.broadcast_state()
+		self.build_buckets(int(bucket_size * 1048576))
+		self.register_grad_hooks()
+		self.reset_sync()
+
+	def forward(self, *inputs, **kwargs):
+
+		return self.module(*inputs, **kwargs)
+
+	def broadcast_state(self, src=0):
+
+		with torch.no_grad():
+			for _t in self.module.state_dict().values():
+				dist.broadcast(_t, src)
+
+	# parameters are bucketed in the reverse order of their registration, which is roughly the order in which their gradients are ready, and only tensors with the same device and dtype can be put into the same bucket. Tied weights are only counted once.
+
+	def build_buckets(self, bucket_size):
+
+		self.buckets = []
+		_cur, _csize, _ckey = [], 0, None
+		for para in reversed([_p for _p in self.module.parameters() if _p.requires_grad]):
+			_key = (para.device, para.dtype,)
+			if _cur and ((_key != _ckey) or (_csize >= bucket_size)):
+				self.buckets.append(_cur)
+				_cur, _csize = [], 0
+			_cur.append(para)
+			_csize += para.numel() * para.element_size()
+			_ckey = _key
+		if _cur:
+			self.buckets.append(_cur)
+
+	def register_grad_hooks(self):
+
+		self.grad_accs = []
+		for _bid, _bucket in enumerate(self.buckets):
+			for para in _bucket:
+				if hasattr(para, "register_post_accumulate_grad_hook"):
+					para.register_post_accumulate_grad_hook(self.get_hook(_bid))
+				else:
+					# keep references to AccumulateGrad nodes, otherwise registered hooks are lost
+					_grad_acc = get_grad_acc(para)
+					_grad_acc.register_hook(self.get_hook(_bid))
+					self.grad_accs.append(_grad_acc)
+
+	@contextmanager
+	def no_sync(self):
+
+		_require_sync = self.require_sync
+		self.require_sync = False
+		try:
+			yield
+		finally:
+			self.require_sync = _require_sync
+
+	# reduce gradients accumulated without synchronization, does nothing if they have already been reduced by the last backward pass
+
+	def collect_gradients(self):
+
+		if not self.grads_synced:
+			for _bid in range(len(self.buckets)):
+				self.launch_reduce(_bid)
+			self.wait_reduce()
+		self.grads_synced = False
+
+	def get_hook(self, bid):
+
+		def _hook(*args, **kwargs):
+
+			self.grad_ready(bid)
+
+		return _hook
+
+	def reset_sync(self):
+
+		self.num_pending = [len(_bucket) for _bucket in self.buckets]
+		self.works = [None for _bucket in self.buckets]
+		self.next_bucket = 0
+		self.sync_queued = False
+
+	# collectives must be issued in the same order by all processes, so buckets are launched strictly in their index order.
+
+	def grad_ready(self, bid):
+
+		if not self.require_sync:
+			return
+		if not self.sync_queued:
+			Variable._execution_engine.queue_callback(self.finish_sync)
+			self.sync_queued = True
+		self.num_pending[bid] -= 1
+		while (self.next_bucket < len(self.buckets)) and (self.num_pending[self.next_bucket] == 0):
+			self.launch_reduce(self.next_bucket)
+			self.next_bucket += 1
+
+	def launch_reduce(self, bid):
+
+		_flat = _flatten_dense_tensors([torch.zeros_like(para) if para.grad is None else para.grad for para in self.buckets[bid]])
+		self.works[bid] = (dist.all_reduce(_flat, async_op=True), _flat,)
+
+	# called by the autograd engine at the end of the backward pass, buckets with parameters unused in the forward pass are reduced here.
+
+	def finish_sync(self):
+
+		for _bid in range(self.next_bucket, len(self.buckets)):
+			self.launch_reduce(_bid)
+		self.wait_reduce()
+		self.grads_synced = True
+
+	def wait_reduce(self):
+
+		for _bucket, (_work, _flat,) in zip(self.buckets, self.works):
+			_work.wait()
+			for para, _grad in zip(_bucket, _unflatten_dense_tensors(_flat, _bucket)):
+				if para.grad is None:
+					para.grad = _grad
+				else:
+					para.grad.copy_(_grad)
+		self.reset_sync()
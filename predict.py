@@ -3,7 +3,6 @@
 import sys
 
 import torch
-from torch.cuda.amp import autocast
 
 from tqdm import tqdm
 
@@ -17,14 +16,25 @@ from transformer.EnsembleNMT import NMT as Ensemble
 from parallel.parallelMT import DataParallelMT
 
 from utils.base import *
+from utils.amp import get_amp, fp32_log_softmax
 from utils.fmt.base import ldvocab, reverse_dict, eos_id
 from utils.fmt.base4torch import parse_cuda_decode
+from utils.cpu import get_cpus, setup_threads_cnfg
+from utils.decode import sharded_decode
+from utils.shortlist import load_shortlist
 
 def load_fixing(module):
 
 	if "fix_load" in dir(module):
 		module.fix_load()
 
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, cnfg.multi_gpu_decoding)
+
+# the main process of multi-process decoding is kept single-threaded so that no OpenMP thread pool is started before forking workers
+nproc = 1 if use_cuda else max(cnfg.decode_num_processes, 1)
+if nproc > 1:
+	torch.set_num_threads(1)
+
 td = h5py.File(cnfg.test_data, "r")
 
 ntest = td["ndata"][:].item()
@@ -51,8 +61,9 @@ else:
 
 mymodel.eval()
 
-use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, cnfg.multi_gpu_decoding)
-use_amp = cnfg.use_amp and use_cuda
+use_amp, autocast, _ = get_amp(use_cuda, cnfg.use_amp, cnfg.cpu_amp)
+if use_amp:
+	fp32_log_softmax(mymodel)
 
 # Important to make cudnn methods deterministic
 set_random_seed(cnfg.seed, use_cuda)
@@ -66,33 +77,70 @@ beam_size = cnfg.beam_size
 
 length_penalty = cnfg.length_penalty
 
+shortlist = None if (cnfg.shortlist is None) or multi_gpu else load_shortlist(cnfg.shortlist, nwordt, cnfg.shortlist_topk)
+
 ens = "\n".encode("utf-8")
 
-src_grp = td["src"]
-with open(sys.argv[1], "wb") as f:
+def translate_batch(seq_batch):
+
+	seq_batch = torch.from_numpy(seq_batch).long()
+	if use_cuda:
+		seq_batch = seq_batch.to(cuda_device)
 	with torch.no_grad():
-		for i in tqdm(range(ntest)):
-			seq_batch = torch.from_numpy(src_grp[str(i)][:]).long()
-			if use_cuda:
-				seq_batch = seq_batch.to(cuda_device)
-			with autocast(enabled=use_amp):
-				output = mymodel.decode(seq_batch, beam_size, None, length_penalty)
-			#output = mymodel.train_decode(seq_batch, beam_size, None, length_penalty)
-			if multi_gpu:
-				tmp = []
-				for ou in output:
-					tmp.extend(ou.tolist())
-				output = tmp
+		with autocast(enabled=use_amp):
+			output = mymodel.decode(seq_batch, beam_size, None, length_penalty) if shortlist is None else shortlist.decode(mymodel, seq_batch, beam_size, None, length_penalty)
+		#output = mymodel.train_decode(seq_batch, beam_size, None, length_penalty)
+	if multi_gpu:
+		tmp = []
+		for ou in output:
+			tmp.extend(ou.tolist())
+		output = tmp
+	else:
+		output = output.tolist()
+	rs = []
+	for tran in output:
+		tmp = []
+		for tmpu in tran:
+			if tmpu == eos_id:
+				break
 			else:
-				output = output.tolist()
-			for tran in output:
-				tmp = []
-				for tmpu in tran:
-					if tmpu == eos_id:
-						break
-					else:
-						tmp.append(vcbt[tmpu])
-				f.write(" ".join(tmp).encode("utf-8"))
-				f.write(ens)
-
-td.close()
+				tmp.append(vcbt[tmpu])
+		rs.append(" ".join(tmp))
+
+	return rs
+
+# workers are forked after the model is loaded and share its weights copy-on-write, each of them sets its threads and core affinity by its index, and opens the test set itself.
+
+def init_worker(rank):
+
+	setup_threads_cnfg(cnfg, rank, nproc, cpus)
+
+	return h5py.File(cnfg.test_data, "r")["src"]
+
+def decode_worker(src_grp, bid):
+
+	return translate_batch(src_grp[str(bid)][:])
+
+def batch_reader(src_grp, ntest):
+
+	for i in range(ntest):
+		yield src_grp[str(i)][:]
+
+if nproc > 1:
+	# decoding can be resumed from results of finished batches kept in sys.argv[1] + ".parts" after an interruption
+	td.close()
+	cpus = get_cpus()
+	_ndone = 0
+	with tqdm(total=ntest) as pbar:
+		for _n in sharded_decode(sys.argv[1], ntest, nproc, init_worker, decode_worker):
+			pbar.update(_n - _ndone)
+			_ndone = _n
+else:
+	if not use_cuda:
+		setup_threads_cnfg(cnfg)
+	src_grp = td["src"]
+	with open(sys.argv[1], "wb") as f:
+		for seq_batch in tqdm(batch_reader(src_grp, ntest), total=ntest):
+			f.write("\n".join(translate_batch(seq_batch)).encode("utf-8"))
+			f.write(ens)
+	td.close()
@@ -8,6 +8,7 @@ import cnfg.base as cnfg
 from datautils.pymoses import Tokenizer, Detokenizer, Normalizepunctuation, Truecaser, Detruecaser
 from datautils.moses import SentenceSplitter
 from datautils.bpe import BPEApplier, BPERemover
+from datautils.pool import ProcessorPool
 from translator import TranslatorCore, Translator
 
 '''
@@ -20,15 +21,27 @@ tgtvcb = "path/to/target/vocabulary"
 bpecds = "path/to/source/bpe/codes"
 bpevcb = "path/to/source/bpe/vocabulary"
 bpethr = 8# bpe threshold
+share_weights = True# share mapped weights among uWSGI workers
+prep_workers = 4# persistent pre-/post-processing workers of each stage in each uWSGI worker, 0 to process in the serving thread
 '''
-spl = SentenceSplitter(slang)
-tok = Tokenizer(slang)
-detok = Detokenizer(tlang)
-punc_norm = Normalizepunctuation(slang)
-truecaser = Truecaser(tcmodel)
-detruecaser = Detruecaser()
-tran_core = TranslatorCore(tmodel, srcvcb, tgtvcb, cnfg)
-bpe = BPEApplier(bpecds, bpevcb, bpethr)
+if prep_workers > 0:
+	# perl scripts (datautils.moses) run in subprocesses driven by threads, sacremoses (datautils.pymoses) and BPE in worker processes
+	spl = ProcessorPool(SentenceSplitter, slang, nworker=prep_workers)
+	tok = ProcessorPool(Tokenizer, slang, nworker=prep_workers, use_process=True)
+	detok = ProcessorPool(Detokenizer, tlang, nworker=prep_workers, use_process=True)
+	punc_norm = ProcessorPool(Normalizepunctuation, slang, nworker=prep_workers, use_process=True)
+	truecaser = ProcessorPool(Truecaser, tcmodel, nworker=prep_workers, use_process=True)
+	detruecaser = ProcessorPool(Detruecaser, nworker=prep_workers, use_process=True)
+	bpe = ProcessorPool(BPEApplier, bpecds, bpevcb, bpethr, nworker=prep_workers, use_process=True)
+else:
+	spl = SentenceSplitter(slang)
+	tok = Tokenizer(slang)
+	detok = Detokenizer(tlang)
+	punc_norm = Normalizepunctuation(slang)
+	truecaser = Truecaser(tcmodel)
+	detruecaser = Detruecaser()
+	bpe = BPEApplier(bpecds, bpevcb, bpethr)
+tran_core = TranslatorCore(tmodel, srcvcb, tgtvcb, cnfg, share_weights=share_weights)
 debpe = BPERemover()
 trans = Translator(tran_core, spl, tok, detok, bpe, debpe, punc_norm, truecaser, detruecaser)
 
@@ -9,7 +9,7 @@ import sys
 import torch
 
 from utils.base import secure_type_map
-from utils.h5serial import h5save, h5load
+from utils.h5serial import h5save, h5load, h5load_attrs
 
 from cnfg.ihyp import *
 
@@ -32,7 +32,8 @@ def handle(srcfl, rsf):
 
 	rsm = [para if mtyp is None else para.to(styp) for para, mtyp, styp in zip(sec_rsm, map_type, src_type)]
 
-	h5save(rsm, rsf, h5args=h5zipargs)
+	# models pruned in the same way share the metadata of the first one
+	h5save(rsm, rsf, h5args=h5zipargs, attrs=h5load_attrs(srcfl[0]))
 
 if __name__ == "__main__":
 	handle(sys.argv[2:], sys.argv[1])
@@ -0,0 +1,36 @@
+#encoding: utf-8
+
+# usage: python tools/check/doc/para/fill.py $src.srt $tgt.srt [$ratio] [$ngpu]
+# report the batches built by tools/doc/para/mkiodata.py (utils/fmt/doc/para/dual.py) from documents sorted by tools/doc/para/sort.py, when only documents with the same number of sentences share a batch (0) and when documents are padded with placeholder sentences within buckets of cnfg/hyp.py:doc_pad_sent_ratio (or $ratio): the number of batches, documents and real tokens of each batch, and the fill (real tokens / tokens of the padded batch including placeholder sentences).
+
+import sys
+
+from utils.fmt.doc.para.dual import batch_loader
+
+from cnfg.ihyp import *
+
+def count(batch):
+
+	return sum(sum(len(_s) for _s in _doc) for _doc in batch)
+
+def handle(srcf, tgtf, ratio=doc_pad_sent_ratio, minbsize=1, bsize=max_sentences_gpu, maxpad=max_pad_tokens_sentence, maxpart=normal_tokens_vs_pad_tokens, maxtoken=max_tokens_gpu):
+
+	_bsize, _maxtoken = bsize * minbsize, maxtoken * minbsize
+	rs = {}
+	for _ratio in (0.0, ratio,):
+		nbatch = ndoc = nsmall = real = padded = 0
+		for rsi, rst, mlen_i, mlen_t, nsent in batch_loader(srcf, tgtf, _bsize, maxpad, maxpart, _maxtoken, minbsize, _ratio):
+			_nd = len(rsi)
+			nbatch += 1
+			ndoc += _nd
+			if _nd * nsent < 8:
+				nsmall += 1
+			real += count(rsi) + count(rst)
+			padded += _nd * nsent * (mlen_i + mlen_t)
+		rs[_ratio] = (nbatch, ndoc, nsmall, real, padded,)
+		print("ratio %.3f: %d batches, %d with less than 8 sentences, %.2f documents and %.1f real tokens per batch, fill %.2f%%" % (_ratio, nbatch, nsmall, float(ndoc) / nbatch, float(real) / nbatch, float(real) / padded * 100.0,))
+	_base, _pack = rs[0.0], rs[ratio]
+	print("packing: %.1f%% batches, real tokens per batch x%.2f" % (float(_pack[0]) / _base[0] * 100.0, float(_base[0]) / _pack[0],))
+
+if __name__ == "__main__":
+	handle(sys.argv[1], sys.argv[2], float(sys.argv[3]) if len(sys.argv) > 3 else doc_pad_sent_ratio, int(sys.argv[4]) if len(sys.argv) > 4 else 1)
@@ -0,0 +1,47 @@
+#encoding: utf-8
+
+# usage: python tools/check/doc/para/order.py $src.srt $src.vcb [$ngpu]
+# check that batches of the test set built by tools/doc/para/mktest.py from documents sorted by tools/doc/para/sort.py, read in the order of adv/predict/doc/para/predict_doc_para.py (utils/fmt/doc/para/single.py:get_batch_keys) with placeholder sentences dropped, give back the documents of $src.srt in order, so that translations are aligned with the sorted source for tools/doc/para/restore.py.
+
+import sys
+
+import h5py
+
+from os import remove, close
+from tempfile import mkstemp
+
+from tools.doc.para.mktest import handle as mktest
+from utils.fmt.base import ldvocab, map_batch, pad_id
+from utils.fmt.doc.base import doc_reader
+from utils.fmt.doc.para.single import get_batch_keys
+
+def read_batches(td):
+
+	src_grp, nsents_grp = td["src"], td["nsents"]
+	for nsent, i_d in get_batch_keys(td):
+		for doc, _ns in zip(src_grp[nsent][i_d][:].tolist(), nsents_grp[nsent][i_d][:].tolist()):
+			yield [[_tok for _tok in _sent if _tok != pad_id] for _sent in doc[:_ns]]
+
+def handle(srcf, vcbf, minbsize=1):
+
+	vcbi, nwordi = ldvocab(vcbf)
+	_fd, _tmpf = mkstemp(suffix=".h5")
+	close(_fd)
+	try:
+		mktest(srcf, vcbf, _tmpf, minbsize)
+		with h5py.File(_tmpf, "r") as td:
+			nsents = [int(_ns) for _ns, _ in get_batch_keys(td)]
+			_docs = list(read_batches(td))
+			ndoc = nerr = 0
+			for doc, _ in doc_reader(srcf):
+				if (ndoc >= len(_docs)) or (map_batch(doc, vcbi)[0] != _docs[ndoc]):
+					nerr += 1
+				ndoc += 1
+			nerr += max(0, len(_docs) - ndoc)
+	finally:
+		remove(_tmpf)
+	print("%d batches, largest numbers of sentences in order of batches change %d times" % (len(nsents), sum(1 for _p, _n in zip(nsents, nsents[1:]) if _p != _n),))
+	print("%d documents read in the decoding order, %d differ from the sorted source: %s" % (ndoc, nerr, "OK" if nerr == 0 else "FAILED",))
+
+if __name__ == "__main__":
+	handle(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 1)
@@ -0,0 +1,72 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/amp.py bsize seql [nrun]
+# check the parity of bfloat16 autocast on CPU (cnfg/base.py:cpu_amp, utils/amp.py) against float32 on random data (the loss, gradients of the training step and translations of greedy decoding), and compare the time cost of training steps and decoding.
+
+import sys
+
+import torch
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.amp import get_amp, fp32_log_softmax, cpu_autocast_base
+from utils.fmt.base import pad_id
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+if cpu_autocast_base is None:
+	print("bfloat16 autocast on CPU is not supported by pytorch %s" % (torch.__version__,))
+	sys.exit(1)
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+# dropout disabled for the parity check
+mymodel = fp32_log_softmax(NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes))
+lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long)
+oi, ot = seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous()
+
+rs = {}
+for cpu_amp in (False, True,):
+	use_amp, autocast, _ = get_amp(False, False, cpu_amp)
+
+	def fwd_loss():
+
+		with autocast(enabled=use_amp):
+			return lossf(mymodel(seq_batch, oi), ot)
+
+	def decode():
+
+		with autocast(enabled=use_amp):
+			return mymodel.decode(seq_batch, 1, seql, 0.0)
+
+	mymodel.train()
+	mymodel.zero_grad()
+	_loss = fwd_loss()
+	_loss.backward()
+	_grads = [_p.grad.clone() for _p in mymodel.parameters() if _p.grad is not None]
+	mymodel.zero_grad()
+	_tb = time_func(fwd_loss, nrun=nrun)
+	mymodel.zero_grad()
+	mymodel.eval()
+	with torch.no_grad():
+		_trans = decode()
+		_td = time_func(decode, nrun=nrun, backward=False)
+	rs[cpu_amp] = (_loss.item(), _loss.dtype, _grads, _trans, _tb, _td,)
+
+_fp32, _bf16 = rs[False], rs[True]
+print("loss: float32 %.4f, bfloat16 autocast %.4f (%s), relative diff %.3e" % (_fp32[0], _bf16[0], _bf16[1], abs(_fp32[0] - _bf16[0]) / abs(_fp32[0])))
+print("max relative diff of gradients: %.3e" % (max(((_g1 - _g2).norm() / _g1.norm().clamp(min=1e-12)).item() for _g1, _g2 in zip(_fp32[2], _bf16[2])),))
+print("tokens of greedy translations matched: %.2f%%" % (_fp32[3].eq(_bf16[3]).float().mean().item() * 100.0 if _fp32[3].size() == _bf16[3].size() else 0.0,))
+print("float32: training step %.2f ms, decoding %.2f ms" % (_fp32[4] * 1000.0, _fp32[5] * 1000.0,))
+print("bfloat16: training step %.2f ms (%.1f%%), decoding %.2f ms (%.1f%%)" % (_bf16[4] * 1000.0, _bf16[4] / _fp32[4] * 100.0, _bf16[5] * 1000.0, _bf16[5] / _fp32[5] * 100.0,))
@@ -0,0 +1,69 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/attn.py seql [bsize] [chunk_size] [nrun]
+# check the parity of the chunked attention (cnfg/hyp.py:attention_chunk_size) against the standard implementation on random data, and report their time and activation memory costs for forward/backward.
+
+import sys
+
+import torch
+
+from modules.base import SelfAttn, CrossAttn, MultiHeadAttn
+
+from utils.base import set_random_seed
+from utils.bench import time_func, memory_func, fmt_mem
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+seql = int(sys.argv[1])
+bsize = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+chunk_size = int(sys.argv[3]) if len(sys.argv) > 3 else 256
+nrun = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+isize, nhead = cnfg.isize, cnfg.nhead
+
+set_random_seed(cnfg.seed, False)
+
+x = torch.randn(bsize, seql, isize)
+c = torch.randn(bsize, seql, isize)
+# the first sequence is padded for half of its length
+src_mask = torch.zeros(bsize, 1, seql, dtype=torch.bool)
+src_mask[0, 0, seql // 2:] = True
+tgt_mask = torch.ones(seql, seql, dtype=torch.bool).triu(1).unsqueeze(0)
+
+def get_rs(m, fwd, inputs):
+
+	for _i in inputs:
+		_i.grad = None
+	m.zero_grad()
+	out = fwd()
+	out.sum().backward()
+
+	return [out.detach()] + [_i.grad for _i in inputs] + [_p.grad for _p in m.parameters()]
+
+def max_diff(lin1, lin2):
+
+	return max((_t1 - _t2).abs().max().item() for _t1, _t2 in zip(lin1, lin2))
+
+cases = [
+	("SelfAttn (causal mask)", SelfAttn(isize, isize, isize, nhead), lambda m, q, k: m(q, mask=tgt_mask), False,),
+	("SelfAttn (relative positions, padding mask)", SelfAttn(isize, isize, isize, nhead, k_rel_pos=8, xseql=seql), lambda m, q, k: m(q, mask=src_mask), False,),
+	("CrossAttn (padding mask)", CrossAttn(isize, isize, isize, nhead), lambda m, q, k: m(q, k, mask=src_mask), True,),
+	("MultiHeadAttn (padding mask)", MultiHeadAttn(isize, isize, isize, nhead), lambda m, q, k: m(q, k, k, mask=src_mask), True,),
+]
+
+for desc, m, fwd, cross in cases:
+	q = x.clone().requires_grad_(True)
+	k = c.clone().requires_grad_(True)
+	inputs = [q, k] if cross else [q]
+	_fwd = lambda: fwd(m, q, k)
+	_fwd_loss = lambda: _fwd().sum()
+	m.train()
+	rs = {}
+	for _cs in (0, chunk_size,):
+		m.chunk_size = _cs
+		rs[_cs] = (get_rs(m, _fwd, inputs), time_func(_fwd_loss, nrun=nrun), memory_func(_fwd_loss, exclude=list(m.parameters())),)
+	m.zero_grad()
+	_std, _chk = rs[0], rs[chunk_size]
+	print("%s, max diff of outputs/gradients: %.3e" % (desc, max_diff(_std[0], _chk[0]),))
+	print("\tstandard: %.2f ms, activation memory: %s" % (_std[1] * 1000.0, fmt_mem(_std[2]),))
+	print("\tchunk %d: %.2f ms, activation memory: %s" % (chunk_size, _chk[1] * 1000.0, fmt_mem(_chk[2]),))
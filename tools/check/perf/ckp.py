@@ -0,0 +1,62 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/ckp.py bsize seql [nrun]
+# report the time and the activation memory cost of a training step on random data with activations of every k layers recomputed in the backward pass (cnfg/hyp.py:activation_recompute).
+
+import sys
+
+import torch
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+
+from utils.base import set_random_seed
+from utils.bench import time_func, memory_func, fmt_mem
+from utils.fmt.base import pad_id, parse_double_value_tuple
+from utils.fmt.base4torch import parse_cuda
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+def set_act_recompute(modin, seg):
+
+	for _m in modin.modules():
+		if "act_recompute" in dir(_m):
+			_m.act_recompute = seg
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+nword = 32768
+
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda(cnfg.use_cuda, cnfg.gpuid)
+set_random_seed(cnfg.seed, use_cuda)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long)
+if use_cuda:
+	mymodel.to(cuda_device)
+	lossf.to(cuda_device)
+	seq_batch, seq_o = seq_batch.to(cuda_device), seq_o.to(cuda_device)
+oi, ot = seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous()
+mymodel.train()
+
+def fwd_func():
+
+	return lossf(mymodel(seq_batch, oi), ot)
+
+nlayer = max(parse_double_value_tuple(cnfg.nlayer))
+_paras = list(mymodel.parameters())
+_base_t = _base_m = None
+for seg in sorted(set((0, 1, 2, nlayer,))):
+	set_act_recompute(mymodel, seg)
+	_t = time_func(fwd_func, nrun=nrun, device=cuda_device if use_cuda else None)
+	_m = memory_func(fwd_func, device=cuda_device if use_cuda else None, exclude=_paras)
+	mymodel.zero_grad()
+	if seg == 0:
+		_base_t, _base_m = _t, _m
+		print("no recomputation: %.2f ms/step, activation memory: %s" % (_t * 1000.0, fmt_mem(_m)))
+	else:
+		print("recompute every %d layer(s): %.2f ms/step (%.1f%%), activation memory: %s (%s)" % (seg, _t * 1000.0, _t / _base_t * 100.0, fmt_mem(_m), "n/a" if (_m is None) or (not _base_m) else ("%.1f%%" % (_m / _base_m * 100.0))))
@@ -0,0 +1,89 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/dist.py nproc bsize seql [nrun], bsize >= 2
+# spawn nproc local processes with the gloo backend, check that gradients of DistributedModel (cnfg/base.py:dist_backend) over batch shards, accumulated over 2 micro-batches with the all-reduce skipped for the first one (no_sync), match those of a single process on the whole batch, and report the time cost of a training step.
+
+import sys
+
+import torch
+from torch import multiprocessing as mp
+
+from os import environ
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+from parallel.dist import DistributedModel, init_dist, close_dist, is_master, all_reduce_values
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.fmt.base import pad_id
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+nword = 8192
+
+def build_model():
+
+	set_random_seed(cnfg.seed, False)
+
+	# dropout disabled for the parity check
+	return NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+
+def get_data(nproc, bsize, seql):
+
+	set_random_seed(cnfg.seed, False)
+	seq_batch = torch.randint(4, nword, (nproc * bsize, seql,), dtype=torch.long)
+	seq_o = torch.randint(4, nword, (nproc * bsize, seql + 1,), dtype=torch.long)
+
+	return seq_batch, seq_o
+
+def worker(rank, nproc, bsize, seql, nrun):
+
+	environ["RANK"], environ["WORLD_SIZE"], environ["LOCAL_RANK"] = str(rank), str(nproc), str(rank)
+	init_dist("gloo")
+	torch.set_num_threads(1)
+
+	lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+	seq_batch, seq_o = get_data(nproc, bsize, seql)
+	mymodel = DistributedModel(build_model(), bucket_size=cnfg.dist_bucket_size)
+	mymodel.train()
+
+	_seq_batch, _seq_o = seq_batch.narrow(0, rank * bsize, bsize), seq_o.narrow(0, rank * bsize, bsize)
+	oi, ot = _seq_o.narrow(1, 0, seql), _seq_o.narrow(1, 1, seql).contiguous()
+
+	def fwd_func():
+
+		return lossf(mymodel(_seq_batch, oi), ot)
+
+	# split the shard of each process into 2 micro-batches (with different numbers of tokens), and only reduce gradients with the second one
+	_mbsize = max(1, bsize // 2)
+	with mymodel.no_sync():
+		lossf(mymodel(_seq_batch.narrow(0, 0, _mbsize), oi.narrow(0, 0, _mbsize)), ot.narrow(0, 0, _mbsize)).backward()
+	lossf(mymodel(_seq_batch.narrow(0, _mbsize, bsize - _mbsize), oi.narrow(0, _mbsize, bsize - _mbsize)), ot.narrow(0, _mbsize, bsize - _mbsize)).backward()
+	mymodel.collect_gradients()
+	# DistributedModel sums gradients over processes
+	_grads = [_p.grad.clone() for _p in mymodel.parameters()]
+	mymodel.module.zero_grad()
+	_t = all_reduce_values(time_func(fwd_func, nrun=nrun))[0] / nproc
+
+	if is_master():
+		refm = build_model()
+		refm.train()
+		oi, ot = seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous()
+		_loss = lossf(refm(seq_batch, oi), ot)
+		_loss.backward()
+		print("max diff of gradients: %.3e" % (max((_g - _p.grad).abs().max().item() for _g, _p in zip(_grads, refm.parameters())),))
+		refm.zero_grad()
+		_st = time_func(lambda: lossf(refm(seq_batch, oi), ot), nrun=nrun)
+		print("single process (%d sentences): %.2f ms/step, %d processes (%d sentences each): %.2f ms/step" % (nproc * bsize, _st * 1000.0, nproc, bsize, _t * 1000.0,))
+
+	close_dist()
+
+if __name__ == "__main__":
+
+	nproc, bsize, seql = int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3])
+	nrun = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+	environ.setdefault("MASTER_ADDR", "127.0.0.1")
+	environ.setdefault("MASTER_PORT", "29500")
+	mp.spawn(worker, args=(nproc, bsize, seql, nrun,), nprocs=nproc)
@@ -0,0 +1,73 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/docinc.py nsent seql [nrun]
+# check that incremental document decoding (transformer/Doc/Para/Base/Incremental.py) gives the same greedy translations as decoding the whole document (transformer.Doc.Para.Base.NMT.decode) on random data, and compare the time cost of streaming a document sentence by sentence with cached contexts and cross attention keys/values against re-encoding the context window of every sentence and projecting keys/values at every decoding step.
+
+import sys
+
+import torch
+
+from transformer.Doc.Para.Base.NMT import NMT
+from transformer.Doc.Para.Base.Incremental import IncrementalDecoder
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.fmt.base import eos_id
+
+import cnfg.docpara as cnfg
+from cnfg.ihyp import *
+
+class ReencodeDecoder(IncrementalDecoder):
+
+	def __init__(self, *args, **kwargs):
+
+		super(ReencodeDecoder, self).__init__(*args, **kwargs)
+		self.inputs = {}
+
+	def get_context(self, pos, bsize):
+
+		if pos < 0:
+			return super(ReencodeDecoder, self).get_context(pos, bsize)
+		_inputs = self.inputs[pos]
+		_mask = _inputs.eq(0).unsqueeze(1)
+
+		return self.model.enc.context_enc(_inputs, mask=_mask), _mask
+
+	def __call__(self, inputs):
+
+		self.inputs[self.pos] = inputs
+
+		return super(ReencodeDecoder, self).__call__(inputs)
+
+def strip_eos(lin):
+
+	return lin[:lin.index(eos_id)] if eos_id in lin else lin
+
+def stream(decoder, doc):
+
+	decoder.reset()
+
+	return [decoder(doc.select(1, i)) for i in range(doc.size(1))]
+
+nsent, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes, cnfg.num_prev_sent, cnfg.num_layer_context)
+mymodel.eval()
+
+doc = torch.randint(4, nword, (1, nsent, seql,), dtype=torch.long)
+
+with torch.no_grad():
+	_full = [strip_eos(_t) for _t in mymodel.decode(doc.narrow(1, 1, nsent - 1).contiguous(), doc.narrow(1, 0, nsent - 1).contiguous(), 1).view(nsent - 1, -1).tolist()]
+	inc_decoder = IncrementalDecoder(mymodel, 1)
+	_inc = [strip_eos(_t.view(-1).tolist()) for _t in stream(inc_decoder, doc)[1:]]
+	print("incremental greedy translations of %d sentences matched: %s" % (nsent - 1, _full == _inc,))
+
+	reenc_decoder = ReencodeDecoder(mymodel, cnfg.beam_size, None, cnfg.length_penalty, cache_kv=False)
+	inc_decoder = IncrementalDecoder(mymodel, cnfg.beam_size, None, cnfg.length_penalty)
+	_t_reenc = time_func(lambda: stream(reenc_decoder, doc), nrun=nrun, backward=False)
+	_t_inc = time_func(lambda: stream(inc_decoder, doc), nrun=nrun, backward=False)
+	print("streaming a document of %d sentences: re-encoding contexts %.2f ms, incremental %.2f ms (%.1f%%)" % (nsent, _t_reenc * 1000.0, _t_inc * 1000.0, _t_inc / _t_reenc * 100.0,))
@@ -0,0 +1,44 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/encode.py $text $vocab [bsize] [nsent]
+# check that the vectorised BatchEncoder (utils/fmt/encode.py) produces the same arrays as map_batch + pad_batch (utils/fmt/base.py) on batches of bsize consecutive sentences (the first nsent sentences of the text file), and report the time cost of both.
+
+import sys
+
+import numpy
+
+from time import time
+
+from utils.fmt.base import ldvocab, list_reader, map_batch, pad_batch
+from utils.fmt.encode import BatchEncoder
+
+bsize = int(sys.argv[3]) if len(sys.argv) > 3 else 128
+nsent = int(sys.argv[4]) if len(sys.argv) > 4 else 1000000
+
+vcb, nword = ldvocab(sys.argv[2])
+batches, _cache = [], []
+for i_d in list_reader(sys.argv[1]):
+	_cache.append(i_d)
+	if len(_cache) >= bsize:
+		batches.append(_cache)
+		_cache = []
+	if len(batches) * bsize >= nsent:
+		break
+if _cache:
+	batches.append(_cache)
+mlens = [max(len(_s) for _s in _b) for _b in batches]
+ntok = sum(len(_s) for _b in batches for _s in _b)
+
+# map_batch/pad_batch extend sentences in-place
+_copies = [[list(_s) for _s in _b] for _b in batches]
+_st = time()
+rs_std = [numpy.array(pad_batch(map_batch(_b, vcb)[0], _mlen + 2), dtype=numpy.int32) for _b, _mlen in zip(_copies, mlens)]
+_t_std = time() - _st
+
+encoder = BatchEncoder(vcb)
+_st = time()
+rs_enc = [encoder(_b, _mlen) for _b, _mlen in zip(batches, mlens)]
+_t_enc = time() - _st
+
+print("%d batches, %d tokens, same output: %s" % (len(batches), ntok, all((_r1.shape == _r2.shape) and (_r1 == _r2).all() for _r1, _r2 in zip(rs_std, rs_enc)),))
+print("map_batch + pad_batch: %.3f s (%.2f M tokens/s), BatchEncoder: %.3f s (%.2f M tokens/s, %.1f%%)" % (_t_std, ntok / _t_std / 1e6, _t_enc, ntok / _t_enc / 1e6, _t_enc / _t_std * 100.0,))
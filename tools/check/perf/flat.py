@@ -0,0 +1,81 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/flat.py bsize seql [nrun], requires at least 2 GPUs
+# check that gradients collected from replicas and parameters broadcast to them by DataParallelModel with flat parameter/gradient buffers (cnfg/base.py:flat_params) match those without, including tied weights, and report the time cost of collect_gradients, update_replicas and zero_grad.
+
+import sys
+
+import torch
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+from parallel.parallelMT import DataParallelMT
+from parallel.base import DataParallelCriterion
+
+from utils.base import set_random_seed
+from utils.bench import sync_device
+from utils.fmt.base import pad_id
+
+from time import time
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+nword = 8192
+
+def build_model(devices, flat_params):
+
+	set_random_seed(cnfg.seed, False)
+	# dropout disabled for the parity check
+	_m = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes).to(devices[0])
+
+	return DataParallelMT(_m, device_ids=[_d.index for _d in devices], output_device=devices[0].index, host_replicate=True, gather_output=False, flat_params=flat_params)
+
+def time_op(func, nrun, device):
+
+	sync_device(device)
+	_st = time()
+	for _ in range(nrun):
+		func()
+	sync_device(device)
+
+	return (time() - _st) / nrun
+
+if torch.cuda.device_count() < 2:
+	print("at least 2 GPUs are required")
+	sys.exit(1)
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+devices = [torch.device("cuda", _i) for _i in range(torch.cuda.device_count())]
+
+set_random_seed(cnfg.seed, False)
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long, device=devices[0])
+seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long, device=devices[0])
+oi, ot = seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous()
+lossf = DataParallelCriterion(LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes).to(devices[0]), device_ids=[_d.index for _d in devices], output_device=devices[0].index, replicate_once=True)
+
+rs = {}
+for _flat in (False, True,):
+	mymodel = build_model(devices, _flat)
+	mymodel.train()
+	lossf(mymodel(seq_batch, oi), ot).sum().backward()
+	mymodel.collect_gradients()
+	_grads = [_p.grad.clone() for _p in mymodel.module.parameters()]
+	# apply a step and check parameters of the replicas after update_replicas
+	with torch.no_grad():
+		for _p in mymodel.module.parameters():
+			_p.sub_(_p.grad, alpha=1e-3)
+	mymodel.update_replicas()
+	_rep_diff = max((_p.to(devices[0]) - _rp.to(devices[0])).abs().max().item() for _net in mymodel.nets[1:] for _p, _rp in zip(mymodel.module.parameters(), _net.parameters()))
+	lossf(mymodel(seq_batch, oi), ot).sum().backward()
+	_tc = time_op(mymodel.collect_gradients, nrun, devices[0])
+	_tu = time_op(mymodel.update_replicas, nrun, devices[0])
+	_tz = time_op(mymodel.zero_grad, nrun, devices[0])
+	rs[_flat] = (_grads, _rep_diff, _tc, _tu, _tz,)
+	mymodel = None
+
+_std, _flat = rs[False], rs[True]
+print("max diff of gradients: %.3e, max diff between the model and replicas after update_replicas: %.3e (flat), %.3e (standard)" % (max((_g1 - _g2).abs().max().item() for _g1, _g2 in zip(_std[0], _flat[0])), _flat[1], _std[1],))
+for _name, _r in (("standard", _std,), ("flat", _flat,),):
+	print("%s: collect_gradients %.3f ms, update_replicas %.3f ms, zero_grad %.3f ms" % (_name, _r[2] * 1000.0, _r[3] * 1000.0, _r[4] * 1000.0,))
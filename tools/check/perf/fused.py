@@ -0,0 +1,67 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/fused.py bsize seql [nrun]
+# check the parity of fused encoder/decoder layers (cnfg/hyp.py:fused_layer) against the standard layers with the same random seed (dropout enabled) on random data, check gradients of the fused autograd functions with torch.autograd.gradcheck, and report the time and the activation memory cost of a training step.
+
+import sys
+
+import torch
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+from modules.fused import DropResidualNormFunction, BiasReLUDropoutFunction
+
+from utils.base import set_random_seed
+from utils.bench import time_func, memory_func, fmt_mem
+from utils.fmt.base import pad_id
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+def set_fused(modin, value):
+
+	for _m in modin.modules():
+		if "fused" in dir(_m):
+			_m.fused = value
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+nword = 32768
+
+_x, _r = torch.randn(2, 3, 8, dtype=torch.double, requires_grad=True), torch.randn(2, 3, 8, dtype=torch.double, requires_grad=True)
+_w, _b = torch.randn(8, dtype=torch.double, requires_grad=True), torch.randn(8, dtype=torch.double, requires_grad=True)
+print("gradcheck DropResidualNormFunction: %s" % (torch.autograd.gradcheck(lambda x, r, w, b: DropResidualNormFunction.apply(x, r, w, b, 0.0, 1e-6), (_x, _r, _w, _b,)),))
+print("gradcheck BiasReLUDropoutFunction: %s" % (torch.autograd.gradcheck(lambda x, b: BiasReLUDropoutFunction.apply(x.clone(), b, 0.0), (_x, _b,)),))
+
+set_random_seed(cnfg.seed, False)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+mymodel.train()
+
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+seq_batch[0, seql - seql // 4:] = pad_id
+seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long)
+oi, ot = seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous()
+
+def fwd_func():
+
+	return lossf(mymodel(seq_batch, oi), ot)
+
+_paras = list(mymodel.parameters())
+rs = {}
+for _fused in (False, True,):
+	set_fused(mymodel, _fused)
+	mymodel.zero_grad()
+	set_random_seed(cnfg.seed, False)
+	_loss = fwd_func()
+	_loss.backward()
+	_grads = [_p.grad.clone() for _p in _paras if _p.grad is not None]
+	mymodel.zero_grad()
+	rs[_fused] = (_loss.item(), _grads, time_func(fwd_func, nrun=nrun), memory_func(fwd_func, exclude=_paras),)
+	mymodel.zero_grad()
+
+_std, _fsd = rs[False], rs[True]
+print("loss: %.6f / %.6f, max diff of gradients: %.3e" % (_std[0], _fsd[0], max((_g1 - _g2).abs().max().item() for _g1, _g2 in zip(_std[1], _fsd[1])),))
+print("standard: %.2f ms/step, activation memory: %s" % (_std[2] * 1000.0, fmt_mem(_std[3]),))
+print("fused: %.2f ms/step (%.1f%%), activation memory: %s" % (_fsd[2] * 1000.0, _fsd[2] / _std[2] * 100.0, fmt_mem(_fsd[3]),))
@@ -0,0 +1,91 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/kd.py bsize seql [nbatch]
+# check that teacher distributions stored by utils/kd.py (cnfg/hyp.py:kd_topk, kd_mass) are read back as the renormalized top tokens of the teacher on random data, and report the disk cost per target token against dense float32 distributions and the time cost of a training step with the knowledge distillation loss (loss/base.py:TopKDistillLoss) against the label smoothing loss only.
+
+import sys
+
+import torch
+
+from os.path import getsize
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss, TopKDistillLoss
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.kd import TopKWriter, TopKReader, get_fnames
+from utils.fmt.base import pad_id
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nbatch = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+kd_lossf = TopKDistillLoss(ignore_index=pad_id, reduction='sum')
+
+batches = []
+for i in range(nbatch):
+	seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+	seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long)
+	# random lengths of targets
+	seq_o.masked_fill_(torch.arange(seql + 1).unsqueeze(0).ge(torch.randint(2, seql + 2, (bsize, 1,))), pad_id)
+	batches.append((seq_batch, seq_o.narrow(1, 0, seql), seq_o.narrow(1, 1, seql).contiguous(),))
+
+# a sharpened random teacher
+mymodel.eval()
+_tmpd = mkdtemp()
+fname = _tmpd + "/kd"
+teacher = {}
+with TopKWriter(fname, nword, kd_topk, kd_mass) as writer, torch.no_grad():
+	for i, (seq_batch, oi, ot,) in enumerate(batches):
+		_out = (mymodel(seq_batch, oi) * 4.0).log_softmax(-1)
+		writer.write(str(i), _out, ot)
+		teacher[str(i)] = _out
+
+reader = TopKReader(fname)
+_match = True
+for i, (seq_batch, oi, ot,) in enumerate(batches):
+	_ids, _probs = reader.get(str(i))
+	_t = teacher[str(i)].view(-1, nword)[ot.view(-1).ne(pad_id)].exp()
+	_tp, _tids = _t.topk(reader.topk, dim=-1)
+	_used = _probs.gt(0.0)
+	_tp = _tp.masked_fill(~_used, 0.0)
+	_match = _match and _ids.masked_fill(~_used, 0).equal(_tids.masked_fill(~_used, 0)) and (_probs - _tp / _tp.sum(-1, keepdim=True)).abs().max().item() < 1e-2
+print("stored distributions matched: %s" % (_match,))
+_nbytes = sum(getsize(_f) for _f in get_fnames(fname)[:3])
+print("%d target tokens, %.2f teacher tokens and %.1f bytes per target token (dense float32: %d bytes)" % (reader.cnt.shape[0], float(reader.ids.shape[0]) / reader.cnt.shape[0], float(_nbytes) / reader.cnt.shape[0], nword * 4,))
+
+mymodel.train()
+
+def step_ls(i=[0]):
+
+	seq_batch, oi, ot = batches[i[0] % nbatch]
+	i[0] += 1
+
+	return lossf(mymodel(seq_batch, oi), ot)
+
+def step_kd(i=[0]):
+
+	bid = i[0] % nbatch
+	i[0] += 1
+	seq_batch, oi, ot = batches[bid]
+	output = mymodel(seq_batch, oi)
+	_ids, _probs = reader.get(str(bid))
+
+	return (1.0 - cnfg.kd_weight) * lossf(output, ot) + cnfg.kd_weight * kd_lossf(output, ot, _ids, _probs)
+
+_t_ls = time_func(step_ls, nrun=nbatch)
+_t_kd = time_func(step_kd, nrun=nbatch)
+print("training step: label smoothing %.2f ms, with distillation %.2f ms (%.1f%%)" % (_t_ls * 1000.0, _t_kd * 1000.0, _t_kd / _t_ls * 100.0,))
+
+reader = None
+rmtree(_tmpd)
@@ -0,0 +1,112 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/optm.py [nstep] [nrun]
+# check that multi-tensor (torch._foreach_*) and flat-buffer steps of RAdam, Ranger and Lookahead (wrapping Adam) update parameters as the per-parameter implementations do under the GoogleLR schedule, that states of flat buffers can be saved and loaded to resume training, and report the time cost of an optimizer step on an NMT model.
+
+import sys
+
+import torch
+from torch import optim
+
+from transformer.NMT import NMT
+from optm.radam import RAdam
+from optm.ranger import Ranger
+from optm.lookahead import Lookahead
+from optm.multi_tensor import has_foreach
+from lrsch import GoogleLR
+
+from utils.base import set_random_seed
+from utils.bench import sync_device
+
+from time import time
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+nword = 8192
+
+def build_model(device):
+
+	set_random_seed(cnfg.seed, False)
+
+	return NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes).to(device)
+
+def build_lookahead(params, multi_tensor=False, flat_buffer=False, **kwargs):
+
+	params = list(params)
+
+	return Lookahead(params, optim.Adam(params, **kwargs), steps=2, multi_tensor=multi_tensor)
+
+# gradients are written in-place when they exist, as accumulated by the backward pass
+
+def set_grads(model, step):
+
+	torch.manual_seed(step)
+	for _p in model.parameters():
+		_g = torch.randn(_p.size(), dtype=_p.dtype).to(_p.device)
+		if _p.grad is None:
+			_p.grad = _g
+		else:
+			_p.grad.copy_(_g)
+
+# the schedule is applied to the wrapped optimizer of Lookahead
+
+def build_lrsch(optm):
+
+	return GoogleLR(optm.optimizer if isinstance(optm, Lookahead) else optm, cnfg.isize, cnfg.warm_step, scale=cnfg.lr_scale)
+
+def run(model, optm, lrsch, steps):
+
+	for _step in steps:
+		set_grads(model, _step)
+		optm.step()
+		lrsch.step()
+
+def max_diff(m1, m2):
+
+	return max((_p1 - _p2).abs().max().item() for _p1, _p2 in zip(m1.parameters(), m2.parameters()))
+
+def time_step(optm, nrun, device):
+
+	optm.step()
+	sync_device(device)
+	_st = time()
+	for _ in range(nrun):
+		optm.step()
+	sync_device(device)
+
+	return (time() - _st) / nrun
+
+nstep = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+nrun = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+device = torch.device("cuda", 0) if torch.cuda.is_available() else torch.device("cpu")
+
+if not has_foreach:
+	print("torch._foreach_* functions are not supported by pytorch %s, multi-tensor steps fall back to loops over parameters" % (torch.__version__,))
+
+for _name, _optm_func, _kwargs, _variants in (("RAdam", RAdam, {"betas": adam_betas_default, "eps": ieps_adam_default, "weight_decay": 1e-4}, ("multi_tensor", "flat_buffer",),), ("Ranger", Ranger, {"betas": adam_betas_default, "eps": ieps_adam_default, "steps": 2}, ("multi_tensor", "flat_buffer",),), ("Lookahead", build_lookahead, {"betas": adam_betas_default, "eps": ieps_adam_default}, ("multi_tensor",),),):
+	refm = build_model(device)
+	_ref_optm = _optm_func(refm.parameters(), lr=init_lr, **_kwargs)
+	run(refm, _ref_optm, build_lrsch(_ref_optm), range(nstep))
+	rs = []
+	for _variant in _variants:
+		_m = build_model(device)
+		_optm = _optm_func(_m.parameters(), lr=init_lr, **{_variant: True}, **_kwargs)
+		_lrsch = build_lrsch(_optm)
+		if _variant == "flat_buffer":
+			# save states in the middle of training and resume with a new optimizer, the learning rate is restored from the state dict, and the schedule continues on the new optimizer
+			run(_m, _optm, _lrsch, range(nstep // 2))
+			_state = _optm.state_dict()
+			_optm = _optm_func(_m.parameters(), lr=init_lr, **{_variant: True}, **_kwargs)
+			_optm.load_state_dict(_state)
+			_lrsch.optimizer = _optm
+			run(_m, _optm, _lrsch, range(nstep // 2, nstep))
+		else:
+			run(_m, _optm, _lrsch, range(nstep))
+		rs.append((_variant, max_diff(_m, refm), time_step(_optm, nrun, device),))
+		_m = _optm = _lrsch = None
+	# parameters of the reference model are changed by timing
+	_ref_t = time_step(_ref_optm, nrun, device)
+	print("%s: per-parameter step %.2f ms" % (_name, _ref_t * 1000.0,))
+	for _variant, _diff, _t in rs:
+		print("\t%s: max diff of parameters %.3e, step %.2f ms (%.1f%%)" % (_variant, _diff, _t * 1000.0, _t / _ref_t * 100.0,))
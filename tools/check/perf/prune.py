@@ -0,0 +1,93 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/prune.py bsize seql [nrun]
+# check on random data that models pruned by utils/prune.py compute the same outputs as unpruned models with removed heads/hidden units masked out, and are restored by utils.base.load_model_cpu from saved model files, then report the number of parameters and the time cost of the forward pass and beam search decoding of models pruned with different ratios of heads and hidden units.
+
+import sys
+
+import torch
+
+from copy import deepcopy
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+
+from utils.base import set_random_seed, save_model, load_model_cpu
+from utils.bench import time_func
+from utils.prune import ImportanceScorer
+from utils.fmt.base import pad_id
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+def build_model():
+
+	return NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+
+def count_parameters(model):
+
+	return sum(_p.numel() for _p in model.parameters())
+
+def get_scorer(model):
+
+	model.eval()
+	scorer = ImportanceScorer(model)
+	lossf(model(seq_batch, seq_o.narrow(1, 0, seql)), seq_o.narrow(1, 1, seql).contiguous()).backward()
+	model.zero_grad(set_to_none=True)
+	scorer.close()
+
+	return scorer
+
+# zero the columns of the output Linear modules of removed heads/units, which is equivalent to removing them
+
+def mask_model(model, groups, spec):
+
+	_modules = dict(model.named_modules())
+	with torch.no_grad():
+		for _name, (_, _gsize, _,) in groups.items():
+			_lin = _modules[_name].outer if hasattr(_modules[_name], "outer") else _modules[_name].net[-2 if len(_modules[_name].net) > 3 else -1]
+			_mask = torch.ones(_lin.weight.size(-1) // _gsize, dtype=torch.bool)
+			_mask[spec[_name]] = False
+			_lin.weight.masked_fill_(_mask.repeat_interleave(_gsize).unsqueeze(0), 0.0)
+
+	return model
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+lossf = LabelSmoothingLoss(nword, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+seq_o = torch.randint(4, nword, (bsize, seql + 1,), dtype=torch.long)
+
+base_model = build_model()
+scorer = get_scorer(base_model)
+
+masked_model = mask_model(deepcopy(base_model), scorer.groups, scorer.get_spec(0.5, 0.5))
+pruned_model = scorer.prune(0.5, 0.5)
+with torch.no_grad():
+	_out = pruned_model(seq_batch, seq_o.narrow(1, 0, seql))
+	# outputs are log-probabilities of large magnitude, compared with a relative tolerance
+	print("pruned model matched the masked model: %s" % (torch.allclose(_out, masked_model(seq_batch, seq_o.narrow(1, 0, seql)), rtol=1e-5, atol=1e-3),))
+	_tmpd = mkdtemp()
+	try:
+		save_model(pruned_model, _tmpd + "/pruned.h5")
+		_load_model = load_model_cpu(_tmpd + "/pruned.h5", build_model())
+		_load_model.eval()
+		print("pruned model restored from the model file: %s" % (_out.equal(_load_model(seq_batch, seq_o.narrow(1, 0, seql))),))
+	finally:
+		rmtree(_tmpd)
+
+_t_base = None
+for _ratio in (0.0, 0.25, 0.5, 0.75,):
+	_model = get_scorer(build_model()).prune(_ratio, _ratio)
+	with torch.no_grad():
+		_t_fwd = time_func(lambda: _model(seq_batch, seq_o.narrow(1, 0, seql)), nrun=nrun, backward=False)
+		_t_dec = time_func(lambda: _model.decode(seq_batch, cnfg.beam_size, seql, cnfg.length_penalty), nrun=nrun, backward=False)
+		if _t_base is None:
+			_t_base = (_t_fwd, _t_dec,)
+		print("prune %.2f of heads and hidden units: %d parameters, forward %.2f ms (%.1f%%), decoding %.2f ms (%.1f%%)" % (_ratio, count_parameters(_model), _t_fwd * 1000.0, _t_fwd / _t_base[0] * 100.0, _t_dec * 1000.0, _t_dec / _t_base[1] * 100.0,))
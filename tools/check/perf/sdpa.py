@@ -0,0 +1,73 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/sdpa.py bsize seql [nrun]
+# check the parity of the fused scaled_dot_product_attention backend (cnfg/hyp.py:attention_backend) against the standard attention implementation with an encoder on random data, and report the time cost of forward and forward/backward passes.
+
+import sys
+
+import torch
+
+from transformer.Encoder import Encoder
+from modules.base import SelfAttn, CrossAttn, MultiHeadAttn
+from modules.attn import scaled_dot_product_attention
+
+from utils.base import set_random_seed, report_parameters
+from utils.bench import time_func
+from utils.fmt.base import parse_double_value_tuple
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+def set_sdpa(modin, value):
+
+	for _m in modin.modules():
+		if isinstance(_m, (SelfAttn, CrossAttn, MultiHeadAttn,)) and isinstance(_m.normer, torch.nn.Softmax) and (getattr(_m, "rel_pemb", None) is None):
+			_m.use_sdpa = value
+
+if scaled_dot_product_attention is None:
+	print("scaled_dot_product_attention is not supported by pytorch %s" % (torch.__version__,))
+	sys.exit(1)
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+# dropout disabled for the parity check
+mymodel = Encoder(cnfg.isize, nword, parse_double_value_tuple(cnfg.nlayer)[0], cnfg.ff_hsize, 0.0, 0.0, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output)
+print("Encoder with %d parameters" % (report_parameters(mymodel),))
+
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+# pad the first sequence for a quarter of its length
+seq_batch[0, seql - seql // 4:] = 0
+mask = seq_batch.eq(0).unsqueeze(1)
+
+def fwd_func():
+
+	return mymodel(seq_batch, mask)
+
+def fwd_loss():
+
+	return fwd_func().sum()
+
+rs = {}
+for _sdpa in (False, True,):
+	set_sdpa(mymodel, _sdpa)
+	mymodel.train()
+	mymodel.zero_grad()
+	_out = fwd_func()
+	_out.sum().backward()
+	_grads = [_p.grad.clone() for _p in mymodel.parameters() if _p.grad is not None]
+	mymodel.zero_grad()
+	_tb = time_func(fwd_loss, nrun=nrun)
+	mymodel.zero_grad()
+	mymodel.eval()
+	with torch.no_grad():
+		_tf = time_func(fwd_func, nrun=nrun, backward=False)
+	rs[_sdpa] = (_out.detach(), _grads, _tf, _tb,)
+
+_std, _fused = rs[False], rs[True]
+print("max diff of outputs: %.3e, gradients: %.3e" % ((_std[0] - _fused[0]).abs().max().item(), max((_g1 - _g2).abs().max().item() for _g1, _g2 in zip(_std[1], _fused[1]))))
+print("standard: forward %.2f ms, forward/backward %.2f ms" % (_std[2] * 1000.0, _std[3] * 1000.0,))
+print("sdpa: forward %.2f ms (%.1f%%), forward/backward %.2f ms (%.1f%%)" % (_fused[2] * 1000.0, _fused[2] / _std[2] * 100.0, _fused[3] * 1000.0, _fused[3] / _std[3] * 100.0,))
@@ -0,0 +1,65 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/serve.py $model.h5 $src.vcb $tgt.vcb [$nworker] [$nthreads]
+# start $nworker processes building TranslatorCore as server.py does, with weights loaded from the h5 model file by each process, and with weights mapped copy-on-write from the flat weight file (share_weights=True, utils/mapped.py), and report the startup time and the memory cost (RSS, and PSS which divides shared pages among the processes sharing them) of workers.
+
+import sys
+
+from time import time
+from multiprocessing import get_context
+
+from translator import TranslatorCore
+from utils.mapped import ensure_mapped
+
+import cnfg.base as cnfg
+
+# returns: (rss, pss) in MB, pss is None if /proc/self/smaps_rollup is not available
+
+def mem_usage():
+
+	rss = pss = None
+	try:
+		with open("/proc/self/smaps_rollup") as f:
+			for line in f:
+				if line.startswith("Rss:"):
+					rss = float(line.split()[1]) / 1024.0
+				elif line.startswith("Pss:"):
+					pss = float(line.split()[1]) / 1024.0
+	except Exception:
+		with open("/proc/self/status") as f:
+			for line in f:
+				if line.startswith("VmRSS:"):
+					rss = float(line.split()[1]) / 1024.0
+
+	return rss, pss
+
+def worker(modf, vcbi, vcbt, share_weights, nthreads, barrier, queue):
+
+	_st = time()
+	core = TranslatorCore(modf, vcbi, vcbt, cnfg, share_weights=share_weights, num_threads=nthreads)
+	_lt = time() - _st
+	# touch all weights with a translation
+	core(["."])
+	barrier.wait()
+	queue.put((_lt,) + mem_usage())
+	barrier.wait()
+
+def handle(modf, vcbi, vcbt, nworker=8, nthreads=1):
+
+	_st = time()
+	ensure_mapped(modf)
+	print("flat weight file ready in %.2f s" % (time() - _st,))
+	_ctx = get_context("spawn")
+	for share_weights in (False, True,):
+		barrier, queue = _ctx.Barrier(nworker), _ctx.Queue()
+		_pl = [_ctx.Process(target=worker, args=(modf, vcbi, vcbt, share_weights, nthreads, barrier, queue,)) for _ in range(nworker)]
+		for _p in _pl:
+			_p.start()
+		rs = [queue.get() for _ in range(nworker)]
+		for _p in _pl:
+			_p.join()
+		_lt, _rss, _pss = zip(*rs)
+		print("%s: startup %.2f s (max %.2f s), RSS %.1f MB in total (%.1f MB per worker), PSS %s MB in total" % ("mapped" if share_weights else "h5", sum(_lt) / nworker, max(_lt), sum(_rss), sum(_rss) / nworker, "n/a" if None in _pss else ("%.1f" % sum(_pss))))
+
+if __name__ == "__main__":
+	handle(sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 8, int(sys.argv[5]) if len(sys.argv) > 5 else 1)
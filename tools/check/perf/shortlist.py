@@ -0,0 +1,47 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/shortlist.py bsize seql [ncand] [nrun]
+# check that greedy decoding with a vocabulary shortlist (utils/shortlist.py, cnfg/base.py:shortlist) containing the words chosen with the whole vocabulary gives the same translations, that beam search with a shortlist of the whole vocabulary gives the same translations as beam search without shortlist, and compare the time cost of beam search with the whole vocabulary and with shortlists of ncand random candidates per source token and cnfg/base.py:shortlist_topk frequent words on random data.
+
+import sys
+
+import torch
+
+from transformer.NMT import NMT
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.shortlist import Shortlist, restrict_decoders
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+ncand = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+nrun = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+nword = 32768
+
+set_random_seed(cnfg.seed, False)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+mymodel.eval()
+
+seq_batch = torch.randint(4, nword, (bsize, seql,), dtype=torch.long)
+shortlist = Shortlist(torch.randint(4, nword, (nword, ncand,), dtype=torch.long), nword, cnfg.shortlist_topk)
+
+with torch.no_grad():
+	_full = mymodel.decode(seq_batch, 1, seql)
+	ids = torch.cat((torch.arange(4, dtype=torch.long), _full.view(-1), shortlist(seq_batch),), 0).unique(sorted=True)
+	with restrict_decoders(mymodel, ids):
+		_rs = mymodel.decode(seq_batch, 1, seql)
+	_rs = ids.index_select(0, _rs.view(-1)).view_as(_rs)
+	print("greedy decoding with a shortlist of %d words matched: %s" % (ids.numel(), _full.equal(_rs),))
+
+	_full = mymodel.decode(seq_batch, cnfg.beam_size, seql, cnfg.length_penalty)
+	_rs = Shortlist(shortlist.cands, nword, nword).decode(mymodel, seq_batch, cnfg.beam_size, seql, cnfg.length_penalty)
+	print("beam search (beam size %d) with a shortlist of the whole vocabulary matched: %s" % (cnfg.beam_size, _full.equal(_rs),))
+
+	print("shortlist of the batch: %d in %d words" % (shortlist(seq_batch).numel(), nword,))
+	_t_full = time_func(lambda: mymodel.decode(seq_batch, cnfg.beam_size, seql, cnfg.length_penalty), nrun=nrun, backward=False)
+	_t_sl = time_func(lambda: shortlist.decode(mymodel, seq_batch, cnfg.beam_size, seql, cnfg.length_penalty), nrun=nrun, backward=False)
+	print("beam search: whole vocabulary %.2f ms, shortlist %.2f ms (%.1f%%)" % (_t_full * 1000.0, _t_sl * 1000.0, _t_sl / _t_full * 100.0,))
@@ -0,0 +1,66 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/threads.py bsize seql [nbatch]
+# decode nbatch random batches on CPU with each split of the CPU cores into (number of processes) x (intra-op threads per process), as predict.py does with cnfg/base.py:decode_num_processes and cpu_num_threads, report the throughput of each split and suggest the best one for this machine.
+
+import sys
+
+import torch
+
+from time import time
+from multiprocessing import Pool, Queue
+
+from transformer.NMT import NMT
+
+from utils.base import set_random_seed
+from utils.cpu import get_cpus, setup_threads
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+bsize, seql = int(sys.argv[1]), int(sys.argv[2])
+nbatch = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+nword = 32768
+
+# keep the main process single-threaded so that no OpenMP thread pool is started before forking workers
+torch.set_num_threads(1)
+set_random_seed(cnfg.seed, False)
+
+mymodel = NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+mymodel.eval()
+
+batches = [torch.randint(4, nword, (bsize, seql,), dtype=torch.long) for _ in range(nbatch)]
+
+def decode_batch(bid):
+
+	with torch.no_grad():
+		mymodel.decode(batches[bid], cnfg.beam_size, seql, cnfg.length_penalty)
+
+	return bid
+
+def init_worker(rank_queue, nproc, num_threads, cpus):
+
+	setup_threads(rank_queue.get(), nproc, num_threads, cnfg.cpu_interop_threads, cnfg.cpu_affinity, cpus)
+
+cpus = get_cpus()
+ncpu = len(cpus)
+print("%d CPU cores, %d batches of %d x %d tokens" % (ncpu, nbatch, bsize, seql,))
+
+rs = []
+for nproc in [_n for _n in range(1, ncpu + 1) if ncpu % _n == 0]:
+	num_threads = ncpu // nproc
+	rank_queue = Queue()
+	for _i in range(nproc):
+		rank_queue.put(_i)
+	# workers are forked and set up before timing
+	with Pool(nproc, initializer=init_worker, initargs=(rank_queue, nproc, num_threads, cpus,)) as pool:
+		pool.map(decode_batch, list(range(nproc)), chunksize=1)
+		_st = time()
+		for _ in pool.imap(decode_batch, range(nbatch)):
+			pass
+		_cost = time() - _st
+	rs.append((nbatch * bsize / _cost, nproc, num_threads,))
+	print("%d processes x %d threads: %.2f sentences/s" % (nproc, num_threads, rs[-1][0],))
+
+_speed, nproc, num_threads = max(rs)
+print("best: decode_num_processes = %d, cpu_num_threads = %d (%.2f sentences/s)" % (nproc, num_threads, _speed,))
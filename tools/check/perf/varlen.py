@@ -0,0 +1,92 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/varlen.py data.h5 [ntime] [nrun]
+# report the fraction of <pad> tokens and the encoder FLOPs saved by the packed (padding-free) encoder (cnfg/hyp.py:packed_encoder) for each batch of a training set, then check the parity of the packed encoder against the padded one and compare their time costs on the ntime most padded batches.
+
+import sys
+
+import torch
+
+import h5py
+
+from transformer.Encoder import Encoder
+
+from utils.base import set_random_seed
+from utils.bench import time_func
+from utils.fmt.base import pad_id, parse_double_value_tuple
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+def set_packed(modin, value):
+
+	for _m in modin.modules():
+		if "packed" in dir(_m):
+			_m.packed = value
+
+# FLOPs (multiply-add counted as 2) of one encoder layer for a token, the token-wise part (attention projections, output projection and the feed-forward network) and the attention over a sequence of length seql (computed on the padded layout in both cases).
+
+def token_flops(isize, ahsize, fhsize):
+
+	return 2 * (3 * isize * ahsize + ahsize * isize + 2 * isize * fhsize)
+
+def attn_flops(ahsize, seql):
+
+	return 4 * seql * ahsize
+
+td = h5py.File(sys.argv[1], "r")
+ntime = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+nrun = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+ndata = td["ndata"][:].item()
+nwordi = td["nword"][:].tolist()[0]
+src_grp = td["src"]
+
+nlayer = parse_double_value_tuple(cnfg.nlayer)[0]
+isize = cnfg.isize
+ahsize = isize if cnfg.attn_hsize is None else cnfg.attn_hsize
+fhsize = isize * 4 if cnfg.ff_hsize is None else cnfg.ff_hsize
+_tflops = token_flops(isize, ahsize, fhsize)
+
+stat = []
+sum_tok = sum_pad = sum_full = sum_saved = 0
+for i in range(ndata):
+	seq_batch = src_grp[str(i)][:]
+	bsize, seql = seq_batch.shape
+	_ntok = bsize * seql
+	_npad = int((seq_batch == pad_id).sum())
+	_full = _ntok * (_tflops + attn_flops(ahsize, seql)) * nlayer
+	_saved = _npad * _tflops * nlayer
+	stat.append((_npad / _ntok, i,))
+	sum_tok += _ntok
+	sum_pad += _npad
+	sum_full += _full
+	sum_saved += _saved
+	print("batch %d: %d x %d, pad %.2f%%, encoder GFLOPs %.3f, saved %.3f (%.2f%%)" % (i, bsize, seql, _npad / _ntok * 100.0, _full / 1e9, _saved / 1e9, _saved / _full * 100.0,))
+
+print("%d batches, %d tokens, pad %.2f%%, encoder GFLOPs %.3f, saved %.3f (%.2f%%)" % (ndata, sum_tok, sum_pad / sum_tok * 100.0, sum_full / 1e9, sum_saved / 1e9, sum_saved / sum_full * 100.0,))
+
+set_random_seed(cnfg.seed, False)
+
+# dropout disabled for the parity check
+mymodel = Encoder(isize, nwordi, nlayer, fhsize, 0.0, 0.0, cnfg.nhead, cache_len_default, ahsize, cnfg.norm_output)
+mymodel.train()
+
+stat.sort(reverse=True)
+for _pr, i in stat[:ntime]:
+	seq_batch = torch.from_numpy(src_grp[str(i)][:]).long()
+	mask = seq_batch.eq(pad_id).unsqueeze(1)
+	_nmask = mask.squeeze(1).unsqueeze(-1)
+	_fwd_loss = lambda: mymodel(seq_batch, mask).masked_fill(_nmask, 0.0).sum()
+	rs = {}
+	for _packed in (False, True,):
+		set_packed(mymodel, _packed)
+		mymodel.zero_grad()
+		_out = mymodel(seq_batch, mask).masked_fill(_nmask, 0.0)
+		_out.sum().backward()
+		rs[_packed] = (_out.detach(), [_p.grad.clone() for _p in mymodel.parameters() if _p.grad is not None], time_func(_fwd_loss, nrun=nrun),)
+	mymodel.zero_grad()
+	_std, _pk = rs[False], rs[True]
+	print("batch %d (pad %.2f%%): max diff of outputs: %.3e, gradients: %.3e, padded %.2f ms, packed %.2f ms (%.1f%%)" % (i, _pr * 100.0, (_std[0] - _pk[0]).abs().max().item(), max((_g1 - _g2).abs().max().item() for _g1, _g2 in zip(_std[1], _pk[1])), _std[2] * 1000.0, _pk[2] * 1000.0, _pk[2] / _std[2] * 100.0,))
+
+td.close()
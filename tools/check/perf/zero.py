@@ -0,0 +1,110 @@
+#encoding: utf-8
+
+# usage: python tools/check/perf/zero.py nproc [nstep]
+# spawn nproc local processes with the gloo backend, check that ShardedOptimizer (cnfg/base.py:zero_optimizer) wrapping Adam, RAdam and Ranger under the GoogleLR schedule updates parameters as the non-sharded optimizer does, report the optimizer state size per process, and check that gathered and sharded states saved with h5save can be loaded back.
+
+import sys
+
+import torch
+from torch import optim
+from torch import multiprocessing as mp
+
+from os import environ, remove
+from os.path import exists as p_check
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from transformer.NMT import NMT
+from optm.radam import RAdam
+from optm.ranger import Ranger
+from optm.zero import ShardedOptimizer, h5save_optm, h5load_optm, get_shard_fname
+from parallel.dist import init_dist, close_dist, is_master
+from lrsch import GoogleLR
+
+from utils.base import set_random_seed
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+nword = 8192
+
+def build_model():
+
+	set_random_seed(cnfg.seed, False)
+
+	return NMT(cnfg.isize, nword, nword, cnfg.nlayer, cnfg.ff_hsize, 0.0, 0.0, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+
+def set_grads(model, step):
+
+	torch.manual_seed(step)
+	for _p in model.parameters():
+		_p.grad = torch.randn_like(_p)
+
+def state_size(optm):
+
+	_optm = optm.optimizer if isinstance(optm, ShardedOptimizer) else optm
+	if _optm is None:
+		return 0
+
+	return sum(_v.numel() * _v.element_size() for _s in _optm.state.values() for _v in _s.values() if isinstance(_v, torch.Tensor))
+
+def run(model, optm, nstep):
+
+	lrsch = GoogleLR(optm, cnfg.isize, cnfg.warm_step, scale=cnfg.lr_scale)
+	for _step in range(nstep):
+		set_grads(model, _step)
+		optm.step()
+		lrsch.step()
+
+def max_diff(m1, m2):
+
+	return max((_p1 - _p2).abs().max().item() for _p1, _p2 in zip(m1.parameters(), m2.parameters()))
+
+def worker(rank, nproc, nstep, wkdir):
+
+	environ["RANK"], environ["WORLD_SIZE"], environ["LOCAL_RANK"] = str(rank), str(nproc), str(rank)
+	init_dist("gloo")
+	torch.set_num_threads(1)
+
+	for _name, _optm_func, _kwargs in (("Adam", optim.Adam, {"betas": adam_betas_default, "eps": ieps_adam_default},), ("RAdam", RAdam, {"betas": adam_betas_default, "eps": ieps_adam_default},), ("Ranger", Ranger, {"betas": adam_betas_default, "eps": ieps_adam_default, "steps": 2},),):
+		_m = build_model()
+		_optm = ShardedOptimizer(_m.parameters(), _optm_func, lr=init_lr, **_kwargs)
+		run(_m, _optm, nstep)
+		if is_master():
+			refm = build_model()
+			_ref_optm = _optm_func(refm.parameters(), lr=init_lr, **_kwargs)
+			run(refm, _ref_optm, nstep)
+			print("%s: max diff of parameters: %.3e, optimizer state of process 0: %.2f MB, non-sharded: %.2f MB" % (_name, max_diff(_m, refm), state_size(_optm) / 1048576.0, state_size(_ref_optm) / 1048576.0,))
+
+		for _gather in (True, False,):
+			_optm.gather_state = _gather
+			_fname = "%s/%s.optm.h5" % (wkdir, _name,)
+			h5save_optm(_optm, _fname)
+			torch.distributed.barrier()
+			_m2 = build_model()
+			_optm2 = ShardedOptimizer(_m2.parameters(), _optm_func, gather_state=_gather, lr=init_lr, **_kwargs)
+			h5load_optm(_optm2, _fname)
+			_st1, _st2 = _optm.local_state_dict()["state"], _optm2.local_state_dict()["state"]
+			_diff = max([0.0] + [(_st1[_k][_sk].float() - _st2[_k][_sk].float()).abs().max().item() for _k in _st1 for _sk in _st1[_k] if isinstance(_st1[_k][_sk], torch.Tensor)])
+			_diff = torch.tensor([_diff], dtype=torch.double)
+			torch.distributed.all_reduce(_diff, op=torch.distributed.ReduceOp.MAX)
+			_diff = _diff.item()
+			if is_master():
+				print("\t%s states saved and loaded, max diff: %.3e" % ("gathered" if _gather else "sharded", _diff,))
+			torch.distributed.barrier()
+			if is_master():
+				for _f in [_fname] + [get_shard_fname(_fname, _r) for _r in range(nproc)]:
+					if p_check(_f):
+						remove(_f)
+
+	close_dist()
+
+if __name__ == "__main__":
+
+	nproc = int(sys.argv[1])
+	nstep = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+	environ.setdefault("MASTER_ADDR", "127.0.0.1")
+	environ.setdefault("MASTER_PORT", "29500")
+	wkdir = mkdtemp()
+	mp.spawn(worker, args=(nproc, nstep, wkdir,), nprocs=nproc)
+	rmtree(wkdir)
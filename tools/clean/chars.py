@@ -2,6 +2,8 @@
 
 import sys
 
+from utils.fmt.clean import legal_chars
+
 # cratio: number of "@@" ended tokens / number of all tokens
 # bratio: number of bpe tokens / number of tokens before bpe processing
 # sratio: number of tokens seperated by bpe / number of tokens before bpe processing
@@ -11,49 +13,6 @@ import sys
 
 def handle(srcfs, srcft, tgtfs, tgtft, cratio=0.8, bratio=5.0, sratio=0.8, pratio=3.0, oratio=3.0, num_rules_drop=1):
 
-	def legal_mono(strin, cratio, bratio, sratio):
-		ntokens = nchars = nsp = nrule = 0
-		pbpe = False
-		for tmpu in strin.split():
-			if tmpu:
-				if tmpu.endswith("@@"):
-					nchars += 1
-					if not pbpe:
-						pbpe = True
-						nsp += 1
-				elif pbpe:
-					pbpe = False
-				ntokens += 1
-		ntokens = float(ntokens)
-		lorigin = float(len(strin.replace("@@ ", "").split()))
-		if float(nchars) / ntokens > cratio:
-			nrule += 1
-		if ntokens / lorigin > bratio:
-			nrule += 1
-		if float(nsp) / lorigin > sratio:
-			nrule += 1
-		return nrule, ntokens, lorigin
-
-	def legal(strins, strint, cratio, bratio, sratio, pratio, oratio, num_rules_drop):
-
-		def ratio_bilingual(ls, lt):
-			if ls > lt:
-				return ls / lt
-			else:
-				return lt / ls
-
-		ls, lens, lenso = legal_mono(strins, cratio, bratio, sratio)
-		lt, lent, lento = legal_mono(strint, cratio, bratio, sratio)
-		nrule = max(ls, lt)
-		if ratio_bilingual(lens, lent) > pratio:
-			nrule += 1
-		if ratio_bilingual(lenso, lento) > oratio:
-			nrule += 1
-		if nrule < num_rules_drop:
-			return True
-		else:
-			return False
-
 	ens = "\n".encode("utf-8")
 
 	with open(srcfs, "rb") as fs, open(srcft, "rb") as ft, open(tgtfs, "wb") as fsw, open(tgtft, "wb") as ftw:
@@ -63,7 +22,7 @@ def handle(srcfs, srcft, tgtfs, tgtft, cratio=0.8, bratio=5.0, sratio=0.8, prati
 				ls, lt = ls.strip(), lt.strip()
 				if ls and lt:
 					ls, lt = ls.decode("utf-8"), lt.decode("utf-8")
-					if (num_rules_drop > 5) or legal(ls, lt, cratio, bratio, sratio, pratio, oratio, num_rules_drop):
+					if (num_rules_drop > 5) or legal_chars(ls, lt, cratio, bratio, sratio, pratio, oratio, num_rules_drop):
 						fsw.write(ls.encode("utf-8"))
 						fsw.write(ens)
 						ftw.write(lt.encode("utf-8"))
@@ -1,14 +1,14 @@
 #encoding: utf-8
 
+# usage: python tools/clean/maxkeeper.py $srcf $tgtf $rsf_src $rsf_tgt $max_len [$exact]
+# keep only the most frequent translations of each source, sources and targets are identified by hashes (cnfg/hyp.py:dedup_hash_bits) rather than kept as strings, counts are spilled to disk beyond cnfg/hyp.py:dedup_max_keys pairs, and each kept pair is written once at its first occurrence. With exact (any value but 0), pairs of sources seen more than once are counted again with full strings in a verification pass, so that hash collisions can not drop pairs.
+
 import sys
 
 from utils.fmt.base import clean_liststr_lentok
+from utils.fmt.dedup import hash_str, MaxFreqKeeper
 
-def handle(srcfs, srcft, tgtfs, tgtft, max_len=256):
-
-	_max_len = max(1, max_len - 2)
-
-	data = {}
+def pair_reader(srcfs, srcft, max_len):
 
 	with open(srcfs, "rb") as fs, open(srcft, "rb") as ft:
 		for ls, lt in zip(fs, ft):
@@ -16,59 +16,33 @@ def handle(srcfs, srcft, tgtfs, tgtft, max_len=256):
 			if ls and lt:
 				ls, slen = clean_liststr_lentok(ls.decode("utf-8").split())
 				lt, tlen = clean_liststr_lentok(lt.decode("utf-8").split())
-				if (slen <= _max_len) and (tlen <= _max_len):
-					if ls in data:
-						data[ls][lt] = data[ls].get(lt, 0) + 1
-					else:
-						data[ls] = {lt: 1}
+				if (slen <= max_len) and (tlen <= max_len):
+					yield ls, lt
+
+def handle(srcfs, srcft, tgtfs, tgtft, max_len=256, exact=False, **kwargs):
+
+	_max_len = max(1, max_len - 2)
 
-	_clean = {}
-	for ls, v in data.items():
-		if len(v) > 1:
-			rlt = []
-			_maxf = 0
-			for key, value in v.items():
-				if value > _maxf:
-					_maxf = value
-					rlt = [key]
-				elif value == _maxf:
-					rlt.append(key)
-			for lt in rlt:
-				if lt in _clean:
-					_clean[lt][ls] = _clean[lt].get(ls, 0) + 1
-				else:
-					_clean[lt] = {ls: 1}
-		else:
-			lt = list(v.keys())[0]
-			if lt in _clean:
-				_clean[lt][ls] = _clean[lt].get(ls, 0) + 1
-			else:
-				_clean[lt] = {ls: 1}
+	keeper = MaxFreqKeeper(exact=exact, **kwargs)
+	nbits = keeper.nbits
+	for ls, lt in pair_reader(srcfs, srcft, _max_len):
+		keeper.add(hash_str(ls, nbits), hash_str(lt, nbits))
+	keeper.finish()
 
-	data = _clean
+	if exact:
+		for ls, lt in pair_reader(srcfs, srcft, _max_len):
+			keeper.verify(hash_str(ls, nbits), ls, lt)
+		keeper.finish_verify()
 
 	ens = "\n".encode("utf-8")
 
 	with open(tgtfs, "wb") as fs, open(tgtft, "wb") as ft:
-		for lt, v in data.items():
-			if len(v) > 1:
-				rls = []
-				_maxf = 0
-				for key, value in v.items():
-					if value > _maxf:
-						_maxf = value
-						rls = [key]
-					elif value == _maxf:
-						rls.append(key)
-				rlt = "\n".join([lt for i in range(len(rls))])
-				rls = "\n".join(rls)
-			else:
-				rlt = lt
-				rls = list(v.keys())[0]
-			fs.write(rls.encode("utf-8"))
-			fs.write(ens)
-			ft.write(rlt.encode("utf-8"))
-			ft.write(ens)
+		for ls, lt in pair_reader(srcfs, srcft, _max_len):
+			if keeper.keep(hash_str(ls, nbits), hash_str(lt, nbits), ls, lt):
+				fs.write(ls.encode("utf-8"))
+				fs.write(ens)
+				ft.write(lt.encode("utf-8"))
+				ft.write(ens)
 
 if __name__ == "__main__":
-	handle(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]))
+	handle(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5]), (sys.argv[6] != "0") if len(sys.argv) > 6 else False)
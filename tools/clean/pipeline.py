@@ -0,0 +1,181 @@
+#encoding: utf-8
+
+# usage: python tools/clean/pipeline.py $srcf $tgtf $rsf_src $rsf_tgt $stage1 [$stage2 ...]
+# clean a parallel corpus with several filters of tools/clean in one streaming pass (two passes with maxkeeper), pairs are processed in chunks (byte ranges of the corpus) by a pool of cnfg/hyp.py:data_num_processes processes, and the output is written once in the order of the input. Stages are applied in the given order, and specified as:
+#	maxkeeper:$max_len, keep the most frequent translations of each source (tools/clean/maxkeeper.py), sources and targets are identified by hashes rather than kept as strings (utils/fmt/dedup.py, counts are spilled to disk beyond cnfg/hyp.py:dedup_max_keys pairs), and each kept pair is written once at its first occurrence rather than grouped by targets. Filters before maxkeeper decide which pairs are counted, filters after it are applied on kept pairs.
+#	tokens:$maxlen (tools/clean/tokens.py)
+#	chars:$cratio,$bratio,$sratio,$pratio,$oratio,$num_rules_drop (tools/clean/chars.py)
+#	vocab:$vcbfs,$vcbft,$vratio[,$dratio] (tools/clean/vocab.py, vocabulary files should be built before cleaning)
+
+import sys
+
+from os.path import getsize
+from multiprocessing import Pool
+
+from utils.fmt.base import clean_liststr_lentok, ldvocab_list, legal_vocab
+from utils.fmt.clean import legal_chars
+from utils.fmt.dedup import hash_str, MaxFreqKeeper
+from utils.fmt.parallel import get_nproc, split_aligned_files, range_reader
+
+from cnfg.hyp import dedup_hash_bits
+
+# size of chunks in bytes of the source file
+chunk_size = 33554432
+
+def build_tokens(maxlen):
+
+	def _filter(ls, lt):
+
+		ls, lens = clean_liststr_lentok(ls.split())
+		lt, lent = clean_liststr_lentok(lt.split())
+
+		return (ls, lt,) if (lens <= maxlen) and (lent <= maxlen) else None
+
+	return _filter
+
+def build_chars(cratio, bratio, sratio, pratio, oratio, num_rules_drop):
+
+	def _filter(ls, lt):
+
+		return (ls, lt,) if (num_rules_drop > 5) or ((num_rules_drop > 0) and legal_chars(ls, lt, cratio, bratio, sratio, pratio, oratio, num_rules_drop)) else None
+
+	return _filter
+
+def build_vocab(vcbfs, vcbft, vratio, dratio=None):
+
+	_dratio = vratio if dratio is None else dratio
+	vcbs, nvs = ldvocab_list(vcbfs)
+	vcbt, nvt = ldvocab_list(vcbft)
+	ilgs = set(vcbs[int(float(nvs) * (1.0 - vratio)):])
+	ilgt = set(vcbt[int(float(nvt) * (1.0 - vratio)):])
+
+	def _filter(ls, lt):
+
+		return (ls, lt,) if legal_vocab(ls, ilgs, _dratio) and legal_vocab(lt, ilgt, _dratio) else None
+
+	return _filter
+
+def parse_stages(stages):
+
+	pre, post, dedup = [], [], False
+	for stage in stages:
+		_name, _, _args = stage.partition(":")
+		_args = _args.split(",") if _args else []
+		_name = _name.lower()
+		_filters = post if dedup else pre
+		if _name == "maxkeeper":
+			_filters.append(build_tokens(max(1, int(_args[0]) - 2) if _args else 254))
+			dedup = True
+		elif _name == "tokens":
+			_filters.append(build_tokens(int(_args[0]) if _args else 256))
+		elif _name == "chars":
+			_filters.append(build_chars(*[float(_arg) for _arg in _args[:5]], int(_args[5])))
+		elif _name == "vocab":
+			_filters.append(build_vocab(_args[0], _args[1], float(_args[2]), float(_args[3]) if len(_args) > 3 else None))
+		else:
+			raise ValueError("unknown cleaning stage: %s" % (stage,))
+
+	return pre, post, dedup
+
+def apply_filters(filters, ls, lt):
+
+	for _filter in filters:
+		_rs = _filter(ls, lt)
+		if _rs is None:
+			return None
+		ls, lt = _rs
+
+	return ls, lt
+
+# filters are built once in each worker process
+
+pre_filters = post_filters = None
+use_dedup = False
+
+def init_worker(stages):
+
+	global pre_filters, post_filters, use_dedup
+
+	pre_filters, post_filters, use_dedup = parse_stages(stages)
+
+def pair_reader(srcf, tgtf, ranges):
+
+	(_ss, _se,), (_ts, _te,) = ranges
+	for ls, lt in zip(range_reader(srcf, _ss, _se), range_reader(tgtf, _ts, _te)):
+		ls, lt = ls.strip(), lt.strip()
+		if ls and lt:
+			yield ls.decode("utf-8"), lt.decode("utf-8")
+
+# the first pass of maxkeeper
+# returns: keys of pairs passing filters before maxkeeper
+
+def count_chunk(srcf, tgtf, ranges):
+
+	rs = []
+	for ls, lt in pair_reader(srcf, tgtf, ranges):
+		_rs = apply_filters(pre_filters, ls, lt)
+		if _rs is not None:
+			rs.append((hash_str(_rs[0], dedup_hash_bits), hash_str(_rs[1], dedup_hash_bits),))
+
+	return rs
+
+# returns: (number of pairs, [(source, target, keys of the pair for maxkeeper or None)])
+
+def clean_chunk(srcf, tgtf, ranges):
+
+	total, rs = 0, []
+	for ls, lt in pair_reader(srcf, tgtf, ranges):
+		total += 1
+		_rs = apply_filters(pre_filters, ls, lt)
+		if _rs is not None:
+			_keys = (hash_str(_rs[0], dedup_hash_bits), hash_str(_rs[1], dedup_hash_bits),) if use_dedup else None
+			_rs = apply_filters(post_filters, *_rs)
+			if _rs is not None:
+				rs.append((_rs[0], _rs[1], _keys,))
+
+	return total, rs
+
+def map_chunks(pool, func, tasks):
+
+	return (func(*_task) for _task in tasks) if pool is None else pool.imap(star_func, [(func,) + _task for _task in tasks])
+
+def star_func(args):
+
+	return args[0](*args[1:])
+
+def handle(srcfs, srcft, tgtfs, tgtft, stages, nproc=None):
+
+	_nproc = get_nproc(nproc)
+	tasks = [(srcfs, srcft, _ranges,) for _ranges in split_aligned_files([srcfs, srcft], max(_nproc * 4, getsize(srcfs) // chunk_size + 1))]
+	init_worker(stages)
+	pool = Pool(_nproc, initializer=init_worker, initargs=(stages,)) if (_nproc > 1) and (len(tasks) > 1) else None
+
+	keeper = None
+	if use_dedup:
+		keeper = MaxFreqKeeper()
+		for _rs in map_chunks(pool, count_chunk, tasks):
+			for _ks, _kt in _rs:
+				keeper.add(_ks, _kt)
+		keeper.finish()
+
+	ens = "\n".encode("utf-8")
+	total = keep = 0
+	with open(tgtfs, "wb") as fsw, open(tgtft, "wb") as ftw:
+		for _total, _rs in map_chunks(pool, clean_chunk, tasks):
+			total += _total
+			for ls, lt, _keys in _rs:
+				if (keeper is None) or keeper.keep(*_keys):
+					fsw.write(ls.encode("utf-8"))
+					fsw.write(ens)
+					ftw.write(lt.encode("utf-8"))
+					ftw.write(ens)
+					keep += 1
+
+	if pool is not None:
+		pool.close()
+		pool.join()
+
+	print("%d in %d data keeped with ratio %.2f" % (keep, total, float(keep) / float(total) * 100.0 if total > 0 else 0.0))
+
+if __name__ == "__main__":
+	handle(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:])
@@ -20,18 +20,27 @@ def handle(finput, fvocab_i, frs, minbsize=1, expand_for_mulgpu=True, bsize=max_
 		_maxtoken = maxtoken
 	rsf = h5py.File(frs, 'w')
 	src_grp = rsf.create_group("src")
+	# numbers of real sentences of documents padded with placeholder sentences in each batch
+	nsents_grp = rsf.create_group("nsents")
 	curd = {}
-	for i_d, nsent in batch_padder(finput, vcbi, _bsize, maxpad, maxpart, _maxtoken, minbsize):
+	# batches of the same bucket may have different largest numbers of sentences and interleave in different groups, their order in the sorted input is kept for decoding
+	order = []
+	for i_d, nsent, nsents in batch_padder(finput, vcbi, _bsize, maxpad, maxpart, _maxtoken, minbsize):
 		rid = numpy.array(i_d, dtype = numpy.int32)
 		_nsentgid = str(nsent)
 		_curd = curd.get(nsent, 0)
 		if _curd == 0:
 			src_grp.create_group(_nsentgid)
-		src_grp[_nsentgid].create_dataset(str(_curd), data=rid, **h5datawargs)
+			nsents_grp.create_group(_nsentgid)
+		_curid = str(_curd)
+		src_grp[_nsentgid].create_dataset(_curid, data=rid, **h5datawargs)
+		nsents_grp[_nsentgid].create_dataset(_curid, data=numpy.array(nsents, dtype = numpy.int32), **h5datawargs)
 		curd[nsent] = _curd + 1
+		order.append((nsent, _curd,))
 	sents, ndl = dict2pairs(curd)
 	rsf["nsent"] = numpy.array(sents, dtype = numpy.int32)
 	rsf["ndata"] = numpy.array(ndl, dtype = numpy.int32)
+	rsf["order"] = numpy.array(order, dtype = numpy.int32)
 	rsf["nword"] = numpy.array([nwordi], dtype = numpy.int32)
 	rsf.close()
 	print("Number of batches: %d\nSource Vocabulary Size: %d" % (sum(ndl), nwordi))
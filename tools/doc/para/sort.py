@@ -4,9 +4,11 @@ import sys
 from random import seed as rpyseed
 
 from utils.fmt.base import clean_liststr_lentok, maxfreq_filter, shuffle_pair, iter_dict_sort, dict_insert_set
+from utils.fmt.doc.base import get_nsent_bucket
 
 def handle(srcfs, srcft, tgtfs, tgtft, remove_same=False, shuf=True, max_remove=False):
 
+	# documents are sorted by buckets of their numbers of sentences (utils/fmt/doc/base.py:get_nsent_bucket) and then by lengths, so that documents which can share a batch are close to each other
 	data = {}
 	cache = []
 	mxtoks = mxtokt = ntoks = ntokt = 0
@@ -29,14 +31,14 @@ def handle(srcfs, srcft, tgtfs, tgtft, remove_same=False, shuf=True, max_remove=
 					nsent = len(cache)
 					ls, lt = zip(*cache)
 					_tmp = ("\n".join(ls), "\n".join(lt),)
-					data = dict_insert_set(data, _tmp, nsent, mxtoks + mxtokt, mxtokt, ntoks + ntokt, ntokt)
+					data = dict_insert_set(data, _tmp, get_nsent_bucket(nsent), mxtoks + mxtokt, mxtokt, ntoks + ntokt, ntokt)
 					cache = []
 					mxtoks = mxtokt = ntoks = ntokt = 0
 		if cache:
 			nsent = len(cache)
 			ls, lt = zip(*cache)
 			_tmp = ("\n".join(ls), "\n".join(lt),)
-			data = dict_insert_set(data, _tmp, nsent, mxtoks + mxtokt, mxtokt, ntoks + ntokt, ntokt)
+			data = dict_insert_set(data, _tmp, get_nsent_bucket(nsent), mxtoks + mxtokt, mxtokt, ntoks + ntokt, ntokt)
 			cache = []
 			mxtoks = mxtokt = ntoks = ntokt = 0
 
@@ -3,7 +3,7 @@
 import sys
 
 import h5py
-from utils.h5serial import h5save, h5load
+from utils.h5serial import h5save, h5load, h5load_attrs
 
 from cnfg.ihyp import *
 
@@ -19,10 +19,12 @@ def handle_group(srcg, rsg, h5args=h5zipargs):
 def handle(srcf, rsf, h5args=h5zipargs):
 
 	if srcf == rsf:
-		h5save(h5load(srcf, restore_list=False), rsf, h5args=h5args)
+		h5save(h5load(srcf, restore_list=False), rsf, h5args=h5args, attrs=h5load_attrs(srcf))
 	else:
 		sfg, rfg = h5py.File(srcf, "r"), h5py.File(rsf, 'w')
 		handle_group(sfg, rfg, h5args=h5args)
+		for k, v in sfg.attrs.items():
+			rfg.attrs[k] = v
 		sfg.close()
 		rfg.close()
 
@@ -0,0 +1,91 @@
+#encoding: utf-8
+
+# usage: python tools/kd/nbest.py $test.h5 $src.vcb $tgt.vcb $rsf $nbest $teacher.h5 [$teacher2.h5 ...]
+# decode the source side of the training data ($test.h5 built by tools/mktest.py from the sorted training source) with beam search of the teacher (an ensemble if several models are given, built with the configuration in cnfg/base.py), and write the $nbest best translations of each source sentence as sentence pairs ($rsf.src and $rsf.tgt) for sequence-level knowledge distillation, which can be sorted and converted into training data of the student with tools/sort.py and tools/mkiodata.py as the original training set.
+
+import sys
+
+import torch
+
+from tqdm import tqdm
+
+import h5py
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+from transformer.NMT import NMT
+from transformer.EnsembleNMT import NMT as Ensemble
+
+from utils.base import *
+from utils.amp import get_amp, fp32_log_softmax
+from utils.fmt.base import ldvocab, reverse_dict, eos_id
+from utils.fmt.base4torch import parse_cuda_decode
+
+def load_fixing(module):
+
+	if "fix_load" in dir(module):
+		module.fix_load()
+
+def ids2str(lin, vcb):
+
+	rs = []
+	for tmpu in lin:
+		if tmpu == eos_id:
+			break
+		# <pad> and <sos> are skipped, <unk> is kept and mapped back to its id by tools/mkiodata.py
+		elif tmpu > eos_id:
+			rs.append(vcb[tmpu])
+
+	return " ".join(rs)
+
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, False)
+
+td = h5py.File(sys.argv[1], "r")
+ntest = td["ndata"][:].item()
+vcbi, nwordi = ldvocab(sys.argv[2])
+vcbt, nwordt = ldvocab(sys.argv[3])
+vcbi, vcbt = reverse_dict(vcbi), reverse_dict(vcbt)
+nbest = int(sys.argv[5])
+beam_size = max(cnfg.beam_size, nbest)
+
+models = []
+for modelf in sys.argv[6:]:
+	tmp = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+	tmp = load_model_cpu(modelf, tmp)
+	tmp.apply(load_fixing)
+	models.append(tmp)
+mymodel = models[0] if len(models) == 1 else Ensemble(models)
+mymodel.eval()
+
+use_amp, autocast, _ = get_amp(use_cuda, cnfg.use_amp, cnfg.cpu_amp)
+if use_amp:
+	fp32_log_softmax(mymodel)
+
+if use_cuda:
+	mymodel.to(cuda_device)
+
+ens = "\n".encode("utf-8")
+
+src_grp = td["src"]
+with open(sys.argv[4] + ".src", "wb") as fsrc, open(sys.argv[4] + ".tgt", "wb") as ftgt, torch.no_grad():
+	for i in tqdm(range(ntest)):
+		seq_batch = torch.from_numpy(src_grp[str(i)][:]).long()
+		if use_cuda:
+			seq_batch = seq_batch.to(cuda_device)
+		bsize, seql = seq_batch.size()
+		mask = seq_batch.eq(0).unsqueeze(1)
+		with autocast(enabled=use_amp):
+			output, _ = mymodel.dec.beam_decode(mymodel.enc(seq_batch, mask), mask, beam_size, seql + max(64, seql // 4), cnfg.length_penalty, return_all=True)
+		output = output.view(bsize, beam_size, -1).narrow(1, 0, nbest).tolist()
+		for src, trans in zip(seq_batch.tolist(), output):
+			src = ids2str(src, vcbi).encode("utf-8")
+			for tran in trans:
+				tran = ids2str(tran, vcbt)
+				if tran:
+					fsrc.write(src)
+					fsrc.write(ens)
+					ftgt.write(tran.encode("utf-8"))
+					ftgt.write(ens)
+
+td.close()
@@ -0,0 +1,81 @@
+#encoding: utf-8
+
+# usage: python tools/kd/topk.py $train.h5 $rsf $teacher.h5 [$teacher2.h5 ...]
+# store top-k token distributions of the teacher (an ensemble if several models are given, built with the configuration in cnfg/base.py) on the target side of $train.h5 (built by tools/mkiodata.py) with teacher forcing into $rsf.* (utils/kd.py), which train.py reads with cnfg/base.py:kd_data = $rsf for word-level knowledge distillation of the student. Sizes of stored files follow cnfg/hyp.py:kd_topk, kd_mass and kd_budget.
+
+import sys
+
+import torch
+
+from tqdm import tqdm
+
+import h5py
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+from transformer.NMT import NMT
+from transformer.EnsembleNMT import NMT as Ensemble
+
+from utils.base import *
+from utils.amp import get_amp, fp32_log_softmax
+from utils.kd import TopKWriter, get_topk_budget
+from utils.fmt.base import pad_id
+from utils.fmt.base4torch import parse_cuda_decode
+
+def load_fixing(module):
+
+	if "fix_load" in dir(module):
+		module.fix_load()
+
+def count_tokens(tgt_grp, ndata):
+
+	rs = 0
+	for i in range(ndata):
+		_t = tgt_grp[str(i)][:]
+		rs += int((_t[:, 1:] != pad_id).sum())
+
+	return rs
+
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, False)
+
+td = h5py.File(sys.argv[1], "r")
+ndata = td["ndata"][:].item()
+nword = td["nword"][:].tolist()
+nwordi, nwordt = nword[0], nword[-1]
+
+models = []
+for modelf in sys.argv[3:]:
+	tmp = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+	tmp = load_model_cpu(modelf, tmp)
+	tmp.apply(load_fixing)
+	models.append(tmp)
+mymodel = models[0] if len(models) == 1 else Ensemble(models)
+mymodel.eval()
+
+use_amp, autocast, _ = get_amp(use_cuda, cnfg.use_amp, cnfg.cpu_amp)
+if use_amp:
+	fp32_log_softmax(mymodel)
+
+if use_cuda:
+	mymodel.to(cuda_device)
+
+src_grp, tgt_grp = td["src"], td["tgt"]
+topk = kd_topk if kd_budget is None else get_topk_budget(count_tokens(tgt_grp, ndata), nwordt, kd_topk, kd_budget)
+print("Keep at most %d teacher tokens per target token" % (topk,))
+
+with TopKWriter(sys.argv[2], nwordt, topk, kd_mass) as writer, torch.no_grad():
+	for i in tqdm(range(ndata)):
+		bid = str(i)
+		seq_batch = torch.from_numpy(src_grp[bid][:]).long()
+		seq_o = torch.from_numpy(tgt_grp[bid][:]).long()
+		lo = seq_o.size(1) - 1
+		if use_cuda:
+			seq_batch = seq_batch.to(cuda_device)
+			seq_o = seq_o.to(cuda_device)
+		with autocast(enabled=use_amp):
+			output = mymodel(seq_batch, seq_o.narrow(1, 0, lo))
+		writer.write(bid, output, seq_o.narrow(1, 1, lo))
+	print("Kept %d teacher tokens for %d target tokens (%.2f per token)" % (writer.nent, writer.ntok, float(writer.nent) / max(writer.ntok, 1),))
+
+td.close()
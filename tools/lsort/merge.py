@@ -2,12 +2,12 @@
 
 import sys
 
-from utils.fmt.base import clean_liststr_lentok, maxfreq_filter, shuffle_pair, iter_dict_sort
+from utils.fmt.base import clean_liststr_lentok, maxfreq_filter_counts, shuffle_pair, iter_dict_sort, dict_insert_list, dict_insert_count
 
 from random import seed as rpyseed
 from os import walk, path
 
-# remove_same: reduce same data in the corpus
+# remove_same: reduce same data in the corpus, duplicated pairs are counted rather than kept repeatedly in memory
 # shuf: shuffle the data of same source/target length
 # max_remove: if one source has several targets, only keep those with highest frequency
 
@@ -64,13 +64,10 @@ def handle(cached, srcf, rsf, remove_same=True, shuf=True, max_remove=True):
 
 	def write_data(data, fs, ft, ens, rsame, shuf, mclean):
 
-		for tmp in iter_dict_sort(data):
-			ls, lt = zip(*tmp)
-			if len(ls) > 1:
-				if rsame:
-					ls, lt = maxfreq_filter(ls, lt, mclean)
-				if shuf:
-					ls, lt = shuffle_pair(ls, lt)
+		for tmp in iter_dict_sort(data, max_depth=1):
+			ls, lt = maxfreq_filter_counts(tmp, mclean) if rsame else zip(*tmp)
+			if shuf and (len(ls) > 1):
+				ls, lt = shuffle_pair(ls, lt)
 			fs.write("\n".join(ls).encode("utf-8"))
 			fs.write(ens)
 			ft.write("\n".join(lt).encode("utf-8"))
@@ -81,6 +78,7 @@ def handle(cached, srcf, rsf, remove_same=True, shuf=True, max_remove=True):
 
 	data = {}
 	cur_len = 0
+	insert_func = dict_insert_count if remove_same else dict_insert_list
 
 	ens = "\n".encode("utf-8")
 
@@ -89,16 +87,12 @@ def handle(cached, srcf, rsf, remove_same=True, shuf=True, max_remove=True):
 			rs, query, fl = update_query(fl, query, maxlen)
 			if rs:
 				src, tgt, l, lt = rs
-				if l == cur_len:
-					if lt in data:
-						data[lt].append((src, tgt,))
-					else:
-						data[lt] = [(src, tgt,)]
-				else:
+				if l != cur_len:
 					if data:
 						write_data(data, fs, ft, ens, remove_same, shuf, max_remove)
 					cur_len = l
-					data = {lt: [(src, tgt,)]}
+					data = {}
+				data = insert_func(data, (src, tgt,), lt)
 			else:
 				break
 		if data:
@@ -5,12 +5,20 @@ import sys
 import numpy
 import h5py
 
-from utils.fmt.base import ldvocab
-from utils.fmt.dual import batch_padder
+from os import remove
+from multiprocessing import Pool
+
+from utils.fmt.base import ldvocab, list_reader
+from utils.fmt.dual import batch_loader, batch_encoder
+from utils.fmt.encode import BatchEncoder
+from utils.fmt.parallel import get_nproc, nonempty_line_offsets, split_batches
 
 from cnfg.ihyp import *
 
-def handle(finput, ftarget, fvocab_i, fvocab_t, frs, minbsize=1, expand_for_mulgpu=True, bsize=max_sentences_gpu, maxpad=max_pad_tokens_sentence, maxpart=normal_tokens_vs_pad_tokens, maxtoken=max_tokens_gpu, minfreq=False, vsize=False):
+# number of shards per process, more shards balance the workload better since costs of batches vary with their lengths
+shards_per_process = 4
+
+def handle(finput, ftarget, fvocab_i, fvocab_t, frs, minbsize=1, expand_for_mulgpu=True, bsize=max_sentences_gpu, maxpad=max_pad_tokens_sentence, maxpart=normal_tokens_vs_pad_tokens, maxtoken=max_tokens_gpu, minfreq=False, vsize=False, nproc=None):
 	vcbi, nwordi = ldvocab(fvocab_i, minfreq, vsize)
 	vcbt, nwordt = ldvocab(fvocab_t, minfreq, vsize)
 	if expand_for_mulgpu:
@@ -19,23 +27,72 @@ def handle(finput, ftarget, fvocab_i, fvocab_t, frs, minbsize=1, expand_for_mulg
 	else:
 		_bsize = bsize
 		_maxtoken = maxtoken
+	_nproc = get_nproc(nproc)
+	if _nproc > 1:
+		curd = handle_parallel(finput, ftarget, vcbi, vcbt, frs, nwordi, nwordt, _bsize, maxpad, maxpart, _maxtoken, minbsize, _nproc)
+	else:
+		rsf = h5py.File(frs, 'w')
+		src_grp = rsf.create_group("src")
+		tgt_grp = rsf.create_group("tgt")
+		curd = 0
+		for rid, rtd in batch_encoder(finput, ftarget, vcbi, vcbt, _bsize, maxpad, maxpart, _maxtoken, minbsize):
+			#rld = numpy.array(ld, dtype = numpy.int32)
+			wid = str(curd)
+			src_grp.create_dataset(wid, data=rid, **h5datawargs)
+			tgt_grp.create_dataset(wid, data=rtd, **h5datawargs)
+			#rsf["l" + wid] = rld
+			curd += 1
+		rsf["ndata"] = numpy.array([curd], dtype = numpy.int32)
+		rsf["nword"] = numpy.array([nwordi, nwordt], dtype = numpy.int32)
+		rsf.close()
+	print("Number of batches: %d\nSource Vocabulary Size: %d\nTarget Vocabulary Size: %d" % (curd, nwordi, nwordt))
+
+# batch boundaries are decided by a sequential pass over sentence lengths (as batch_loader does in the serial mode), the batches are split into shards of consecutive batches, each of which is mapped, padded and written (with compression) into a temporary shard file by a worker process, and the first process finally copies (compressed) datasets of shards in order into frs, so that the output is the same as that of the serial mode.
+
+def handle_parallel(finput, ftarget, vcbi, vcbt, frs, nwordi, nwordt, bsize, maxpad, maxpart, maxtoken, minbsize, nproc):
+
+	bsizes = [len(i_d) for i_d, td, mlen_i, mlen_t in batch_loader(finput, ftarget, bsize, maxpad, maxpart, maxtoken, minbsize)]
+	shards = split_batches(bsizes, nproc * shards_per_process)
+	_sstarts = [_sstart for _start, _end, _sstart in shards]
+	tasks = [(finput, ftarget, _start_i, _start_t, bsizes[_start:_end], _start, vcbi, vcbt, "%s.%d.shard" % (frs, _ind,),) for _ind, ((_start, _end, _sstart,), _start_i, _start_t,) in enumerate(zip(shards, nonempty_line_offsets(finput, _sstarts), nonempty_line_offsets(ftarget, _sstarts)))]
+	if tasks:
+		with Pool(min(nproc, len(tasks))) as pool:
+			pool.starmap(handle_shard, tasks)
+
 	rsf = h5py.File(frs, 'w')
 	src_grp = rsf.create_group("src")
 	tgt_grp = rsf.create_group("tgt")
-	curd = 0
-	for i_d, td in batch_padder(finput, ftarget, vcbi, vcbt, _bsize, maxpad, maxpart, _maxtoken, minbsize):
-		rid = numpy.array(i_d, dtype = numpy.int32)
-		rtd = numpy.array(td, dtype = numpy.int32)
-		#rld = numpy.array(ld, dtype = numpy.int32)
-		wid = str(curd)
-		src_grp.create_dataset(wid, data=rid, **h5datawargs)
-		tgt_grp.create_dataset(wid, data=rtd, **h5datawargs)
-		#rsf["l" + wid] = rld
-		curd += 1
+	for _task in tasks:
+		_first_id, _fshard = _task[5], _task[-1]
+		with h5py.File(_fshard, 'r') as f:
+			for curd in range(_first_id, _first_id + len(_task[4])):
+				wid = str(curd)
+				rsf.copy(f["src"][wid], src_grp, name=wid)
+				rsf.copy(f["tgt"][wid], tgt_grp, name=wid)
+		remove(_fshard)
+	curd = len(bsizes)
 	rsf["ndata"] = numpy.array([curd], dtype = numpy.int32)
 	rsf["nword"] = numpy.array([nwordi, nwordt], dtype = numpy.int32)
 	rsf.close()
-	print("Number of batches: %d\nSource Vocabulary Size: %d\nTarget Vocabulary Size: %d" % (curd, nwordi, nwordt))
+
+	return curd
+
+# start_i, start_t: byte offsets of the first sentences of the shard in finput and ftarget
+# bsizes: number of sentences of each batch in the shard
+# first_id: index of the first batch of the shard
+
+def handle_shard(finput, ftarget, start_i, start_t, bsizes, first_id, vcbi, vcbt, frs):
+
+	rsf = h5py.File(frs, 'w')
+	src_grp = rsf.create_group("src")
+	tgt_grp = rsf.create_group("tgt")
+	_reader_i, _reader_t = list_reader(finput, start_i), list_reader(ftarget, start_t)
+	_enc_i, _enc_t = BatchEncoder(vcbi), BatchEncoder(vcbt)
+	for curd, nd in enumerate(bsizes, first_id):
+		wid = str(curd)
+		for _reader, _enc, _grp in ((_reader_i, _enc_i, src_grp,), (_reader_t, _enc_t, tgt_grp,),):
+			_grp.create_dataset(wid, data=_enc([next(_reader) for _ in range(nd)]), **h5datawargs)
+	rsf.close()
 
 if __name__ == "__main__":
 	handle(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], int(sys.argv[6]))
@@ -6,7 +6,7 @@ import numpy
 import h5py
 
 from utils.fmt.base import ldvocab
-from utils.fmt.single import batch_padder
+from utils.fmt.single import batch_encoder
 
 from cnfg.ihyp import *
 
@@ -23,8 +23,7 @@ def handle(finput, fvocab_i, frs, minbsize=1, expand_for_mulgpu=True, bsize=max_
 	rsf = h5py.File(frs,'w')
 	src_grp = rsf.create_group("src")
 	curd = 0
-	for i_d in batch_padder(finput, vcbi, _bsize, maxpad, maxpart, _maxtoken, minbsize):
-		rid = numpy.array(i_d, dtype = numpy.int32)
+	for rid in batch_encoder(finput, vcbi, _bsize, maxpad, maxpart, _maxtoken, minbsize):
 		#rld = numpy.array(ld, dtype = numpy.int32)
 		wid = str(curd)
 		src_grp.create_dataset(wid, data=rid, **h5datawargs)
@@ -0,0 +1,130 @@
+#encoding: utf-8
+
+# usage: python tools/prune.py $dev.h5 $model.h5 $rsm.h5 [$head_ratio] [$ffn_ratio]
+# score attention heads and hidden units of feed-forward networks of $model.h5 (built with the configuration in cnfg/base.py) on $dev.h5 (built by tools/mkiodata.py), remove the least important $head_ratio of heads and $ffn_ratio of hidden units of each module (cnfg/hyp.py:prune_head_ratio, prune_ffn_ratio by default, utils/prune.py), save the pruned model with its numbers of kept heads/units into $rsm.h5 (loaded with load_model_cpu by train.py, predict.py and the translator like unpruned models), and report the number of parameters, the loss, the error and the time cost of teacher forcing and beam search decoding on $dev.h5 before and after pruning.
+
+import sys
+
+import torch
+
+import h5py
+
+import cnfg.base as cnfg
+from cnfg.ihyp import *
+
+from transformer.NMT import NMT
+from loss.base import LabelSmoothingLoss
+
+from utils.base import *
+from utils.amp import get_amp, fp32_log_softmax
+from utils.bench import sync_device
+from utils.prune import ImportanceScorer
+from utils.fmt.base import pad_id
+from utils.fmt.base4torch import parse_cuda_decode
+
+from time import time
+
+def load_fixing(module):
+
+	if "fix_load" in dir(module):
+		module.fix_load()
+
+def get_batches(src_grp, tgt_grp, ndata, device=None):
+
+	for i in range(ndata):
+		bid = str(i)
+		seq_batch = torch.from_numpy(src_grp[bid][:]).long()
+		seq_o = torch.from_numpy(tgt_grp[bid][:]).long()
+		if device:
+			seq_batch = seq_batch.to(device)
+			seq_o = seq_o.to(device)
+		lo = seq_o.size(1) - 1
+		yield seq_batch, seq_o.narrow(1, 0, lo), seq_o.narrow(1, 1, lo).contiguous()
+
+def score(model, lossf, src_grp, tgt_grp, ndata, device=None, use_amp=False):
+
+	model.eval()
+	with ImportanceScorer(model) as scorer:
+		for seq_batch, oi, ot in get_batches(src_grp, tgt_grp, ndata, device):
+			with autocast(enabled=use_amp):
+				output = model(seq_batch, oi)
+				loss = lossf(output, ot)
+			loss.backward()
+			model.zero_grad(set_to_none=True)
+			output = loss = None
+
+	return scorer
+
+# returns: loss per token, error rate, time cost (seconds) of teacher forcing and of decoding
+
+def evaluate(model, lossf, src_grp, tgt_grp, ndata, device=None, use_amp=False):
+
+	model.eval()
+	sum_loss = 0.0
+	r = w = 0
+	t_fwd = t_dec = 0.0
+	with torch.no_grad():
+		for seq_batch, oi, ot in get_batches(src_grp, tgt_grp, ndata, device):
+			sync_device(device)
+			_st = time()
+			with autocast(enabled=use_amp):
+				output = model(seq_batch, oi)
+			sync_device(device)
+			t_fwd += time() - _st
+			_st = time()
+			with autocast(enabled=use_amp):
+				model.decode(seq_batch, cnfg.beam_size, None, cnfg.length_penalty)
+			sync_device(device)
+			t_dec += time() - _st
+			with autocast(enabled=use_amp):
+				sum_loss += lossf(output, ot).item()
+			data_mask = ot.ne(pad_id)
+			w += data_mask.int().sum().item()
+			r += (output.argmax(-1).eq(ot) & data_mask).int().sum().item()
+			output = None
+	w = float(w)
+
+	return sum_loss / w, (w - r) / w * 100.0, t_fwd, t_dec
+
+def count_parameters(model):
+
+	return sum(_p.numel() for _p in model.parameters())
+
+def report(desc, model, stat):
+
+	print("%s: %d parameters, loss %.3f, error %.2f, teacher forcing %.2f s, decoding %.2f s" % ((desc, count_parameters(model),) + stat))
+
+head_ratio = float(sys.argv[4]) if len(sys.argv) > 4 else prune_head_ratio
+ffn_ratio = float(sys.argv[5]) if len(sys.argv) > 5 else prune_ffn_ratio
+
+use_cuda, cuda_device, cuda_devices, multi_gpu = parse_cuda_decode(cnfg.use_cuda, cnfg.gpuid, False)
+
+vd = h5py.File(sys.argv[1], "r")
+ndata = vd["ndata"][:].item()
+nword = vd["nword"][:].tolist()
+nwordi, nwordt = nword[0], nword[-1]
+src_grp, tgt_grp = vd["src"], vd["tgt"]
+
+mymodel = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
+mymodel = load_model_cpu(sys.argv[2], mymodel)
+mymodel.apply(load_fixing)
+
+lossf = LabelSmoothingLoss(nwordt, cnfg.label_smoothing, ignore_index=pad_id, reduction='sum', forbidden_index=cnfg.forbidden_indexes)
+
+use_amp, autocast, _ = get_amp(use_cuda, cnfg.use_amp, cnfg.cpu_amp)
+if use_amp:
+	fp32_log_softmax(mymodel)
+
+if use_cuda:
+	mymodel.to(cuda_device)
+	lossf.to(cuda_device)
+
+report("Base", mymodel, evaluate(mymodel, lossf, src_grp, tgt_grp, ndata, cuda_device, use_amp))
+scorer = score(mymodel, lossf, src_grp, tgt_grp, ndata, cuda_device, use_amp)
+scorer.prune(head_ratio, ffn_ratio)
+print("Kept %d heads and %d hidden units of feed-forward networks" % (sum(_v for _k, _v in mymodel.prune_spec.items() if scorer.groups[_k][-1]), sum(_v for _k, _v in mymodel.prune_spec.items() if not scorer.groups[_k][-1]),))
+report("Pruned", mymodel, evaluate(mymodel, lossf, src_grp, tgt_grp, ndata, cuda_device, use_amp))
+
+vd.close()
+
+save_model(mymodel, sys.argv[3])
@@ -0,0 +1,83 @@
+#encoding: utf-8
+
+# usage: python tools/shortlist.py $src.train.bpe $tgt.train.bpe $src.vcb $tgt.vcb $shortlist.h5 [$ncand] [$align]
+# build the vocabulary shortlist (utils/shortlist.py, cnfg/base.py:shortlist) of the training corpus: the $ncand target candidates of each source token with the highest Dice coefficient of co-occurrence in sentence pairs, or with the highest translation probability p(target | source) counted on word alignments if the alignment file $align (e.g., of fast_align, "i-j" pairs of source/target positions for each sentence pair) is given.
+
+import sys
+
+import numpy
+import h5py
+
+from utils.fmt.base import ldvocab, init_normal_token_id
+
+from cnfg.ihyp import *
+
+def count_cooc(srcf, tgtf, vcbi, vcbt):
+
+	cooc, cs, ct = {}, {}, {}
+	with open(srcf, "rb") as fs, open(tgtf, "rb") as ft:
+		for ls, lt in zip(fs, ft):
+			ls, lt = ls.strip(), lt.strip()
+			if ls and lt:
+				_ls = set(vcbi[_w] for _w in ls.decode("utf-8").split() if _w in vcbi)
+				_lt = set(vcbt[_w] for _w in lt.decode("utf-8").split() if _w in vcbt)
+				for _t in _lt:
+					ct[_t] = ct.get(_t, 0) + 1
+				for _s in _ls:
+					cs[_s] = cs.get(_s, 0) + 1
+					if _s in cooc:
+						_c = cooc[_s]
+						for _t in _lt:
+							_c[_t] = _c.get(_t, 0) + 1
+					else:
+						cooc[_s] = {_t: 1 for _t in _lt}
+
+	return {_s: {_t: 2.0 * _n / (cs[_s] + ct[_t]) for _t, _n in v.items()} for _s, v in cooc.items()}
+
+# empty lines are skipped in the same way as the corpus, so that alignments stay with their sentence pairs
+
+def count_align(srcf, tgtf, alignf, vcbi, vcbt):
+
+	cooc = {}
+	with open(srcf, "rb") as fs, open(tgtf, "rb") as ft, open(alignf, "rb") as fa:
+		for ls, lt, la in zip(fs, ft, fa):
+			ls, lt = ls.strip(), lt.strip()
+			if ls and lt:
+				ls, lt = ls.decode("utf-8").split(), lt.decode("utf-8").split()
+				for _a in la.decode("utf-8").split():
+					_i, _, _j = _a.partition("-")
+					_ws, _wt = ls[int(_i)], lt[int(_j)]
+					if (_ws in vcbi) and (_wt in vcbt):
+						_s, _t = vcbi[_ws], vcbt[_wt]
+						if _s in cooc:
+							cooc[_s][_t] = cooc[_s].get(_t, 0) + 1
+						else:
+							cooc[_s] = {_t: 1}
+
+	rs = {}
+	for _s, v in cooc.items():
+		_n = float(sum(v.values()))
+		rs[_s] = {_t: _c / _n for _t, _c in v.items()}
+
+	return rs
+
+def handle(srcf, tgtf, fvocab_i, fvocab_t, frs, ncand=50, alignf=None, minfreq=False, vsize=False):
+
+	vcbi, nwordi = ldvocab(fvocab_i, minfreq, vsize)
+	vcbt, nwordt = ldvocab(fvocab_t, minfreq, vsize)
+	# special tokens are not candidates
+	vcbi = {k: v for k, v in vcbi.items() if v >= init_normal_token_id}
+	vcbt = {k: v for k, v in vcbt.items() if v >= init_normal_token_id}
+	scores = count_cooc(srcf, tgtf, vcbi, vcbt) if alignf is None else count_align(srcf, tgtf, alignf, vcbi, vcbt)
+
+	cands = numpy.zeros((nwordi, ncand,), dtype=numpy.int32)
+	for _s, v in scores.items():
+		_c = sorted(v.keys(), key=lambda _t: -v[_t])[:ncand]
+		cands[_s, :len(_c)] = _c
+
+	with h5py.File(frs, "w") as f:
+		f.create_dataset("cands", data=cands, **h5modelwargs)
+		f["nword"] = numpy.array([nwordi, nwordt], dtype=numpy.int32)
+
+if __name__ == "__main__":
+	handle(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5], int(sys.argv[6]) if len(sys.argv) > 6 else 50, sys.argv[7] if len(sys.argv) > 7 else None)
@@ -3,9 +3,9 @@
 import sys
 from random import seed as rpyseed
 
-from utils.fmt.base import clean_liststr_lentok, maxfreq_filter, shuffle_pair, iter_dict_sort, dict_insert_list
+from utils.fmt.base import clean_liststr_lentok, maxfreq_filter_counts, shuffle_pair, iter_dict_sort, dict_insert_list, dict_insert_count
 
-# remove_same: reduce same data in the corpus
+# remove_same: reduce same data in the corpus, duplicated pairs are counted rather than kept repeatedly in memory
 # shuf: shuffle the data of same source/target length
 # max_remove: if one source has several targets, only keep those with highest frequency
 
@@ -23,18 +23,15 @@ def handle(srcfs, srcft, tgtfs, tgtft, max_len=256, remove_same=False, shuf=True
 				lt, tlen = clean_liststr_lentok(lt.decode("utf-8").split())
 				if (slen <= _max_len) and (tlen <= _max_len):
 					lgth = slen + tlen
-					data = dict_insert_list(data, (ls, lt,), lgth, tlen)
+					data = (dict_insert_count if remove_same else dict_insert_list)(data, (ls, lt,), lgth, tlen)
 
 	ens = "\n".encode("utf-8")
 
 	with open(tgtfs, "wb") as fs, open(tgtft, "wb") as ft:
-		for tmp in iter_dict_sort(data):
-			ls, lt = zip(*tmp)
-			if len(ls) > 1:
-				if remove_same:
-					ls, lt = maxfreq_filter(ls, lt, max_remove)
-				if shuf:
-					ls, lt = shuffle_pair(ls, lt)
+		for tmp in iter_dict_sort(data, max_depth=2):
+			ls, lt = maxfreq_filter_counts(tmp, max_remove) if remove_same else zip(*tmp)
+			if shuf and (len(ls) > 1):
+				ls, lt = shuffle_pair(ls, lt)
 			fs.write("\n".join(ls).encode("utf-8"))
 			fs.write(ens)
 			ft.write("\n".join(lt).encode("utf-8"))
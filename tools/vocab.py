@@ -2,43 +2,13 @@
 
 import sys
 
-from utils.fmt.base import clean_list_iter
+from utils.fmt.vocab import count_files, save_vocab
 
-def handle(srcf, rsf, vsize=65532):
+# tokens are counted over byte ranges of the file by a pool of cnfg/hyp.py:data_num_processes processes (nproc), the result is the same as that of a sequential pass.
 
-	vocab = {}
+def handle(srcf, rsf, vsize=65532, nproc=None):
 
-	with open(srcf, "rb") as f:
-		for line in f:
-			tmp = line.strip()
-			if tmp:
-				for token in clean_list_iter(tmp.decode("utf-8").split()):
-					vocab[token] = vocab.get(token, 0) + 1
-
-	r_vocab = {}
-	for k, v in vocab.items():
-		if v not in r_vocab:
-			r_vocab[v]=[str(v), k]
-		else:
-			r_vocab[v].append(k)
-
-	freqs = list(r_vocab.keys())
-	freqs.sort(reverse=True)
-
-	ens = "\n".encode("utf-8")
-	remain = vsize
-	with open(rsf, "wb") as f:
-		for freq in freqs:
-			cdata = r_vocab[freq]
-			ndata = len(cdata) - 1
-			if remain < ndata:
-				cdata = cdata[:remain + 1]
-				ndata = remain
-			f.write(" ".join(cdata).encode("utf-8"))
-			f.write(ens)
-			remain -= ndata
-			if remain <= 0:
-				break
+	save_vocab(count_files([srcf], nproc=nproc)[0], rsf, vsize)
 
 if __name__ == "__main__":
 	handle(sys.argv[1], sys.argv[2]) if len(sys.argv) == 3 else handle(sys.argv[1], sys.argv[2], int(sys.argv[-1]))
@@ -3,11 +3,13 @@
 import torch
 from torch import nn
 from modules.base import *
+from modules.fused import drop_residual_norm, can_fuse_ff, fused_ff
 from utils.sampler import SampleMax
 from utils.base import all_done, repeat_bsize_for_beam_tensor, mask_tensor_type
 from math import sqrt
 
 from utils.fmt.base import pad_id
+from utils.checkpoint import checkpoint_nets, use_checkpoint
 
 from cnfg.ihyp import *
 
@@ -20,8 +22,9 @@ class DecoderLayer(nn.Module):
 	# ahsize: hidden size of MultiHeadAttention
 	# norm_residual: residue with layer normalized representation
 	# k_rel_pos: window size (one side) of relative positional embeddings in self attention
+	# fused: fuse dropout + residual + LayerNorm and bias + ReLU (+ dropout) of the feed-forward network
 
-	def __init__(self, isize, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, ahsize=None, norm_residual=norm_residual_default, k_rel_pos=use_k_relative_position_decoder):
+	def __init__(self, isize, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, ahsize=None, norm_residual=norm_residual_default, k_rel_pos=use_k_relative_position_decoder, fused=fused_layer):
 
 		super(DecoderLayer, self).__init__()
 
@@ -40,6 +43,8 @@ class DecoderLayer(nn.Module):
 
 		self.norm_residual = norm_residual
 
+		self.fused = fused and can_fuse_ff(self.ff)
+
 	# inpute: encoded representation from encoder (bsize, seql, isize)
 	# inputo: embedding of decoded translation (bsize, nquery, isize)
 	# src_pad_mask: mask for given encoding source sentence (bsize, nquery, seql), see Encoder, expanded after generated with:
@@ -49,6 +54,9 @@ class DecoderLayer(nn.Module):
 
 	def forward(self, inpute, inputo, src_pad_mask=None, tgt_pad_mask=None, query_unit=None):
 
+		if self.fused and (query_unit is None):
+			return self.fused_forward(inpute, inputo, src_pad_mask, tgt_pad_mask)
+
 		if query_unit is None:
 			_inputo = self.layer_normer1(inputo)
 
@@ -90,6 +98,25 @@ class DecoderLayer(nn.Module):
 		else:
 			return context, states_return
 
+	# the same computation as forward for training (query_unit is None) with fused kernels
+
+	def fused_forward(self, inpute, inputo, src_pad_mask=None, tgt_pad_mask=None):
+
+		_p = self.drop.p if (self.drop is not None) and self.training else 0.0
+
+		_inputo = self.layer_normer1(inputo)
+		context = self.self_attn(_inputo, mask=tgt_pad_mask)
+		context, _context = drop_residual_norm(context, _inputo if self.norm_residual else inputo, self.layer_normer2, _p)
+
+		_context_new = self.cross_attn(_context, inpute, mask=src_pad_mask)
+		context, _context = drop_residual_norm(_context_new, _context if self.norm_residual else context, self.ff.normer, _p)
+
+		return fused_ff(self.ff, context, _context)
+
+def run_layer(net, out, inpute, src_pad_mask, tgt_pad_mask):
+
+	return net(inpute, out, src_pad_mask, tgt_pad_mask)
+
 class Decoder(nn.Module):
 
 	# isize: size of word embedding
@@ -104,8 +131,9 @@ class Decoder(nn.Module):
 	# bindemb: bind embedding and classifier weight
 	# share_layer: using one shared decoder layer
 	# disable_pemb: disable the standard positional embedding, can be enabled when use relative postional embeddings in self attention or AAN
+	# act_recompute: recompute activations of every act_recompute layers in the backward pass to save memory, 0 to disable
 
-	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, emb_w=None, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, bindemb=True, forbidden_index=None, share_layer=False, disable_pemb=disable_std_pemb_decoder):
+	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, emb_w=None, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, bindemb=True, forbidden_index=None, share_layer=False, disable_pemb=disable_std_pemb_decoder, act_recompute=activation_recompute_decoder):
 
 		super(Decoder, self).__init__()
 
@@ -139,6 +167,8 @@ class Decoder(nn.Module):
 
 		self.fbl = None if forbidden_index is None else tuple(set(forbidden_index))
 
+		self.act_recompute = act_recompute
+
 	# inpute: encoded representation from encoder (bsize, seql, isize)
 	# inputo: decoded translation (bsize, nquery)
 	# src_pad_mask: mask for given encoding source sentence (bsize, 1, seql), see Encoder, generated with:
@@ -163,8 +193,11 @@ class Decoder(nn.Module):
 		# which I think is useless, since only <pad> may pay attention to previous <pad> tokens, whos loss will be omitted by the loss function.
 		#_mask = torch.gt(_mask + inputo.eq(0).unsqueeze(1), 0)
 
-		for net in self.nets:
-			out = net(inpute, out, src_pad_mask, _mask)
+		if use_checkpoint(self, self.act_recompute):
+			out = checkpoint_nets(self.nets, self.act_recompute, run_layer, out, inpute, src_pad_mask, _mask)
+		else:
+			for net in self.nets:
+				out = net(inpute, out, src_pad_mask, _mask)
 
 		if self.out_normer is not None:
 			out = self.out_normer(out)
@@ -6,6 +6,7 @@ from modules.base import *
 from utils.sampler import SampleMax
 from modules.paradoc import GateResidual
 from utils.base import all_done, repeat_bsize_for_beam_tensor
+from utils.checkpoint import checkpoint_nets, use_checkpoint
 from math import sqrt
 
 from transformer.Decoder import DecoderLayer as DecoderLayerBase
@@ -84,6 +85,11 @@ class DecoderLayer(DecoderLayerBase):
 		self.layer_normer2 = base_decoder_layer.layer_normer2
 		self.drop = base_decoder_layer.drop
 
+# inputs: contexts followed by their masks, flattened for checkpointing
+def run_layer(net, out, inpute, nctx, src_pad_mask, tgt_pad_mask, *inputs):
+
+	return net(inpute, out, inputs[:nctx], src_pad_mask, tgt_pad_mask, inputs[nctx:])
+
 class Decoder(DecoderBase):
 
 	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, emb_w=None, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, bindemb=True, forbidden_index=None, nprev_context=2):
@@ -113,8 +119,12 @@ class Decoder(DecoderBase):
 		_src_pad_mask = None if src_pad_mask is None else src_pad_mask.view(-1, 1, src_pad_mask.size(-1))
 		_mask = self._get_subsequent_mask(nquery)
 
-		for net in self.nets:
-			out = net(inpute, out, inputc, _src_pad_mask, _mask, context_mask)
+		if use_checkpoint(self, self.act_recompute):
+			_nctx = len(inputc)
+			out = checkpoint_nets(self.nets, self.act_recompute, run_layer, out, inpute, _nctx, _src_pad_mask, _mask, *inputc, *([None for i in range(_nctx)] if context_mask is None else context_mask))
+		else:
+			for net in self.nets:
+				out = net(inpute, out, inputc, _src_pad_mask, _mask, context_mask)
 
 		if self.out_normer is not None:
 			out = self.out_normer(out)
@@ -247,11 +257,11 @@ class Decoder(DecoderBase):
 		inpute = inpute.repeat(1, beam_size, 1).view(real_bsize, seql, isize)
 
 		_src_pad_mask = None if src_pad_mask is None else src_pad_mask.repeat(1, beam_size, 1).view(real_bsize, 1, seql)
-		_cbsize, _cseql = inputc[0].size()[:2]
-		_creal_bsize = _cbsize * beam_size
-		_context_mask = [None if cu is None else cu.repeat(1, beam_size, 1).view(_creal_bsize, 1, _cseql) for cu in context_mask]
+		_creal_bsize = inputc[0].size(0) * beam_size
+		# contexts may differ in length (e.g., padding contexts of incremental decoding)
+		_context_mask = [None if cu is None else cu.repeat(1, beam_size, 1).view(_creal_bsize, 1, cu.size(-1)) for cu in context_mask]
 
-		_inputc = [inputu.repeat(1, beam_size, 1).view(_creal_bsize, _cseql, isize) for inputu in inputc]
+		_inputc = [inputu.repeat(1, beam_size, 1).view(_creal_bsize, inputu.size(1), isize) for inputu in inputc]
 
 		for key, value in states.items():
 			states[key] = repeat_bsize_for_beam_tensor(value, beam_size)
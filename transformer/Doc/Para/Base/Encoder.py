@@ -7,6 +7,7 @@ from modules.paradoc import GateResidual
 from math import sqrt
 
 from utils.base import mask_tensor_type
+from utils.checkpoint import checkpoint_nets, use_checkpoint
 
 from transformer.Encoder import EncoderLayer as EncoderLayerBase
 from transformer.Encoder import Encoder as EncoderBase
@@ -53,6 +54,11 @@ class CrossEncoderLayer(EncoderLayerBase):
 		self.ff = base_encoder_layer.ff
 		self.layer_normer = base_encoder_layer.layer_normer
 
+# inputs: contexts followed by their masks, flattened for checkpointing
+def run_cross_layer(net, out, nctx, mask, *inputs):
+
+	return net(out, inputs[:nctx], mask, inputs[nctx:])
+
 class CrossEncoder(EncoderBase):
 
 	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, nprev_context=2):
@@ -75,8 +81,12 @@ class CrossEncoder(EncoderBase):
 		if self.drop is not None:
 			out = self.drop(out)
 
-		for net in self.nets:
-			out = net(out, inputc, mask, context_mask)
+		if use_checkpoint(self, self.act_recompute):
+			_nctx = len(inputc)
+			out = checkpoint_nets(self.nets, self.act_recompute, run_cross_layer, out, _nctx, mask, *inputc, *([None for i in range(_nctx)] if context_mask is None else context_mask))
+		else:
+			for net in self.nets:
+				out = net(out, inputc, mask, context_mask)
 
 		return out if self.out_normer is None else self.out_normer(out)
 
@@ -0,0 +1,99 @@
+#encoding: utf-8
+
+# incremental (streaming) document translation with transformer.Doc.Para.Base.NMT: sentences of documents arrive one after another, the context encoding of each sentence is computed once when it arrives and cached by its position in the document, and reused as context of the following nprev_context sentences (rather than re-encoding all previous sentences of every window), cache entries out of the context window are evicted. Keys and values of cross attentions (over the source sentence and its contexts) are computed once per sentence and reused at every decoding step and for all beams.
+
+import torch
+from torch import nn
+
+from threading import Lock
+from contextlib import contextmanager
+
+from modules.base import CrossAttn
+from utils.fmt.base import pad_id, sos_id
+
+class CachedKV(nn.Module):
+
+	def __init__(self, net):
+
+		super(CachedKV, self).__init__()
+
+		self.net = net
+		self.input = self.output = None
+
+	# decoding steps pass the same tensor (encoder outputs, contexts) to cross attentions, so projections are computed only for new inputs
+
+	def forward(self, inputu):
+
+		if inputu is not self.input:
+			self.input, self.output = inputu, self.net(inputu)
+
+		return self.output
+
+cache_kv_lock = Lock()
+
+@contextmanager
+def cache_cross_kv(model, enabled=True):
+
+	if not enabled:
+		yield model
+		return
+	with cache_kv_lock:
+		_attns = [_m for _m in model.modules() if isinstance(_m, CrossAttn) and hasattr(_m, "kv_adaptor")]
+		_backup = [_m.kv_adaptor for _m in _attns]
+		try:
+			for _m, _kv in zip(_attns, _backup):
+				_m.kv_adaptor = CachedKV(_kv)
+			yield model
+		finally:
+			for _m, _kv in zip(_attns, _backup):
+				_m.kv_adaptor = _kv
+
+class IncrementalDecoder:
+
+	# model: transformer.Doc.Para.Base.NMT
+	# cache_kv: reuse keys/values of cross attentions across decoding steps
+	# sentences are translated with the same contexts as in full document decoding (NMT.decode): the previous nprev_context sentences, positions before the start of the document are padded with the <sos> token.
+
+	def __init__(self, model, beam_size=1, max_len=None, length_penalty=0.0, cache_kv=True):
+
+		self.model, self.beam_size, self.max_len, self.length_penalty, self.cache_kv = model, beam_size, max_len, length_penalty, cache_kv
+		self.nprev_context = model.enc.nprev_context
+		self.reset()
+
+	# start new documents
+
+	def reset(self):
+
+		self.cache = {}
+		self.pos = 0
+		self.pad_context = None
+
+	def get_context(self, pos, bsize):
+
+		if pos >= 0:
+			return self.cache[pos]
+		if (self.pad_context is None) or (self.pad_context[0].size(0) != bsize):
+			_pad = self.model.enc.context_enc(self.model.enc.pad.new_full((1, 1,), sos_id))
+			self.pad_context = (_pad.expand(bsize, 1, _pad.size(-1)), None,)
+
+		return self.pad_context
+
+	# inputs: (bsize, seql), the next sentence of bsize documents translated in parallel
+	# returns: translations (bsize, ntok) of beam search (or greedy decoding)
+
+	def __call__(self, inputs):
+
+		bsize, seql = inputs.size()
+		mask = inputs.eq(pad_id).unsqueeze(1)
+		contexts, context_masks = zip(*[self.get_context(_pos, bsize) for _pos in range(self.pos - self.nprev_context, self.pos)])
+		contexts, context_masks = list(contexts), list(context_masks)
+		with cache_cross_kv(self.model, self.cache_kv):
+			ence = self.model.enc.enc(inputs, contexts, mask, context_masks)
+			rs = self.model.dec.decode(ence, contexts, mask, context_masks, self.beam_size, seql + max(64, seql // 4) if self.max_len is None else self.max_len, self.length_penalty)
+
+		# the new sentence is encoded once as the context of the following sentences, the oldest one leaves the context window
+		self.cache[self.pos] = (self.model.enc.context_enc(inputs, mask=mask), mask,)
+		self.cache.pop(self.pos - self.nprev_context, None)
+		self.pos += 1
+
+		return rs
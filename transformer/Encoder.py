@@ -3,9 +3,12 @@
 import torch
 from torch import nn
 from modules.base import *
+from modules.fused import drop_residual_norm, can_fuse_ff, fused_ff
 from math import sqrt
 
+from utils.base import get_pack_indexes, pack_seq, unpack_seq
 from utils.fmt.base import pad_id
+from utils.checkpoint import checkpoint_nets, use_checkpoint
 
 from cnfg.ihyp import *
 
@@ -26,8 +29,9 @@ class EncoderLayer(nn.Module):
 	# ahsize: hidden size of MultiHeadAttention
 	# norm_residual: residue with layer normalized representation
 	# k_rel_pos: window size (one side) of relative positional embeddings in self attention
+	# fused: fuse dropout + residual + LayerNorm and bias + ReLU (+ dropout) of the feed-forward network
 
-	def __init__(self, isize, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, ahsize=None, norm_residual=norm_residual_default, k_rel_pos=use_k_relative_position_encoder):
+	def __init__(self, isize, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, ahsize=None, norm_residual=norm_residual_default, k_rel_pos=use_k_relative_position_encoder, fused=fused_layer):
 
 		super(EncoderLayer, self).__init__()
 
@@ -44,6 +48,8 @@ class EncoderLayer(nn.Module):
 
 		self.norm_residual = norm_residual
 
+		self.fused = fused and can_fuse_ff(self.ff)
+
 	# inputs: input of this layer (bsize, seql, isize)
 
 	def forward(self, inputs, mask=None):
@@ -51,6 +57,20 @@ class EncoderLayer(nn.Module):
 		_inputs = self.layer_normer(inputs)
 		context = self.attn(_inputs, mask=mask)
 
+		return self.ff_forward(context, inputs, _inputs)
+
+	# dropout + residual connection of the attention, followed by the feed-forward network
+	# context: output of the attention
+	# inputs: input of this layer
+	# _inputs: normalized inputs
+
+	def ff_forward(self, context, inputs, _inputs):
+
+		if self.fused:
+			context, _context = drop_residual_norm(context, _inputs if self.norm_residual else inputs, self.ff.normer, self.drop.p if (self.drop is not None) and self.training else 0.0)
+
+			return fused_ff(self.ff, context, _context)
+
 		if self.drop is not None:
 			context = self.drop(context)
 
@@ -60,6 +80,25 @@ class EncoderLayer(nn.Module):
 
 		return context
 
+	# inputs: packed non-pad tokens (ntokens, isize)
+	# pind: indexes of non-pad tokens in the flattened sequence (bsize * seql)
+	# mask: (bsize, 1, seql)
+
+	def packed_forward(self, inputs, pind, bsize, seql, mask=None):
+
+		_inputs = self.layer_normer(inputs)
+		context = self.attn.packed_forward(_inputs, pind, bsize, seql, mask=mask)
+
+		return self.ff_forward(context, inputs, _inputs)
+
+def run_layer(net, out, mask):
+
+	return net(out, mask)
+
+def run_packed_layer(net, out, pind, bsize, seql, mask):
+
+	return net.packed_forward(out, pind, bsize, seql, mask)
+
 class Encoder(nn.Module):
 
 	# isize: size of word embedding
@@ -72,8 +111,10 @@ class Encoder(nn.Module):
 	# ahsize: number of hidden units for MultiHeadAttention
 	# share_layer: using one shared encoder layer
 	# disable_pemb: disable the standard positional embedding, enable when use relative postional embeddings in self attention
+	# act_recompute: recompute activations of every act_recompute layers in the backward pass to save memory, 0 to disable
+	# packed: perform token-wise computations only on non-pad tokens
 
-	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, share_layer=False, disable_pemb=disable_std_pemb_encoder):
+	def __init__(self, isize, nwd, num_layer, fhsize=None, dropout=0.0, attn_drop=0.0, num_head=8, xseql=cache_len_default, ahsize=None, norm_output=True, share_layer=False, disable_pemb=disable_std_pemb_encoder, act_recompute=activation_recompute_encoder, packed=packed_encoder):
 
 		super(Encoder, self).__init__()
 
@@ -93,12 +134,18 @@ class Encoder(nn.Module):
 
 		self.out_normer = nn.LayerNorm(isize, eps=ieps_ln_default, elementwise_affine=enable_ln_parameters) if norm_output else None
 
+		self.act_recompute = act_recompute
+		self.packed = packed
+
 	# inputs: (bsize, seql)
 	# mask: (bsize, 1, seql), generated with:
 	#	mask = inputs.eq(0).unsqueeze(1)
 
 	def forward(self, inputs, mask=None):
 
+		if self.packed and (mask is not None):
+			return self.packed_forward(inputs, mask)
+
 		out = self.wemb(inputs)
 		out = out * sqrt(out.size(-1))
 		if self.pemb is not None:
@@ -107,11 +154,40 @@ class Encoder(nn.Module):
 		if self.drop is not None:
 			out = self.drop(out)
 
-		for net in self.nets:
-			out = net(out, mask)
+		if use_checkpoint(self, self.act_recompute):
+			out = checkpoint_nets(self.nets, self.act_recompute, run_layer, out, mask)
+		else:
+			for net in self.nets:
+				out = net(out, mask)
 
 		return out if self.out_normer is None else self.out_normer(out)
 
+	# the embedding, layer normalization, feed-forward and attention projections are computed on packed non-pad tokens, only the attention is computed on the padded layout. Outputs at <pad> positions are 0.
+
+	def packed_forward(self, inputs, mask):
+
+		bsize, seql = inputs.size()
+		pind = get_pack_indexes(mask)
+
+		out = self.wemb(pack_seq(inputs.view(-1), pind))
+		out = out * sqrt(out.size(-1))
+		if self.pemb is not None:
+			out = out + self.pemb(inputs, expand=False).squeeze(0).index_select(0, pind.remainder(seql))
+
+		if self.drop is not None:
+			out = self.drop(out)
+
+		if use_checkpoint(self, self.act_recompute):
+			out = checkpoint_nets(self.nets, self.act_recompute, run_packed_layer, out, pind, bsize, seql, mask)
+		else:
+			for net in self.nets:
+				out = net.packed_forward(out, pind, bsize, seql, mask)
+
+		if self.out_normer is not None:
+			out = self.out_normer(out)
+
+		return unpack_seq(out, pind, bsize * seql).view(bsize, seql, -1)
+
 	def load_base(self, base_encoder):
 
 		self.drop = base_encoder.drop
@@ -1,23 +1,26 @@
 #encoding: utf-8
 
 import torch
-from torch.cuda.amp import autocast
 
 from transformer.NMT import NMT
 from transformer.EnsembleNMT import NMT as Ensemble
 from parallel.parallelMT import DataParallelMT
 
 from utils.base import *
+from utils.mapped import load_model_mapped, ensure_mapped
+from utils.cpu import ThreadManager
+from utils.amp import get_amp, fp32_log_softmax
+from utils.shortlist import load_shortlist
 from utils.fmt.base import ldvocab, clean_str, reverse_dict, eos_id, clean_liststr_lentok, dict_insert_set, iter_dict_sort
 from utils.fmt.base4torch import parse_cuda_decode
 
-from utils.fmt.single import batch_padder
+from utils.fmt.single import batch_encoder
 
 from cnfg.ihyp import *
 
 def data_loader(sentences_iter, vcbi, minbsize=1, bsize=768, maxpad=16, maxpart=4, maxtoken=3920):
-	for i_d in batch_padder(sentences_iter, vcbi, bsize, maxpad, maxpart, maxtoken, minbsize):
-		yield torch.tensor(i_d, dtype=torch.long)
+	for i_d in batch_encoder(sentences_iter, vcbi, bsize, maxpad, maxpart, maxtoken, minbsize):
+		yield torch.from_numpy(i_d).long()
 
 def load_fixing(module):
 	if "fix_load" in dir(module):
@@ -47,7 +50,10 @@ def restore(src, tsrc, trs):
 
 class TranslatorCore:
 
-	def __init__(self, modelfs, fvocab_i, fvocab_t, cnfg, minbsize=1, expand_for_mulgpu=True, bsize=64, maxpad=16, maxpart=4, maxtoken=1536, minfreq = False, vsize = False):
+	# share_weights: load weights from flat weight files (utils/mapped.py, converted from h5 model files by the first process if they do not exist) mapped copy-on-write, so that processes serving the same model (e.g., uWSGI workers) share one copy of weights in memory.
+	# num_threads: intra-op threads of each process, None for cnfg.cpu_num_threads. Thread settings (with cnfg.cpu_interop_threads and cnfg.cpu_affinity, utils/cpu.py) are applied before decoding in the process which decodes (rather than the one which builds the translator, e.g., the uWSGI master before forking workers), CPU cores are divided among uWSGI workers by default.
+
+	def __init__(self, modelfs, fvocab_i, fvocab_t, cnfg, minbsize=1, expand_for_mulgpu=True, bsize=64, maxpad=16, maxpart=4, maxtoken=1536, minfreq = False, vsize = False, share_weights=False, num_threads=None):
 
 		vcbi, nwordi = ldvocab(fvocab_i, minfreq, vsize)
 		vcbt, nwordt = ldvocab(fvocab_t, minfreq, vsize)
@@ -62,13 +68,16 @@ class TranslatorCore:
 		self.maxpad = maxpad
 		self.maxpart = maxpart
 		self.minbsize = minbsize
+		self.set_threads = ThreadManager(cnfg.cpu_num_threads if num_threads is None else num_threads, cnfg.cpu_interop_threads, cnfg.cpu_affinity)
+
+		_load_model = (lambda modf, model: load_model_mapped(ensure_mapped(modf), model)) if share_weights else load_model_cpu
 
 		if isinstance(modelfs, (list, tuple)):
 			models = []
 			for modelf in modelfs:
 				tmp = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
 
-				tmp = load_model_cpu(modelf, tmp)
+				tmp = _load_model(modelf, tmp)
 				tmp.apply(load_fixing)
 
 				models.append(tmp)
@@ -77,7 +86,7 @@ class TranslatorCore:
 		else:
 			model = NMT(cnfg.isize, nwordi, nwordt, cnfg.nlayer, cnfg.ff_hsize, cnfg.drop, cnfg.attn_drop, cnfg.share_emb, cnfg.nhead, cache_len_default, cnfg.attn_hsize, cnfg.norm_output, cnfg.bindDecoderEmb, cnfg.forbidden_indexes)
 
-			model = load_model_cpu(modelfs, model)
+			model = _load_model(modelfs, model)
 			model.apply(load_fixing)
 
 		model.eval()
@@ -88,21 +97,25 @@ class TranslatorCore:
 			model.to(self.cuda_device)
 			if self.multi_gpu:
 				model = DataParallelMT(model, device_ids=cuda_devices, output_device=self.cuda_device.index, host_replicate=True, gather_output=False)
-		self.use_amp = cnfg.use_amp and self.use_cuda
+		self.use_amp, self.autocast, _ = get_amp(self.use_cuda, cnfg.use_amp, cnfg.cpu_amp)
+		if self.use_amp:
+			fp32_log_softmax(model)
 
 		self.beam_size = cnfg.beam_size
 
 		self.length_penalty = cnfg.length_penalty
+		self.shortlist = None if (cnfg.shortlist is None) or self.multi_gpu else load_shortlist(cnfg.shortlist, nwordt, cnfg.shortlist_topk)
 		self.net = model
 
 	def __call__(self, sentences_iter):
+		self.set_threads()
 		rs = []
 		with torch.no_grad():
 			for seq_batch in data_loader(sentences_iter, self.vcbi, self.minbsize, self.bsize, self.maxpad, self.maxpart, self.maxtoken):
 				if self.use_cuda:
 					seq_batch = seq_batch.to(self.cuda_device)
-				with autocast(enabled=self.use_amp):
-					output = self.net.decode(seq_batch, self.beam_size, None, self.length_penalty)
+				with self.autocast(enabled=self.use_amp):
+					output = self.net.decode(seq_batch, self.beam_size, None, self.length_penalty) if self.shortlist is None else self.shortlist.decode(self.net, seq_batch, self.beam_size, None, self.length_penalty)
 				if self.multi_gpu:
 					tmp = []
 					for ou in output:
@@ -123,9 +136,12 @@ class TranslatorCore:
 
 class Translator:
 
-	def __init__(self, trans=None, sent_split=None, tok=None, detok=None, bpe=None, debpe=None, punc_norm=None, truecaser=None, detruecaser=None):
+	# batch_split: whether sent_split takes a list of paragraphs and returns the list of their sentences, None to use the batch_input attribute of sent_split
+
+	def __init__(self, trans=None, sent_split=None, tok=None, detok=None, bpe=None, debpe=None, punc_norm=None, truecaser=None, detruecaser=None, batch_split=None):
 
 		self.sent_split = sent_split
+		self.batch_split = getattr(sent_split, "batch_input", False) if batch_split is None else batch_split
 
 		self.flow = []
 		if punc_norm is not None:
@@ -151,12 +167,13 @@ class Translator:
 
 		_tmp = []
 		if self.sent_split is None:
-			for _tmpu in paras:
+			for _tmpu in _paras:
 				_tmp.append(_tmpu)
 				_tmp.append("\n")
 		else:
-			for _tmpu in _paras:
-				_tmp.extend(clean_list([clean_str(_tmps) for _tmps in self.sent_split(_tmpu)]))
+			# paragraphs are split as one batch if supported (datautils.moses.SentenceSplitter, datautils.pool.ProcessorPool), and sentences of all paragraphs then go through each stage of the flow as one batch, which pooled stages process in parallel
+			for _sents in (self.sent_split(_paras) if self.batch_split else [self.sent_split(_tmpu) for _tmpu in _paras]):
+				_tmp.extend(clean_list([clean_str(_tmps) for _tmps in _sents]))
 				_tmp.append("\n")
 		_tmp_o = _tmpi = sorti(_tmp)
 
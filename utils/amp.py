@@ -0,0 +1,43 @@
+#encoding: utf-8
+
+# mixed precision: float16 autocast with loss scaling (GradScaler) on GPU, bfloat16 autocast on CPU (torch.cpu.amp, pytorch >= 1.10). bfloat16 has the exponent range of float32, so gradients do not underflow and are not scaled on CPU. In both cases, parameters, gradients and optimizer states are kept in float32 (master weights), only autocast ops (e.g., linear and matmul) compute in low precision, and log-probabilities (the input of the loss and of beam search) are computed in float32 (fp32_log_softmax).
+
+import torch
+from torch import nn
+from torch.cuda.amp import autocast as cuda_autocast, GradScaler
+
+try:
+	from torch.cpu.amp import autocast as cpu_autocast_base
+except Exception as e:
+	cpu_autocast_base = None
+
+cpu_amp_dtype = torch.bfloat16
+
+def cpu_autocast(enabled=True):
+
+	return cpu_autocast_base(enabled=enabled, dtype=cpu_amp_dtype)
+
+# use_amp: float16 autocast on GPU (cnfg.use_amp)
+# cpu_amp: bfloat16 autocast on CPU (cnfg.cpu_amp), ignored if not supported by pytorch
+# returns: (whether autocast is enabled, the autocast context manager taking enabled, whether gradients should be scaled with GradScaler)
+
+def get_amp(use_cuda, use_amp=False, cpu_amp=False):
+
+	if use_cuda:
+		return use_amp, cuda_autocast, use_amp
+	elif cpu_amp and (cpu_autocast_base is not None):
+		return True, cpu_autocast, False
+
+	return False, cuda_autocast, False
+
+def fp32_input_hook(module, inputs):
+
+	return tuple(_i.float() for _i in inputs)
+
+def fp32_log_softmax(model):
+
+	for _m in model.modules():
+		if isinstance(_m, nn.LogSoftmax):
+			_m.register_forward_pre_hook(fp32_input_hook)
+
+	return model
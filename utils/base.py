@@ -14,7 +14,9 @@ from math import ceil
 
 import logging
 
-from utils.h5serial import h5save, h5load
+from json import dumps, loads
+
+from utils.h5serial import h5save, h5load, h5load_attrs
 
 from cnfg.ihyp import h5modelwargs
 
@@ -87,6 +89,28 @@ def clear_pad_mask(batch_list, mask, dims, mask_dim=-1, return_contiguous=True):
 	else:
 		return batch_list, mask
 
+# mask: (bsize, 1, seql), True for <pad> tokens
+# returns the indexes of non-pad tokens in the flattened (bsize * seql) sequence
+
+def get_pack_indexes(mask):
+
+	return (~mask.view(-1)).nonzero().squeeze(1)
+
+# remove <pad> tokens from x (bsize * seql, ...) with pind from get_pack_indexes, only non-pad tokens (ntokens, ...) are kept
+
+def pack_seq(x, pind):
+
+	return x.index_select(0, pind)
+
+# restore the padded layout (nelem, ...) from packed x (ntokens, ...), <pad> positions are filled with 0
+
+def unpack_seq(x, pind, nelem):
+
+	_size = list(x.size())
+	_size[0] = nelem
+
+	return x.new_zeros(_size).index_copy(0, pind, x)
+
 def freeze_module(module):
 
 	for p in module.parameters():
@@ -157,8 +181,45 @@ def dynamic_sample(incd, dss_ws, dss_rm):
 
 	return _full_rl[:dss_ws] + sample(_full_rl[dss_ws:], dss_rm) if dss_rm > 0 else _full_rl[:dss_ws]
 
+# name of the attribute of model files which keeps the numbers of attention heads/hidden units of pruned modules
+prune_attr = "prune"
+
+# shrink attention heads (modules.base.SelfAttn/CrossAttn/MultiHeadAttn) and hidden units of feed-forward networks (modules.base.PositionwiseFF) of model in place, by their prune functions
+# spec: {module name: kept heads/units (list of indexes), or the number of them (int) to keep the first ones, which takes the shapes of a pruned model before loading its parameters}
+# the numbers of kept heads/units are recorded in model.prune_spec and saved with the model by save_model
+
+def prune_model(model, spec):
+
+	_spec = {} if getattr(model, "prune_spec", None) is None else dict(model.prune_spec)
+	for _name, _module in model.named_modules():
+		if (_name in spec) and hasattr(_module, "prune"):
+			_ind = spec[_name]
+			if isinstance(_ind, int):
+				_ind = list(range(_ind))
+			_module.prune(_ind)
+			_spec[_name] = len(_ind)
+	model.prune_spec = _spec
+
+	return model
+
+def get_model_attrs(model):
+
+	_spec = getattr(model, "prune_spec", None)
+
+	return None if _spec is None else {prune_attr: dumps(_spec)}
+
+# restore the shapes of pruned models from the attributes of model files
+
+def load_model_attrs(attrs, base_model):
+
+	if prune_attr in attrs:
+		base_model = prune_model(base_model, loads(attrs[prune_attr]))
+
+	return base_model
+
 def load_model_cpu(modf, base_model):
 
+	base_model = load_model_attrs(h5load_attrs(modf), base_model)
 	mpg = h5load(modf)
 
 	for para, mp in zip(base_model.parameters(), mpg):
@@ -176,7 +237,7 @@ def save_model(model, fname, sub_module=False, logger=None, h5args=h5modelwargs)
 
 	_msave = model.module if sub_module else model
 	try:
-		h5save([t.data for t in _msave.parameters()], fname, h5args=h5args)
+		h5save([t.data for t in _msave.parameters()], fname, h5args=h5args, attrs=get_model_attrs(_msave))
 	except Exception as e:
 		if logger is None:
 			print(e)
@@ -191,10 +252,10 @@ def async_save_model(model, fname, sub_module=False, logger=None, h5args=h5model
 		_msave = model.module if sub_module else model
 		try:
 			if para_lock is None:
-				h5save([t.data for t in _msave.parameters()], fname, h5args=h5args)
+				h5save([t.data for t in _msave.parameters()], fname, h5args=h5args, attrs=get_model_attrs(_msave))
 			else:
 				with para_lock:
-					h5save([t.data for t in _msave.parameters()], fname, h5args=h5args)
+					h5save([t.data for t in _msave.parameters()], fname, h5args=h5args, attrs=get_model_attrs(_msave))
 		except Exception as e:
 			if logger is None:
 				print(e)
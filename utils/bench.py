@@ -0,0 +1,88 @@
+#encoding: utf-8
+
+import torch
+
+from time import time
+
+try:
+	from torch.autograd.graph import saved_tensors_hooks
+except Exception as e:
+	saved_tensors_hooks = None
+
+def sync_device(device=None):
+
+	if (device is not None) and (device.type == "cuda"):
+		torch.cuda.synchronize(device)
+
+# fwd_func: performs the forward pass and returns the loss (or the output for inference)
+# backward: call backward on the returned loss or not
+# returns the average time cost in seconds per run
+
+def time_func(fwd_func, nrun=8, nwarm=2, backward=True, device=None):
+
+	for i in range(nwarm):
+		_loss = fwd_func()
+		if backward:
+			_loss.backward()
+	_loss = None
+	sync_device(device)
+
+	_st = time()
+	for i in range(nrun):
+		_loss = fwd_func()
+		if backward:
+			_loss.backward()
+		_loss = None
+	sync_device(device)
+
+	return (time() - _st) / nrun
+
+# activation memory kept for the backward pass, counted on tensors saved by autograd during the forward pass (saved_tensors_hooks requires pytorch >= 1.10), or the peak memory allocated on GPU.
+# exclude: tensors (e.g. parameters) which should not be counted
+# returns the memory cost in bytes, None if it can not be measured
+
+def memory_func(fwd_func, backward=True, device=None, exclude=None):
+
+	if (device is not None) and (device.type == "cuda"):
+		sync_device(device)
+		torch.cuda.reset_peak_memory_stats(device)
+		_base = torch.cuda.memory_allocated(device)
+		_loss = fwd_func()
+		if backward:
+			_loss.backward()
+		_loss = None
+		sync_device(device)
+
+		return torch.cuda.max_memory_allocated(device) - _base
+
+	if saved_tensors_hooks is None:
+		return None
+
+	_exclude = set() if exclude is None else set(_t.data_ptr() for _t in exclude)
+	_seen = set()
+	rs = [0]
+
+	def _pack(t):
+
+		_key = (t.data_ptr(), t.numel(), t.dtype,)
+		if (_key[0] not in _exclude) and (_key not in _seen):
+			_seen.add(_key)
+			rs[0] += t.numel() * t.element_size()
+
+		return t
+
+	def _unpack(t):
+
+		return t
+
+	with saved_tensors_hooks(_pack, _unpack):
+		_loss = fwd_func()
+	if backward:
+		_loss.backward()
+	_loss = None
+
+	return rs[0]
+
+def fmt_mem(nbytes):
+
+	return "n/a" if nbytes is None else ("%.2f MB" % (nbytes / 1048576.0))
@@ -0,0 +1,35 @@
+#encoding: utf-8
+
+import torch
+from torch.utils.checkpoint import checkpoint
+
+from inspect import signature
+
+# the non-reentrant implementation (pytorch >= 1.11) handles inputs which do not require gradients correctly, fall back to the reentrant one with old pytorch.
+checkpoint_kwargs = {"use_reentrant": False} if "use_reentrant" in signature(checkpoint).parameters else {}
+
+# nets: a ModuleList of layers
+# seg: number of consecutive layers recomputed together, only the input of each segment is kept for the backward pass
+# func: func(net, out, *inputs) computes the output of a layer
+# out: input to the first layer
+# inputs: other arguments shared by all layers, tensors shall be passed explicitly here rather than captured by func, so that their gradients are correctly computed with the reentrant implementation
+
+def checkpoint_nets(nets, seg, func, out, *inputs):
+
+	for i in range(0, len(nets), seg):
+		_nets = nets[i:i + seg]
+
+		def _seg_forward(out, *inputs, _nets=_nets):
+
+			for net in _nets:
+				out = func(net, out, *inputs)
+
+			return out
+
+		out = checkpoint(_seg_forward, out, *inputs, **checkpoint_kwargs)
+
+	return out
+
+def use_checkpoint(module, seg):
+
+	return (seg > 0) and module.training and torch.is_grad_enabled()
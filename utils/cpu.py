@@ -0,0 +1,76 @@
+#encoding: utf-8
+
+# thread settings of CPU decoding processes: without limits, each of several processes decoding on the same machine (e.g., uWSGI workers, or predict.py with decode_num_processes) starts as many intra-op threads as there are CPU cores, which oversubscribes cores and makes latency jitter.
+
+import torch
+
+from os import cpu_count, getpid
+try:
+	from os import sched_getaffinity, sched_setaffinity
+except Exception as e:
+	sched_getaffinity = sched_setaffinity = None
+
+# returns: ids of CPU cores available to this process, which might be limited by taskset/containers
+
+def get_cpus():
+
+	return list(range(cpu_count() or 1)) if sched_getaffinity is None else sorted(sched_getaffinity(0))
+
+# returns: (index of this worker, number of workers) of uWSGI, (0, 1) if not running under uWSGI
+
+def get_worker_info():
+
+	try:
+		import uwsgi
+		return max(uwsgi.worker_id() - 1, 0), max(uwsgi.numproc, 1)
+	except Exception as e:
+		return 0, 1
+
+# returns: the number of intra-op threads of each of nproc processes
+
+def get_num_threads(nproc=1, num_threads=None, ncpu=None):
+
+	return max(1, (len(get_cpus()) if ncpu is None else ncpu) // max(nproc, 1)) if num_threads is None else num_threads
+
+# set intra-op/inter-op threads and the core affinity of worker rank among nproc processes
+# cpus: cores shared by all processes, got before any process is pinned
+# returns: the number of intra-op threads
+
+def setup_threads(rank=0, nproc=1, num_threads=None, interop_threads=None, affinity=False, cpus=None):
+
+	_cpus = get_cpus() if cpus is None else cpus
+	_num_threads = get_num_threads(nproc, num_threads, len(_cpus))
+	if affinity and (sched_setaffinity is not None):
+		_start = rank * _num_threads
+		sched_setaffinity(0, [_cpus[(_start + _i) % len(_cpus)] for _i in range(min(_num_threads, len(_cpus)))])
+	if torch.get_num_threads() != _num_threads:
+		torch.set_num_threads(_num_threads)
+	if interop_threads is not None:
+		# inter-op threads can only be set before any inter-op parallel work has started
+		try:
+			torch.set_interop_threads(interop_threads)
+		except RuntimeError:
+			pass
+
+	return _num_threads
+
+def setup_threads_cnfg(cnfg, rank=0, nproc=1, cpus=None):
+
+	return setup_threads(rank=rank, nproc=nproc, num_threads=cnfg.cpu_num_threads, interop_threads=cnfg.cpu_interop_threads, affinity=cnfg.cpu_affinity, cpus=cpus)
+
+# apply thread settings once in each process, e.g., in a uWSGI worker forked from the master which built the model
+
+class ThreadManager:
+
+	def __init__(self, num_threads=None, interop_threads=None, affinity=False):
+
+		self.num_threads, self.interop_threads, self.affinity = num_threads, interop_threads, affinity
+		self.pid = None
+
+	def __call__(self):
+
+		_pid = getpid()
+		if self.pid != _pid:
+			_rank, _nproc = get_worker_info()
+			setup_threads(rank=_rank, nproc=_nproc, num_threads=self.num_threads, interop_threads=self.interop_threads, affinity=self.affinity)
+			self.pid = _pid
@@ -0,0 +1,166 @@
+#encoding: utf-8
+
+# multi-process batch decoding robust to crashes: batch ids are sent to worker processes through work queues, results of each batch are appended to the part file of the worker process as a record tagged with the batch id, and flushed once the batch is finished. Batches held by crashed workers are decoded again and replacement workers are started. Complete records of part files left by an interrupted run are reused when decoding is restarted, so that only the remaining batches are decoded, and the merger restores the order of batches in the final output.
+
+from os import listdir, getpid, remove, rmdir, makedirs
+from os.path import join as pjoin, exists as p_check
+from multiprocessing import get_context
+from queue import Empty
+from time import time
+
+# times a batch is retried after the crash of the worker decoding it, before giving up
+max_retry = 2
+# seconds between checks of the state of workers
+check_interval = 1.0
+
+def get_part_dir(fname):
+
+	return fname + ".parts"
+
+def part_fname(part_dir, rank):
+
+	return pjoin(part_dir, "%d.%d.txt" % (rank, getpid(),))
+
+# record: b"$bid $nline\n" followed by nline lines
+
+def write_record(f, bid, lines):
+
+	f.write(("%d %d\n" % (bid, len(lines),)).encode("utf-8"))
+	for line in lines:
+		f.write(line.encode("utf-8"))
+		f.write(b"\n")
+	f.flush()
+
+# returns: {bid: (part file, offset of lines, number of lines)} for complete records of all part files, the incomplete record written by a worker which crashed is skipped.
+
+def index_parts(part_dir):
+
+	rs = {}
+	if p_check(part_dir):
+		for _fname in sorted(listdir(part_dir)):
+			_fname = pjoin(part_dir, _fname)
+			with open(_fname, "rb") as f:
+				_header = f.readline()
+				while _header.endswith(b"\n"):
+					try:
+						bid, nline = [int(_u) for _u in _header.split()]
+					except ValueError:
+						break
+					_offset = f.tell()
+					_complete = True
+					for _ in range(nline):
+						if not f.readline().endswith(b"\n"):
+							_complete = False
+							break
+					if not _complete:
+						break
+					if bid not in rs:
+						rs[bid] = (_fname, _offset, nline,)
+					_header = f.readline()
+
+	return rs
+
+def merge_parts(part_dir, nbatch, fname):
+
+	_index = index_parts(part_dir)
+	_files = {}
+	with open(fname, "wb") as fwrt:
+		for bid in range(nbatch):
+			_fname, _offset, nline = _index[bid]
+			if _fname in _files:
+				f = _files[_fname]
+			else:
+				f = _files[_fname] = open(_fname, "rb")
+			f.seek(_offset)
+			for _ in range(nline):
+				fwrt.write(f.readline())
+	for f in _files.values():
+		f.close()
+	for _fname in listdir(part_dir):
+		remove(pjoin(part_dir, _fname))
+	rmdir(part_dir)
+
+def worker_loop(rank, gen, task_queue, status_queue, part_dir, init_func, decode_func):
+
+	_state = init_func(rank)
+	with open(part_fname(part_dir, rank), "ab") as f:
+		bid = task_queue.get()
+		while bid is not None:
+			write_record(f, bid, decode_func(_state, bid))
+			status_queue.put((rank, gen, bid,))
+			bid = task_queue.get()
+
+# decode nbatch batches with nproc forked processes (which share the model loaded by the main process copy-on-write), and write results into fname in the order of batches. The main process assigns batches to workers one by one, so that it always knows the batch held by each worker.
+# init_func(rank): called once in each worker process (e.g., to set threads and open data files), returns the state passed to decode_func
+# decode_func(state, bid): returns translations (a list of str) of the batch bid
+# yields the number of batches finished so far (e.g., for tqdm)
+
+def sharded_decode(fname, nbatch, nproc, init_func, decode_func):
+
+	part_dir = get_part_dir(fname)
+	makedirs(part_dir, exist_ok=True)
+	_done = set(index_parts(part_dir).keys())
+	ndone = len(_done)
+	if ndone > 0:
+		yield ndone
+
+	_pending = [bid for bid in range(nbatch - 1, -1, -1) if bid not in _done]
+	if _pending:
+		_ctx = get_context("fork")
+		status_queue = _ctx.Queue()
+		workers, _retry = [], {}
+
+		def _next_bid():
+
+			while _pending:
+				bid = _pending.pop()
+				if bid not in _done:
+					return bid
+
+			return None
+
+		def _start(rank, gen):
+
+			_q = _ctx.Queue()
+			_p = _ctx.Process(target=worker_loop, args=(rank, gen, _q, status_queue, part_dir, init_func, decode_func,))
+			_p.start()
+			bid = _next_bid()
+			_q.put(bid)
+
+			return [_p, _q, gen, bid]
+
+		for _rank in range(min(nproc, len(_pending))):
+			workers.append(_start(_rank, 0))
+		_last_check = time()
+		while ndone < nbatch:
+			try:
+				rank, gen, bid = status_queue.get(timeout=check_interval)
+				if bid not in _done:
+					_done.add(bid)
+					ndone += 1
+					yield ndone
+				_w = workers[rank]
+				# messages sent by a crashed worker before its replacement are only counted for finished batches
+				if (_w[2] == gen) and (_w[3] == bid):
+					_w[3] = _next_bid()
+					_w[1].put(_w[3])
+			except Empty:
+				pass
+			if time() - _last_check >= check_interval:
+				for rank, _w in enumerate(workers):
+					_p, _q, gen, bid = _w
+					if (bid is not None) and (not _p.is_alive()):
+						_retry[bid] = _retry.get(bid, 0) + 1
+						if _retry[bid] > max_retry:
+							for _w in workers:
+								_w[0].terminate()
+							raise RuntimeError("batch %d crashed %d workers (exit code %s), results of finished batches are kept in %s" % (bid, _retry[bid], _p.exitcode, part_dir,))
+						_pending.append(bid)
+						workers[rank] = _start(rank, gen + 1)
+				_last_check = time()
+		for _w in workers:
+			_w[1].put(None)
+		for _w in workers:
+			_w[0].join()
+
+	merge_parts(part_dir, nbatch, fname)
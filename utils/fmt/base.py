@@ -34,9 +34,13 @@ def load_states(fname):
 						rs.append(tmpu)
 	return [("i" + tmpu, "t" + tmpu) for tmpu in rs]
 
-def list_reader(fname):
+# start: byte offset of the first line to read
+
+def list_reader(fname, start=0):
 
 	with open(fname, "rb") as frd:
+		if start > 0:
+			frd.seek(start)
 		for line in frd:
 			tmp = line.strip()
 			if tmp:
@@ -145,38 +149,42 @@ def clean_liststr_lentok(lin):
 
 	return " ".join(rs), len(rs)
 
-def maxfreq_filter(ls, lt, max_remove=True):
+# counts: {(source, target): frequency} in the order of the first occurrence of pairs, e.g., built by count_pairs, so that duplicated pairs are not kept in memory repeatedly
+# returns: (sources, targets) of unique pairs in the order of the first occurrence of sources, only targets with the highest frequency of each source are kept with max_remove
+
+def maxfreq_filter_counts(counts, max_remove=True):
+
 	tmp = {}
-	for us, ut in zip(ls, lt):
-		if us not in tmp:
-			tmp[us] = {ut: 1} if max_remove else set([ut])
+	for (us, ut,), freq in counts.items():
+		if us in tmp:
+			tmp[us][ut] = freq
 		else:
-			if max_remove:
-				tmp[us][ut] = tmp[us].get(ut, 0) + 1
-			elif ut not in tmp[us]:
-				tmp[us].add(ut)
+			tmp[us] = {ut: freq}
 	rls, rlt = [], []
-	if max_remove:
-		for tus, tlt in tmp.items():
-			_rs = []
-			_maxf = 0
-			for key, value in tlt.items():
-				if value > _maxf:
-					_maxf = value
-					_rs = [key]
-				elif value == _maxf:
-					_rs.append(key)
-			for tut in _rs:
-				rls.append(tus)
-				rlt.append(tut)
-	else:
-		for tus, tlt in tmp.items():
-			for tut in tlt:
-				rls.append(tus)
-				rlt.append(tut)
+	for tus, tlt in tmp.items():
+		if max_remove and (len(tlt) > 1):
+			_maxf = max(tlt.values())
+			_rs = [key for key, value in tlt.items() if value == _maxf]
+		else:
+			_rs = tlt.keys()
+		for tut in _rs:
+			rls.append(tus)
+			rlt.append(tut)
 
 	return rls, rlt
 
+def count_pairs(ls, lt, counts=None):
+
+	rs = {} if counts is None else counts
+	for _pair in zip(ls, lt):
+		rs[_pair] = rs.get(_pair, 0) + 1
+
+	return rs
+
+def maxfreq_filter(ls, lt, max_remove=True):
+
+	return maxfreq_filter_counts(count_pairs(ls, lt), max_remove)
+
 def shuffle_pair(*inputs):
 
 	tmp = list(zip(*inputs))
@@ -224,14 +232,16 @@ def dict2pairs(dict_in):
 
 	return rsk, rsv
 
-def iter_dict_sort(dict_in, reverse=False):
+# max_depth: values at this depth are yielded even if they are dicts (e.g., counts of dict_insert_count)
+
+def iter_dict_sort(dict_in, reverse=False, max_depth=None):
 
 	d_keys = list(dict_in.keys())
 	d_keys.sort(reverse=reverse)
 	for d_key in d_keys:
 		d_v = dict_in[d_key]
-		if isinstance(d_v, dict):
-			for _item in iter_dict_sort(d_v, reverse):
+		if isinstance(d_v, dict) and ((max_depth is None) or (max_depth > 1)):
+			for _item in iter_dict_sort(d_v, reverse, None if max_depth is None else (max_depth - 1)):
 				yield _item
 		else:
 			yield d_v
@@ -266,6 +276,22 @@ def dict_insert_list(dict_in, value, *keys):
 
 	return dict_in
 
+# count value (e.g., a sentence pair) rather than appending it, so that duplicates are kept only once
+
+def dict_insert_count(dict_in, value, *keys):
+
+	if len(keys) > 1:
+		_cur_key = keys[0]
+		dict_in[_cur_key] = dict_insert_count(dict_in.get(_cur_key, {}), value, *keys[1:])
+	else:
+		key = keys[0]
+		if key in dict_in:
+			dict_in[key][value] = dict_in[key].get(value, 0) + 1
+		else:
+			dict_in[key] = {value: 1}
+
+	return dict_in
+
 def legal_vocab(sent, ilgset, ratio):
 
 	total = ilg = 0
@@ -0,0 +1,49 @@
+#encoding: utf-8
+
+# rules of tools/clean/chars.py, see that file for the description of arguments
+
+def legal_mono_chars(strin, cratio, bratio, sratio):
+
+	ntokens = nchars = nsp = nrule = 0
+	pbpe = False
+	for tmpu in strin.split():
+		if tmpu:
+			if tmpu.endswith("@@"):
+				nchars += 1
+				if not pbpe:
+					pbpe = True
+					nsp += 1
+			elif pbpe:
+				pbpe = False
+			ntokens += 1
+	ntokens = float(ntokens)
+	lorigin = float(len(strin.replace("@@ ", "").split()))
+	if float(nchars) / ntokens > cratio:
+		nrule += 1
+	if ntokens / lorigin > bratio:
+		nrule += 1
+	if float(nsp) / lorigin > sratio:
+		nrule += 1
+
+	return nrule, ntokens, lorigin
+
+def ratio_bilingual(ls, lt):
+
+	if ls > lt:
+		return ls / lt
+	else:
+		return lt / ls
+
+def legal_chars(strins, strint, cratio, bratio, sratio, pratio, oratio, num_rules_drop):
+
+	ls, lens, lenso = legal_mono_chars(strins, cratio, bratio, sratio)
+	lt, lent, lento = legal_mono_chars(strint, cratio, bratio, sratio)
+	nrule = max(ls, lt)
+	if ratio_bilingual(lens, lent) > pratio:
+		nrule += 1
+	if ratio_bilingual(lenso, lento) > oratio:
+		nrule += 1
+	if nrule < num_rules_drop:
+		return True
+	else:
+		return False
@@ -0,0 +1,224 @@
+#encoding: utf-8
+
+from hashlib import blake2b
+from tempfile import mkdtemp
+from shutil import rmtree
+from os import remove
+from os.path import join as pjoin, exists as p_check
+
+from cnfg.hyp import dedup_hash_bits, dedup_max_keys
+
+# number of partitions spilled counts are split into, counts of one partition are merged in memory at once
+num_partitions = 64
+# bytes of the count in spilled records
+count_bytes = 4
+max_count = (1 << (count_bytes * 8)) - 1
+
+# keys of strings (64 or 128 bits), so that duplicate resolution keeps integers rather than full strings in memory. Strings should be normalized (e.g., with clean_liststr_lentok) before hashing.
+
+def hash_str(strin, nbits=64):
+
+	return int.from_bytes(blake2b(strin.encode("utf-8"), digest_size=nbits // 8).digest(), "little")
+
+# keep, for each source, all targets of the maximum frequency, as tools/clean/maxkeeper.py does, with pairs identified by the keys of their source and target strings.
+# usage: call add for all pairs in the first pass, then finish, and keep for pairs in the output pass, which returns True only for the first occurrence of each kept pair. With exact, call verify with the strings of all pairs in a verification pass between finish and keep, then finish_verify, and give strings to keep.
+# nbits: bits of hashes computed by the caller (hash_str(s, keeper.nbits))
+# max_keys: the memory budget in number of distinct pairs counted in memory, counts are spilled to partitions (by source keys) on disk when it is exceeded and merged partition by partition in finish. None to keep all counts in memory.
+# cache_dir: directory for spilled partitions, a temporary directory is created (and removed in finish) if None.
+# exact: hashes only locate duplicated sources, whose pairs are counted and selected with full strings in the verification pass, so that hash collisions can never drop pairs.
+# only sources seen more than once are kept in memory after finish, all pairs of other sources are kept. In the exact mode, strings of kept pairs of sources seen more than once are kept in memory after finish_verify.
+
+class MaxFreqKeeper:
+
+	def __init__(self, nbits=dedup_hash_bits, max_keys=dedup_max_keys, cache_dir=None, exact=False):
+
+		self.nbits, self.max_keys, self.cache_dir, self.exact = nbits, max_keys, cache_dir, exact
+		self.key_bytes = nbits // 4
+		self.tmp_dir = None
+		self.counts = {}
+		self.dup_src = self.keep_set = self.exact_counts = None
+
+	def add(self, ks, kt):
+
+		_key = (ks << self.nbits) | kt
+		self.counts[_key] = self.counts.get(_key, 0) + 1
+		if (self.max_keys is not None) and (len(self.counts) >= self.max_keys):
+			self.spill()
+
+	def part_fname(self, pid):
+
+		return pjoin(self.tmp_dir, "%d.cnt" % pid)
+
+	# records of spilled counts: key (self.key_bytes) + count (count_bytes), counts exceeding max_count are split into several records
+
+	def spill(self):
+
+		if self.tmp_dir is None:
+			self.tmp_dir = mkdtemp(prefix="dedup.", dir=self.cache_dir)
+		_parts = [[] for _ in range(num_partitions)]
+		_shift = self.nbits
+		for _key, _freq in self.counts.items():
+			_rec = _parts[(_key >> _shift) % num_partitions]
+			while _freq > max_count:
+				_rec.append(_key.to_bytes(self.key_bytes, "little") + max_count.to_bytes(count_bytes, "little"))
+				_freq -= max_count
+			_rec.append(_key.to_bytes(self.key_bytes, "little") + _freq.to_bytes(count_bytes, "little"))
+		for _pid, _rec in enumerate(_parts):
+			if _rec:
+				with open(self.part_fname(_pid), "ab") as f:
+					f.write(b"".join(_rec))
+		self.counts = {}
+
+	def load_part(self, pid):
+
+		rs = {}
+		_fname = self.part_fname(pid)
+		if p_check(_fname):
+			_kb, _rb = self.key_bytes, self.key_bytes + count_bytes
+			with open(_fname, "rb") as f:
+				_buf = f.read(_rb * 65536)
+				while _buf:
+					for _i in range(0, len(_buf), _rb):
+						_key = int.from_bytes(_buf[_i:_i + _kb], "little")
+						rs[_key] = rs.get(_key, 0) + int.from_bytes(_buf[_i + _kb:_i + _rb], "little")
+					_buf = f.read(_rb * 65536)
+			remove(_fname)
+
+		return rs
+
+	def select(self, counts):
+
+		_shift = self.nbits
+		_maxf, _nsrc = {}, {}
+		for _key, _freq in counts.items():
+			_ks = _key >> _shift
+			_nsrc[_ks] = _nsrc.get(_ks, 0) + _freq
+			if _freq > _maxf.get(_ks, 0):
+				_maxf[_ks] = _freq
+		self.dup_src.update(_ks for _ks, _freq in _nsrc.items() if _freq > 1)
+		if not self.exact:
+			self.keep_set.update(_key for _key, _freq in counts.items() if (_nsrc[_key >> _shift] > 1) and (_freq == _maxf[_key >> _shift]))
+
+	def finish(self):
+
+		self.dup_src = set()
+		self.keep_set = None if self.exact else set()
+		if self.tmp_dir is None:
+			self.select(self.counts)
+			self.counts = None
+		else:
+			self.spill()
+			self.counts = None
+			for _pid in range(num_partitions):
+				self.select(self.load_part(_pid))
+			rmtree(self.tmp_dir, ignore_errors=True)
+			self.tmp_dir = None
+		if self.exact:
+			self.exact_counts = {}
+			self.nexact = 0
+
+	# the verification pass of the exact mode, strings are only counted for sources seen more than once, counts are spilled to partitions (by source keys) on disk when max_keys distinct pairs are counted in memory
+
+	def verify(self, ks, ls, lt):
+
+		if ks in self.dup_src:
+			_counts = self.exact_counts
+			_k = (ks, ls,)
+			if _k in _counts:
+				_v = _counts[_k]
+				if lt in _v:
+					_v[lt] += 1
+				else:
+					_v[lt] = 1
+					self.nexact += 1
+			else:
+				_counts[_k] = {lt: 1}
+				self.nexact += 1
+			if (self.max_keys is not None) and (self.nexact >= self.max_keys):
+				self.spill_exact()
+
+	def exact_part_fname(self, pid):
+
+		return pjoin(self.tmp_dir, "%d.exact" % pid)
+
+	# records of spilled exact counts: source key (self.key_bytes // 2) + bytes of the source and the target string (count_bytes each) + count (count_bytes) + source and target strings (utf-8)
+
+	def spill_exact(self):
+
+		if self.tmp_dir is None:
+			self.tmp_dir = mkdtemp(prefix="dedup.", dir=self.cache_dir)
+		_parts = [[] for _ in range(num_partitions)]
+		_kb = self.key_bytes // 2
+		for (_ks, ls,), v in self.exact_counts.items():
+			_rec = _parts[_ks % num_partitions]
+			_ks_b, _ls_b = _ks.to_bytes(_kb, "little"), ls.encode("utf-8")
+			for lt, _freq in v.items():
+				_lt_b = lt.encode("utf-8")
+				_head = _ks_b + len(_ls_b).to_bytes(count_bytes, "little") + len(_lt_b).to_bytes(count_bytes, "little")
+				while _freq > max_count:
+					_rec.append(_head + max_count.to_bytes(count_bytes, "little") + _ls_b + _lt_b)
+					_freq -= max_count
+				_rec.append(_head + _freq.to_bytes(count_bytes, "little") + _ls_b + _lt_b)
+		for _pid, _rec in enumerate(_parts):
+			if _rec:
+				with open(self.exact_part_fname(_pid), "ab") as f:
+					f.write(b"".join(_rec))
+		self.exact_counts = {}
+		self.nexact = 0
+
+	def load_exact_part(self, pid):
+
+		rs = {}
+		_fname = self.exact_part_fname(pid)
+		if p_check(_fname):
+			_kb = self.key_bytes // 2
+			_hb = _kb + count_bytes * 3
+			with open(_fname, "rb") as f:
+				_buf = f.read()
+			remove(_fname)
+			_i, _l = 0, len(_buf)
+			while _i < _l:
+				_ks = int.from_bytes(_buf[_i:_i + _kb], "little")
+				_lsl = int.from_bytes(_buf[_i + _kb:_i + _kb + count_bytes], "little")
+				_ltl = int.from_bytes(_buf[_i + _kb + count_bytes:_i + _kb + count_bytes * 2], "little")
+				_freq = int.from_bytes(_buf[_i + _kb + count_bytes * 2:_i + _hb], "little")
+				_i += _hb
+				ls = _buf[_i:_i + _lsl].decode("utf-8")
+				_i += _lsl
+				lt = _buf[_i:_i + _ltl].decode("utf-8")
+				_i += _ltl
+				_v = rs.setdefault((_ks, ls,), {})
+				_v[lt] = _v.get(lt, 0) + _freq
+
+		return rs
+
+	def select_exact(self, counts):
+
+		for (_ks, ls,), v in counts.items():
+			_maxf = max(v.values())
+			self.keep_set.update((ls, lt,) for lt, _freq in v.items() if _freq == _maxf)
+
+	def finish_verify(self):
+
+		self.keep_set = set()
+		if self.tmp_dir is None:
+			self.select_exact(self.exact_counts)
+			self.exact_counts = None
+		else:
+			self.spill_exact()
+			self.exact_counts = None
+			for _pid in range(num_partitions):
+				self.select_exact(self.load_exact_part(_pid))
+			rmtree(self.tmp_dir, ignore_errors=True)
+			self.tmp_dir = None
+
+	def keep(self, ks, kt, ls=None, lt=None):
+
+		if ks not in self.dup_src:
+			return True
+		_key = (ls, lt,) if self.exact else ((ks << self.nbits) | kt)
+		if _key in self.keep_set:
+			self.keep_set.remove(_key)
+			return True
+
+		return False
@@ -1,6 +1,34 @@
 #encoding: utf-8
 
-from utils.fmt.base import clean_list
+from utils.fmt.base import clean_list, sos_id
+
+from cnfg.hyp import doc_pad_sent_ratio
+
+nsent_bucket_cache = {}
+
+# returns: the largest number of sentences of the bucket of documents with nsent sentences
+
+def get_nsent_bucket(nsent, ratio=doc_pad_sent_ratio):
+
+	_key = (nsent, ratio,)
+	if _key not in nsent_bucket_cache:
+		rs = 1
+		while rs < nsent:
+			rs += max(1, int(rs * ratio))
+		nsent_bucket_cache[_key] = rs
+
+	return nsent_bucket_cache[_key]
+
+# pad mapped documents of a batch to nsent sentences with placeholder sentences of only the <sos> token, which keep one unmasked position for attention of the encoder and the decoder (fully masked rows would give NaN), and give no loss as their targets are padding after <sos>. Placeholders only follow real sentences, which never attend to them as contexts only come from previous sentences.
+
+def pad_doc(i_d, nsent):
+
+	for doc in i_d:
+		_ld = len(doc)
+		if _ld < nsent:
+			doc.extend([[sos_id] for i in range(nsent - _ld)])
+
+	return i_d
 
 def doc_reader(fname):
 
@@ -1,15 +1,69 @@
 #encoding: utf-8
 
-from utils.fmt.base import map_batch, pad_batch
-from utils.fmt.doc.mono.single import batch_loader
+from utils.fmt.base import get_bsize, map_batch, pad_batch
+from utils.fmt.doc.base import doc_reader, get_nsent_bucket, pad_doc
 
-def batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
+from cnfg.hyp import doc_pad_sent_ratio
 
-	for i_d, mlen_i, nsent in batch_loader(finput, bsize, maxpad, maxpart, maxtoken, minbsize):
+# returns the numbers of sentences of documents in the batch (nsents) in addition, so that translations of placeholder sentences can be dropped.
+
+def batch_loader(finput, bsize, maxpad, maxpart, maxtoken, minbsize, pad_sent_ratio=doc_pad_sent_ratio):
+
+	rsi = []
+	nsents = []
+	nd = maxlen = minlen = mlen_i = nsent = bucket = 0
+	_bsize = bsize
+	for i_d, i_lgth in doc_reader(finput):
+		cur_nsent = len(i_d)
+		cur_bucket = get_nsent_bucket(cur_nsent, pad_sent_ratio)
+		lgth = i_lgth
+		if maxlen == 0:
+			_maxpad = max(1, min(maxpad, lgth // maxpart + 1) // 2)
+			maxlen = lgth + _maxpad
+			minlen = lgth - _maxpad
+			_bsize = max(1, get_bsize(maxlen, maxtoken, bsize) // cur_bucket)
+		if bucket == 0:
+			bucket = cur_bucket
+		if (cur_bucket == bucket) and ((nd < minbsize) or (lgth <= maxlen and lgth >= minlen and nd < _bsize)):
+			rsi.append(i_d)
+			nsents.append(cur_nsent)
+			if i_lgth > mlen_i:
+				mlen_i = i_lgth
+			if cur_nsent > nsent:
+				nsent = cur_nsent
+			nd += 1
+		else:
+			yield rsi, mlen_i, nsent, nsents
+			rsi = [i_d]
+			nsents = [cur_nsent]
+			mlen_i = i_lgth
+			nsent = cur_nsent
+			bucket = cur_bucket
+			_maxpad = max(1, min(maxpad, lgth // maxpart + 1) // 2)
+			maxlen = lgth + _maxpad
+			minlen = lgth - _maxpad
+			_bsize = max(1, get_bsize(maxlen, maxtoken, bsize) // cur_bucket)
+			nd = 1
+	if rsi:
+		yield rsi, mlen_i, nsent, nsents
+
+def batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize, pad_sent_ratio=doc_pad_sent_ratio):
+
+	for i_d, mlen_i, nsent, nsents in batch_loader(finput, bsize, maxpad, maxpart, maxtoken, minbsize, pad_sent_ratio):
 		rsi, extok_i = map_batch(i_d, vocabi)
-		yield rsi, mlen_i + extok_i, nsent
+		yield pad_doc(rsi, nsent), mlen_i + extok_i, nsent, nsents
+
+def batch_padder(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize, pad_sent_ratio=doc_pad_sent_ratio):
+
+	for i_d, mlen_i, nsent, nsents in batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize, pad_sent_ratio):
+		yield pad_batch(i_d, mlen_i), nsent, nsents
+
+# returns: keys (nsent, batch id) of batches of the test set td (an h5py.File built by tools/doc/para/mktest.py) in the order of the sorted input, so that translations are aligned with it
+# files without the order of batches only group documents with the same number of sentences, whose batches are in order group by group
+
+def get_batch_keys(td):
 
-def batch_padder(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
+	if "order" in td:
+		return [(str(nsent), str(_curd),) for nsent, _curd in td["order"][:].tolist()]
 
-	for i_d, mlen_i, nsent in batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
-		yield pad_batch(i_d, mlen_i), nsent
+	return [(str(nsent), str(_curd),) for nsent, ndata in zip(td["nsent"][:].tolist(), td["ndata"][:].tolist()) for _curd in range(ndata)]
@@ -1,6 +1,7 @@
 #encoding: utf-8
 
 from utils.fmt.base import list_reader, get_bsize, map_batch, pad_batch
+from utils.fmt.encode import BatchEncoder
 
 def batch_loader(finput, ftarget, bsize, maxpad, maxpart, maxtoken, minbsize):
 
@@ -46,3 +47,11 @@ def batch_mapper(finput, ftarget, vocabi, vocabt, bsize, maxpad, maxpart, maxtok
 def batch_padder(finput, ftarget, vocabi, vocabt, bsize, maxpad, maxpart, maxtoken, minbsize):
 	for i_d, td, mlen_i, mlen_t in batch_mapper(finput, ftarget, vocabi, vocabt, bsize, maxpad, maxpart, maxtoken, minbsize):
 		yield pad_batch(i_d, mlen_i), pad_batch(td, mlen_t)
+
+# the same batches as batch_padder, as numpy int32 arrays
+
+def batch_encoder(finput, ftarget, vocabi, vocabt, bsize, maxpad, maxpart, maxtoken, minbsize):
+
+	_enc_i, _enc_t = BatchEncoder(vocabi), BatchEncoder(vocabt)
+	for i_d, td, mlen_i, mlen_t in batch_loader(finput, ftarget, bsize, maxpad, maxpart, maxtoken, minbsize):
+		yield _enc_i(i_d, mlen_i), _enc_t(td, mlen_t)
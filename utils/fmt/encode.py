@@ -0,0 +1,45 @@
+#encoding: utf-8
+
+import numpy
+
+from itertools import chain, repeat
+
+from utils.fmt.base import pad_id, sos_id, eos_id, unk_id
+
+# map a batch of tokenized sentences to a padded numpy int32 array in one pass, equivalent to pad_batch(map_batch(i_d, vcb)[0], mlen + 2) in utils/fmt/base.py: tokens are looked up by dict.get mapped over the flattened batch (without executing python code per token) into a pre-sized array, which is scattered into the (bsize, mlen + 2) output with sos/eos/pad.
+# vcb: the token to id dict loaded by ldvocab, tokens not in vcb are mapped to unk_id, or dropped (as no_unk_mapper does) with use_unk = False
+
+class BatchEncoder:
+
+	def __init__(self, vcb):
+
+		self.get = vcb.get
+		self.unk = -1 if unk_id is None else unk_id
+
+	# i_d: a list of tokenized sentences
+	# mlen: the maximum number of tokens (without sos/eos) of sentences in i_d, computed from i_d if None
+	# returns: a (bsize, mlen + 2) numpy int32 array
+
+	def __call__(self, i_d, mlen=None):
+
+		bsize = len(i_d)
+		lens = numpy.fromiter(map(len, i_d), dtype=numpy.int64, count=bsize)
+		_ntok = int(lens.sum())
+		ids = numpy.fromiter(map(self.get, chain.from_iterable(i_d), repeat(self.unk)), dtype=numpy.int32, count=_ntok)
+		if mlen is None:
+			mlen = int(lens.max()) if bsize > 0 else 0
+		if self.unk < 0:
+			_keep = ids >= 0
+			if not _keep.all():
+				_csum = numpy.zeros(_ntok + 1, dtype=numpy.int64)
+				numpy.cumsum(_keep, out=_csum[1:])
+				_ends = numpy.cumsum(lens)
+				lens = _csum[_ends] - _csum[_ends - lens]
+				ids = ids[_keep]
+
+		rs = numpy.full((bsize, mlen + 2,), pad_id, dtype=numpy.int32)
+		rs[:, 0] = sos_id
+		rs[:, 1:mlen + 1][numpy.arange(mlen) < lens[:, None]] = ids
+		rs[numpy.arange(bsize), lens + 1] = eos_id
+
+		return rs
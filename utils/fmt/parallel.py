@@ -0,0 +1,174 @@
+#encoding: utf-8
+
+# process large text files with a pool of processes: files are split into byte ranges at line boundaries, and results of ranges are returned in the order of the files and of the ranges in each file, so that merging them in order gives the same result as processing the files sequentially.
+
+from os import cpu_count
+try:
+	from os import sched_getaffinity
+except Exception as e:
+	sched_getaffinity = None
+from os.path import getsize
+from multiprocessing import Pool
+
+from cnfg.hyp import data_num_processes
+
+# ranges smaller than this (in bytes) are not worth a process
+min_range_size = 1048576
+
+def get_nproc(nproc=None):
+
+	_nproc = data_num_processes if nproc is None else nproc
+	if _nproc is None:
+		# CPUs available to this process, which might be limited by taskset/containers
+		_nproc = (cpu_count() or 1) if sched_getaffinity is None else len(sched_getaffinity(0))
+
+	return max(_nproc, 1)
+
+# returns: a list of (start, end) byte offsets of nrange ranges (at most) covering the file, each of which starts at the beginning of a line
+
+def split_file(fname, nrange):
+
+	_fsize = getsize(fname)
+	nrange = max(1, min(nrange, _fsize // min_range_size))
+	rs = []
+	_start = 0
+	with open(fname, "rb") as f:
+		for i in range(1, nrange):
+			_pos = _fsize * i // nrange
+			if _pos > _start:
+				# the range ends after the line containing byte (_pos - 1)
+				f.seek(_pos - 1)
+				f.readline()
+				_pos = f.tell()
+				if _pos > _start:
+					rs.append((_start, _pos,))
+					_start = _pos
+	if _start < _fsize or not rs:
+		rs.append((_start, _fsize,))
+
+	return rs
+
+def range_reader(fname, start, end):
+
+	with open(fname, "rb") as f:
+		f.seek(start)
+		_pos = start
+		for line in f:
+			if _pos >= end:
+				break
+			yield line
+			_pos += len(line)
+
+# byte offsets of the non-empty lines (counted as list_reader and line_reader in utils/fmt/base.py do) with indexes in lind (sorted), an index equal to the number of non-empty lines gives the size of the file.
+
+def nonempty_line_offsets(fname, lind):
+
+	rs = []
+	_lind = iter(lind)
+	_cur = next(_lind, None)
+	_pos = _ind = 0
+	with open(fname, "rb") as f:
+		for line in f:
+			if line.strip():
+				while _cur == _ind:
+					rs.append(_pos)
+					_cur = next(_lind, None)
+				_ind += 1
+			_pos += len(line)
+	while _cur is not None:
+		rs.append(_pos)
+		_cur = next(_lind, None)
+
+	return rs
+
+# split batches (with bsizes sentences each) into at most nshard contiguous shards with about the same number of sentences.
+# returns: a list of (index of the first batch, index after the last batch, index of the first sentence)
+
+def split_batches(bsizes, nshard):
+
+	_total = sum(bsizes)
+	rs = []
+	_start = _sstart = _nsent = 0
+	for _ind, _bsize in enumerate(bsizes, 1):
+		_nsent += _bsize
+		if (_nsent * nshard >= _total * (len(rs) + 1)) or (_ind == len(bsizes)):
+			rs.append((_start, _ind, _sstart,))
+			_start, _sstart = _ind, _nsent
+
+	return rs
+
+# returns: byte offsets of the beginning of lines with indexes in lind (sorted), the file size for indexes beyond the last line
+
+def line_offsets(fname, lind):
+
+	rs = []
+	_lind = iter(lind)
+	_cur = next(_lind, None)
+	_pos = _ind = 0
+	with open(fname, "rb") as f:
+		for line in f:
+			while _cur == _ind:
+				rs.append(_pos)
+				_cur = next(_lind, None)
+			_ind += 1
+			_pos += len(line)
+	while _cur is not None:
+		rs.append(_pos)
+		_cur = next(_lind, None)
+
+	return rs
+
+def count_newlines(fname, start, end, block_size=1048576):
+
+	rs = 0
+	with open(fname, "rb") as f:
+		f.seek(start)
+		_remain = end - start
+		while _remain > 0:
+			_block = f.read(min(block_size, _remain))
+			if not _block:
+				break
+			rs += _block.count(b"\n")
+			_remain -= len(_block)
+
+	return rs
+
+# split line-aligned files (e.g., the source and the target side of a parallel corpus) into ranges covering the same lines of all files, the first file is split by bytes and the other files at the same line indexes.
+# returns: a list (for each range) of lists of (start, end) byte offsets (for each file)
+
+def split_aligned_files(fl, nrange):
+
+	_ranges = split_file(fl[0], nrange)
+	_lind, _ind = [], 0
+	for _start, _end in _ranges:
+		_lind.append(_ind)
+		_ind += count_newlines(fl[0], _start, _end)
+	rs = [[_r] for _r in _ranges]
+	for fname in fl[1:]:
+		_offsets = line_offsets(fname, _lind)
+		_offsets.append(getsize(fname))
+		for _rs, _start, _end in zip(rs, _offsets, _offsets[1:]):
+			_rs.append((_start, _end,))
+
+	return rs
+
+# func: a function (defined at the top level of a module, so that it can be pickled) applied on (fname, start, end, *args)
+# returns: a list (for each file) of lists of results (for each range in the file)
+
+def map_files(func, fl, *args, nproc=None):
+
+	_nproc = get_nproc(nproc)
+	_ranges = [split_file(fname, _nproc) if _nproc > 1 else [(0, getsize(fname),)] for fname in fl]
+	_tasks = [(fname, _start, _end,) + args for fname, _rl in zip(fl, _ranges) for _start, _end in _rl]
+	if (_nproc > 1) and (len(_tasks) > 1):
+		with Pool(min(_nproc, len(_tasks))) as pool:
+			_rs = pool.starmap(func, _tasks)
+	else:
+		_rs = [func(*_task) for _task in _tasks]
+	rs, _ind = [], 0
+	for _rl in _ranges:
+		_nind = _ind + len(_rl)
+		rs.append(_rs[_ind:_nind])
+		_ind = _nind
+
+	return rs
@@ -1,6 +1,7 @@
 #encoding: utf-8
 
 from utils.fmt.base import list_reader, get_bsize, map_batch, pad_batch
+from utils.fmt.encode import BatchEncoder
 
 def batch_loader(finput, bsize, maxpad, maxpart, maxtoken, minbsize):
 
@@ -40,3 +41,11 @@ def batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
 def batch_padder(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
 	for i_d, mlen_i in batch_mapper(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
 		yield pad_batch(i_d, mlen_i)
+
+# the same batches as batch_padder, as numpy int32 arrays
+
+def batch_encoder(finput, vocabi, bsize, maxpad, maxpart, maxtoken, minbsize):
+
+	_enc = BatchEncoder(vocabi)
+	for i_d, mlen_i in batch_loader(finput, bsize, maxpad, maxpart, maxtoken, minbsize):
+		yield _enc(i_d, mlen_i)
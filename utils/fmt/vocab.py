@@ -0,0 +1,67 @@
+#encoding: utf-8
+
+from collections import Counter
+
+from utils.fmt.base import clean_list_iter
+from utils.fmt.parallel import range_reader, map_files
+
+def count_range(fname, start, end):
+
+	rs = Counter()
+	for line in range_reader(fname, start, end):
+		tmp = line.strip()
+		if tmp:
+			rs.update(clean_list_iter(tmp.decode("utf-8").split()))
+
+	return rs
+
+# count tokens of files in parallel, tokens of counts keep the order of their first occurrence in the files, as do the counts of a sequential pass.
+# returns: a list of Counters for each file
+
+def count_files(fl, nproc=None):
+
+	rs = []
+	for _rl in map_files(count_range, fl, nproc=nproc):
+		_vocab = Counter()
+		for _c in _rl:
+			_vocab.update(_c)
+		rs.append(_vocab)
+
+	return rs
+
+def merge_counts(*counts):
+
+	rs = Counter()
+	for _c in counts:
+		rs.update(_c)
+
+	return rs
+
+# save the vsize most frequent tokens, one line per frequency: "freq token1 token2 ...", tokens with the same frequency are kept in the order of vocab.
+
+def save_vocab(vocab, rsf, vsize=65532):
+
+	r_vocab = {}
+	for k, v in vocab.items():
+		if v not in r_vocab:
+			r_vocab[v]=[str(v), k]
+		else:
+			r_vocab[v].append(k)
+
+	freqs = list(r_vocab.keys())
+	freqs.sort(reverse=True)
+
+	ens = "\n".encode("utf-8")
+	remain = vsize
+	with open(rsf, "wb") as f:
+		for freq in freqs:
+			cdata = r_vocab[freq]
+			ndata = len(cdata) - 1
+			if remain < ndata:
+				cdata = cdata[:remain + 1]
+				ndata = remain
+			f.write(" ".join(cdata).encode("utf-8"))
+			f.write(ens)
+			remain -= ndata
+			if remain <= 0:
+				break
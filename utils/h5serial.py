@@ -28,9 +28,14 @@ def h5write_list(gwrt, ltw, h5args=h5modelwargs):
 
 	h5write_dict(gwrt, list2dict(ltw, kfunc=list_key_func), h5args=h5args)
 
-def h5save(obj_save, fname, h5args=h5modelwargs):
+# attrs: {name: str} saved as attributes of the file (e.g., metadata of pruned models), which are not loaded by h5load
+
+def h5save(obj_save, fname, h5args=h5modelwargs, attrs=None):
 
 	h5f = h5py.File(fname, 'w')
+	if attrs:
+		for k, v in attrs.items():
+			h5f.attrs[k] = v
 	_obj_save = tuple(obj_save) if isinstance(obj_save, Iterator) else obj_save
 	if isinstance(_obj_save, dict):
 		h5write_dict(h5f, _obj_save, h5args=h5args)
@@ -40,6 +45,13 @@ def h5save(obj_save, fname, h5args=h5modelwargs):
 		h5write_list(h5f, [_obj_save], h5args=h5args)
 	h5f.close()
 
+def h5load_attrs(fname):
+
+	with h5py.File(fname, "r") as f:
+		rs = {k: v.decode("utf-8") if isinstance(v, bytes) else v for k, v in f.attrs.items()}
+
+	return rs
+
 def restore_list_in_dict(din):
 
 	if isinstance(din, dict):
@@ -0,0 +1,116 @@
+#encoding: utf-8
+
+# compact storage of teacher token distributions for word-level knowledge distillation: for each non-pad target token of each batch of the training data (in the order of tokens in the batch), the most probable teacher tokens are kept until their probabilities sum to kd_mass (at most kd_topk of them). Ids (uint16 for vocabularies of at most 65536 words, int32 otherwise) and probabilities (float16) of kept tokens are appended to raw files, with the number of kept tokens of each target token (uint8) in another one, and offsets of batches in an index file (fname + ".json"). Readers map raw files (numpy.memmap), so that only the batches used are read from disk.
+
+import torch
+import numpy
+
+from json import dump, load
+
+from utils.fmt.base import pad_id
+
+from cnfg.hyp import kd_topk, kd_mass
+
+prob_dtype = numpy.float16
+
+def get_fnames(fname):
+
+	return fname + ".ids", fname + ".probs", fname + ".cnt", fname + ".json"
+
+def get_id_dtype(nword):
+
+	return numpy.uint16 if nword <= 65536 else numpy.int32
+
+# returns: the largest topk (at most topk, at least 1) with which ntok target tokens fit into budget bytes
+
+def get_topk_budget(ntok, nword, topk=kd_topk, budget=None):
+
+	if budget is None:
+		return topk
+	_ebytes = numpy.dtype(get_id_dtype(nword)).itemsize + numpy.dtype(prob_dtype).itemsize
+
+	return max(1, min(topk, (budget - ntok * numpy.dtype(numpy.uint8).itemsize) // (ntok * _ebytes)))
+
+class TopKWriter:
+
+	def __init__(self, fname, nword, topk=kd_topk, mass=kd_mass):
+
+		self.fname, self.nword, self.topk, self.mass = fname, nword, min(topk, nword, 255), mass
+		self.id_dtype = get_id_dtype(nword)
+		fids, fprobs, fcnt, self.findex = get_fnames(fname)
+		self.fids, self.fprobs, self.fcnt = open(fids, "wb"), open(fprobs, "wb"), open(fcnt, "wb")
+		self.index = {}
+		self.ntok = self.nent = 0
+
+	# bid: the key of the batch in the training data
+	# output: log-probabilities of the teacher (bsize, seql, nword)
+	# target: (bsize, seql)
+
+	def write(self, bid, output, target):
+
+		_p = output.view(-1, output.size(-1))[target.view(-1).ne(pad_id)].float().exp()
+		probs, ids = _p.topk(self.topk, dim=-1)
+		# the smallest number of most probable tokens whose probabilities sum to mass
+		cnt = probs.cumsum(-1).lt(self.mass).sum(-1).add_(1).clamp_(max=self.topk)
+		_keep = torch.arange(self.topk, dtype=cnt.dtype, device=cnt.device).unsqueeze(0).lt(cnt.unsqueeze(1))
+		ids, probs, cnt = ids[_keep].cpu().numpy().astype(self.id_dtype), probs[_keep].cpu().numpy().astype(prob_dtype), cnt.cpu().numpy().astype(numpy.uint8)
+		self.fids.write(ids.tobytes())
+		self.fprobs.write(probs.tobytes())
+		self.fcnt.write(cnt.tobytes())
+		_ntok, _nent = cnt.shape[0], ids.shape[0]
+		self.index[bid] = (self.ntok, _ntok, self.nent, _nent,)
+		self.ntok += _ntok
+		self.nent += _nent
+
+	def close(self):
+
+		if self.fids is not None:
+			self.fids.close()
+			self.fprobs.close()
+			self.fcnt.close()
+			self.fids = self.fprobs = self.fcnt = None
+			with open(self.findex, "w") as f:
+				dump({"nword": self.nword, "topk": self.topk, "mass": self.mass, "ntok": self.ntok, "nent": self.nent, "index": self.index}, f)
+
+	def __enter__(self):
+
+		return self
+
+	def __exit__(self, *inputs, **kwargs):
+
+		self.close()
+
+class TopKReader:
+
+	def __init__(self, fname):
+
+		fids, fprobs, fcnt, findex = get_fnames(fname)
+		with open(findex) as f:
+			_info = load(f)
+		self.nword, self.topk, self.index = _info["nword"], _info["topk"], _info["index"]
+		# empty files can not be mapped
+		self.ids = numpy.memmap(fids, dtype=get_id_dtype(self.nword), mode="r") if _info["nent"] > 0 else None
+		self.probs = numpy.memmap(fprobs, dtype=prob_dtype, mode="r") if _info["nent"] > 0 else None
+		self.cnt = numpy.memmap(fcnt, dtype=numpy.uint8, mode="r") if _info["ntok"] > 0 else None
+
+	def __contains__(self, bid):
+
+		return bid in self.index
+
+	# returns: teacher token ids (ntok, topk) and their probabilities (renormalized to sum to 1, 0 for unused entries) of non-pad target tokens of the batch
+
+	def get(self, bid, device=None):
+
+		_tok_off, _ntok, _ent_off, _nent = self.index[bid]
+		_cnt = self.cnt[_tok_off:_tok_off + _ntok]
+		_keep = numpy.arange(self.topk, dtype=numpy.uint8)[numpy.newaxis, :] < _cnt[:, numpy.newaxis]
+		ids = numpy.zeros((_ntok, self.topk,), dtype=numpy.int64)
+		probs = numpy.zeros((_ntok, self.topk,), dtype=numpy.float32)
+		ids[_keep] = self.ids[_ent_off:_ent_off + _nent]
+		probs[_keep] = self.probs[_ent_off:_ent_off + _nent]
+		ids, probs = torch.from_numpy(ids), torch.from_numpy(probs)
+		probs = probs / probs.sum(-1, keepdim=True)
+		if device:
+			ids, probs = ids.to(device, non_blocking=True), probs.to(device, non_blocking=True)
+
+		return ids, probs
@@ -0,0 +1,113 @@
+#encoding: utf-8
+
+# flat weight files for serving: parameters of a model are saved into one raw binary file (each tensor aligned to align_bytes) with their dtypes, shapes and offsets in an index file (fname + ".json"). Loading maps the file copy-on-write (numpy.memmap with mode "c") and binds parameters to views of the mapping, so that all processes loading the same file (e.g., uWSGI workers) share the physical pages of weights through the page cache rather than holding their own copies, and in-place writes to parameters (e.g., fix_load) only copy the touched pages privately without ever reaching the file.
+
+import torch
+import numpy
+
+from json import dump, load
+from os import replace, getpid
+from os.path import exists as p_check, getmtime
+
+from utils.base import load_model_attrs
+from utils.h5serial import h5load, h5load_attrs
+
+align_bytes = 64
+
+def get_index_fname(fname):
+
+	return fname + ".json"
+
+# attributes of the h5 model file (e.g., metadata of pruned models)
+
+def get_attrs_fname(fname):
+
+	return fname + ".attrs.json"
+
+def load_attrs(fname):
+
+	_attrs_f = get_attrs_fname(fname)
+	if p_check(_attrs_f):
+		with open(_attrs_f) as f:
+			return load(f)
+
+	return {}
+
+def save_mapped(plist, fname):
+
+	_index, _off = [], 0
+	with open(fname, "wb") as f:
+		for para in plist:
+			_t = para.data.detach().cpu().contiguous()
+			_dtype = str(_t.dtype)[6:]
+			if _t.dtype == torch.bfloat16:
+				_t = _t.view(torch.int16)
+			_pad = (-_off) % align_bytes
+			if _pad > 0:
+				f.write(bytes(_pad))
+				_off += _pad
+			_b = _t.numpy().tobytes()
+			f.write(_b)
+			_index.append({"dtype": _dtype, "shape": list(_t.size()), "offset": _off})
+			_off += len(_b)
+	with open(get_index_fname(fname), "w") as f:
+		dump(_index, f)
+
+def load_mapped(fname):
+
+	with open(get_index_fname(fname)) as f:
+		_index = load(f)
+	_map = numpy.asarray(numpy.memmap(fname, dtype=numpy.uint8, mode="c"))
+	rs = []
+	for _p in _index:
+		_bf16 = _p["dtype"] == "bfloat16"
+		_dtype = numpy.dtype("int16" if _bf16 else _p["dtype"])
+		_shape = tuple(_p["shape"])
+		_numel = 1
+		for _s in _shape:
+			_numel *= _s
+		_t = torch.from_numpy(_map[_p["offset"]:_p["offset"] + _numel * _dtype.itemsize].view(_dtype).reshape(_shape))
+		rs.append(_t.view(torch.bfloat16) if _bf16 else _t)
+
+	return rs
+
+def load_model_mapped(modf, base_model):
+
+	base_model = load_model_attrs(load_attrs(modf), base_model)
+	_plist, _mlist = list(base_model.parameters()), load_mapped(modf)
+	if len(_plist) != len(_mlist):
+		raise RuntimeError("%s has %d parameters while the model has %d" % (modf, len(_mlist), len(_plist),))
+	for i, (para, mp,) in enumerate(zip(_plist, _mlist)):
+		if para.size() != mp.size():
+			raise RuntimeError("shape of parameter %d in %s %s does not match %s of the model" % (i, modf, tuple(mp.size()), tuple(para.size()),))
+	for para, mp in zip(_plist, _mlist):
+		para.data = mp
+
+	return base_model
+
+# convert an h5 model file (saved by utils.base.save_model) into a flat weight file, files are written under temporary names and then renamed, so that concurrent processes never read partial files.
+
+def h5_to_mapped(modf, fname):
+
+	_tmp = "%s.%d.tmp" % (fname, getpid(),)
+	save_mapped(h5load(modf), _tmp)
+	with open(get_attrs_fname(_tmp), "w") as f:
+		dump(h5load_attrs(modf), f)
+	replace(get_attrs_fname(_tmp), get_attrs_fname(fname))
+	replace(get_index_fname(_tmp), get_index_fname(fname))
+	replace(_tmp, fname)
+
+def get_mapped_fname(modf):
+
+	return (modf[:-3] if modf.endswith(".h5") else modf) + ".bin"
+
+# returns: the flat weight file of the h5 model file modf, converted if it does not exist yet or is older than modf (e.g., modf is retrained, averaged or pruned in place)
+
+def ensure_mapped(modf):
+
+	rs = get_mapped_fname(modf)
+	_mtime = getmtime(modf)
+	if not all(p_check(_f) and (getmtime(_f) >= _mtime) for _f in (rs, get_index_fname(rs), get_attrs_fname(rs),)):
+		h5_to_mapped(modf, rs)
+
+	return rs
@@ -0,0 +1,84 @@
+#encoding: utf-8
+
+# structured pruning of attention heads (modules.base.SelfAttn/CrossAttn/MultiHeadAttn) and hidden units of feed-forward networks (modules.base.PositionwiseFF). The importance of a head (unit) is the first-order estimate of the change of the loss when it is removed (Are Sixteen Heads Really Better than One?, https://arxiv.org/abs/1905.10650): |sum of (output of the head (unit) * its gradient)| over tokens of each sentence, accumulated over sentences of the development set. The least important heads (units) of each module are removed by slicing weights of its Linear modules (utils.base.prune_model), and numbers of kept heads (units) are saved with the model, with which utils.base.load_model_cpu restores the shapes of pruned models.
+
+import torch
+
+from modules.base import SelfAttn, CrossAttn, MultiHeadAttn, PositionwiseFF
+from utils.base import prune_model
+
+from cnfg.hyp import prune_head_ratio, prune_ffn_ratio
+
+# returns: {module name: (the Linear module whose inputs are scored, number of features of each head (1 for units), prune heads or not)}
+
+def get_prune_groups(model):
+
+	rs = {}
+	for _name, _module in model.named_modules():
+		if isinstance(_module, (SelfAttn, CrossAttn, MultiHeadAttn,)):
+			rs[_name] = (_module.outer, _module.attn_dim, True,)
+		elif isinstance(_module, PositionwiseFF):
+			rs[_name] = (_module.net[-2 if len(_module.net) > 3 else -1], 1, False,)
+
+	return rs
+
+class ImportanceScorer:
+
+	# importance scores are accumulated during backward passes of the model (in evaluation mode) on the development set, until close is called
+
+	def __init__(self, model):
+
+		self.model = model
+		self.groups = get_prune_groups(model)
+		self.scores = {}
+		self.handles = [_lin.register_forward_pre_hook(self.get_hook(_name, _gsize)) for _name, (_lin, _gsize, _,) in self.groups.items()]
+
+	def get_hook(self, name, gsize):
+
+		def _hook(module, inputs):
+
+			_x = inputs[0]
+			if _x.requires_grad:
+				_x.register_hook(lambda grad: self.accumulate(name, _x, grad, gsize))
+
+		return _hook
+
+	# x, grad: (bsize, seql, nhead * gsize) or (ntok, nhead * gsize) for packed sequences
+
+	def accumulate(self, name, x, grad, gsize):
+
+		_isize = x.size(-1)
+		_s = (x.detach() * grad).view(x.size(0), -1, _isize // gsize, gsize).sum((1, 3,)).abs().sum(0).float()
+		self.scores[name] = (self.scores[name] + _s) if name in self.scores else _s
+
+	def close(self):
+
+		for _h in self.handles:
+			_h.remove()
+		self.handles = []
+
+	def __enter__(self):
+
+		return self
+
+	def __exit__(self, *inputs, **kwargs):
+
+		self.close()
+
+	# returns: {module name: kept heads/units (sorted list of indexes)}, the ratio of the least important heads/units of each module is removed
+
+	def get_spec(self, head_ratio=prune_head_ratio, ffn_ratio=prune_ffn_ratio):
+
+		rs = {}
+		for _name, _s in self.scores.items():
+			_n = _s.numel()
+			_nkeep = max(1, _n - int(_n * (head_ratio if self.groups[_name][-1] else ffn_ratio)))
+			rs[_name] = _s.topk(_nkeep).indices.sort().values.tolist()
+
+		return rs
+
+	def prune(self, head_ratio=prune_head_ratio, ffn_ratio=prune_ffn_ratio):
+
+		self.close()
+
+		return prune_model(self.model, self.get_spec(head_ratio, ffn_ratio))
@@ -0,0 +1,99 @@
+#encoding: utf-8
+
+# vocabulary shortlist for decoding (lexical candidate selection): decoders only score the union of the candidate targets of source tokens in the batch (built by tools/shortlist.py) and the most frequent target words, rather than the whole target vocabulary, so that the classifier and the softmax of every decoding step shrink to the size of the shortlist. Word embeddings and the classifier of decoders are replaced by their rows of the shortlist during decoding, translations are generated with positions in the shortlist, which are mapped back to vocabulary indexes afterwards.
+
+import torch
+from torch import nn
+from torch.nn import functional as nnFunc
+
+from threading import Lock
+from contextlib import contextmanager
+
+from utils.h5serial import h5load
+from utils.fmt.base import init_normal_token_id
+
+class SlicedEmbedding(nn.Module):
+
+	def __init__(self, weight, padding_idx=None):
+
+		super(SlicedEmbedding, self).__init__()
+
+		self.weight, self.padding_idx = weight, padding_idx
+
+	def forward(self, inputu):
+
+		return nnFunc.embedding(inputu, self.weight, self.padding_idx)
+
+class SlicedLinear(nn.Module):
+
+	def __init__(self, weight, bias=None):
+
+		super(SlicedLinear, self).__init__()
+
+		self.weight, self.bias = weight, bias
+
+	def forward(self, inputu):
+
+		return nnFunc.linear(inputu, self.weight, self.bias)
+
+# returns: base decoders (with wemb and classifier) of NMT or ensemble models
+
+def get_decoders(model):
+
+	_dec = model.dec
+
+	return [_dec] if hasattr(_dec, "classifier") else list(_dec.nets)
+
+# decoders are modified in place during decoding, other threads decoding with the same model (e.g., threads of uWSGI workers) wait for the shortlist decoding to finish
+
+shortlist_lock = Lock()
+
+@contextmanager
+def restrict_decoders(model, ids):
+
+	with shortlist_lock:
+		_decs = get_decoders(model)
+		_backup = [(_dec.wemb, _dec.classifier,) for _dec in _decs]
+		try:
+			for _dec, (_wemb, _classifier,) in zip(_decs, _backup):
+				_dec.wemb = SlicedEmbedding(_wemb.weight.index_select(0, ids), _wemb.padding_idx)
+				_dec.classifier = SlicedLinear(_classifier.weight.index_select(0, ids), None if _classifier.bias is None else _classifier.bias.index_select(0, ids))
+			yield _decs
+		finally:
+			for _dec, (_wemb, _classifier,) in zip(_decs, _backup):
+				_dec.wemb, _dec.classifier = _wemb, _classifier
+
+class Shortlist:
+
+	# cands: candidate target indexes of each source index (nwordi, ncand), padded with 0
+	# nwordt: size of the target vocabulary
+	# topk: number of most frequent target words always in the shortlist, vocabularies are sorted by frequency
+	# special tokens (<pad>, <sos>, <eos>, <unk>) are always kept, and keep their indexes in the shortlist as the shortlist is sorted.
+
+	def __init__(self, cands, nwordt, topk=1024):
+
+		self.cands = cands
+		self.base = torch.arange(min(nwordt, init_normal_token_id + topk), dtype=cands.dtype)
+
+	# returns: sorted target indexes of the shortlist of the source batch inpute (bsize, seql)
+
+	def __call__(self, inpute):
+
+		_dev = inpute.device
+		if self.cands.device != _dev:
+			self.cands, self.base = self.cands.to(_dev), self.base.to(_dev)
+
+		return torch.cat((self.base, self.cands.index_select(0, inpute.unique()).view(-1),), 0).unique(sorted=True)
+
+	def decode(self, model, inpute, *args, **kwargs):
+
+		ids = self(inpute)
+		with restrict_decoders(model, ids):
+			rs = model.decode(inpute, *args, **kwargs)
+
+		# beam search returns non-contiguous results
+		return ids.index_select(0, rs.reshape(-1)).view(rs.size())
+
+def load_shortlist(fname, nwordt, topk=1024):
+
+	return Shortlist(h5load(fname, restore_list=False)["cands"].long(), nwordt, topk)